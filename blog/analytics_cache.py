@@ -0,0 +1,200 @@
+"""
+Caché compartida para los resultados de análisis de la red
+(influencers y sugerencias para seguir)
+
+Son agregaciones sobre todo el grafo que las vistas y los widgets de la
+barra lateral piden en cada página. Se guardan en la caché de Django
+(alias ANALYTICS_CACHE_ALIAS) con un TTL por tipo de resultado:
+
+- Las claves llevan versión: SCHEMA_VERSION (formato de los valores), una
+  generación global y, en las sugerencias, una generación por usuario.
+  Subir una generación descarta de golpe todas las claves que dependían de ella.
+- Cada valor guarda su propio vencimiento y permanece en la caché un poco
+  más (STALE_GRACE): al vencer, un solo proceso lo recalcula mientras el
+  resto sigue sirviendo el valor anterior.
+- El recálculo es single-flight: el candado es una clave creada con
+  cache.add, que es atómica, así que ante un fallo de caché bajo carga solo
+  se lanza una agregación en Cypher; los demás esperan su resultado.
+
+Las invalidaciones y el candado solo alcanzan a otros procesos si el backend
+es compartido (Redis o Memcached, ver CACHES en settings). Con LocMemCache,
+el valor por defecto para desarrollo, cada proceso tiene su propia caché: lo
+que invalida un comando solo vale para ese comando y los workers web siguen
+sirviendo sus valores hasta que vence el TTL. `manage.py check --deploy`
+avisa de esa configuración.
+"""
+import asyncio
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+
+# Subirlo cuando cambie la forma de los valores guardados
+SCHEMA_VERSION = 2
+
+# Segundos que un valor vencido se sigue sirviendo mientras otro lo recalcula
+STALE_GRACE = 60
+# Duración máxima del candado de recálculo
+LOCK_TIMEOUT = 30
+# Intervalo de espera de quien no obtuvo el candado en un fallo en frío
+POLL_INTERVAL = 0.05
+
+DEFAULT_TTLS = {
+    'influencers': 300,
+    'suggestions': 600,
+}
+
+# Backends cuya caché es de cada proceso
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _cache():
+    return caches[getattr(settings, 'ANALYTICS_CACHE_ALIAS', 'default')]
+
+
+def is_process_local():
+    """True si la caché de análisis no es compartida entre procesos"""
+    alias = getattr(settings, 'ANALYTICS_CACHE_ALIAS', 'default')
+    return settings.CACHES[alias]['BACKEND'] in PROCESS_LOCAL_BACKENDS
+
+
+def check_shared_backend(app_configs=None, **kwargs):
+    """Check de despliegue: con varios workers la caché de análisis debe ser compartida"""
+    if not is_process_local():
+        return []
+    return [checks.Warning(
+        'La caché de análisis es local a cada proceso',
+        hint='Configura ANALYTICS_CACHE_BACKEND con Redis o Memcached para que las '
+             'invalidaciones de los comandos lleguen a los workers web',
+        id='blog.W001',
+    )]
+
+
+def ttl_for(name):
+    return getattr(settings, 'ANALYTICS_CACHE_TTLS', {}).get(name, DEFAULT_TTLS.get(name, 300))
+
+
+def _generation_key(user_id=None):
+    if user_id is None:
+        return 'analytics:gen'
+    return f'analytics:gen:user:{user_id}'
+
+
+def _generation_keys(user_id=None):
+    keys = [_generation_key()]
+    if user_id is not None:
+        keys.append(_generation_key(user_id))
+    return keys
+
+
+def _versioned_key(name, parts, user_id, generation_keys, generations):
+    versions = ':'.join(str(generations.get(key, 0)) for key in generation_keys)
+    if user_id is not None:
+        parts = (f'user{user_id}',) + tuple(parts)
+    suffix = ':'.join(str(part) for part in parts)
+    return f'analytics:v{SCHEMA_VERSION}:{versions}:{name}:{suffix}'
+
+
+def _bump(key):
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        # La clave no existía (o expiró): cualquier valor nuevo invalida las anteriores
+        cache.set(key, int(time.time() * 1000), None)
+
+
+def invalidate_all():
+    """
+    Descarta todos los resultados guardados (por ejemplo, tras una migración)
+    Llega a los workers web solo si el backend es compartido
+    """
+    _bump(_generation_key())
+
+
+def invalidate_user(user_id):
+    """Descarta los resultados personales de un usuario (sus sugerencias)"""
+    _bump(_generation_key(user_id))
+
+
+def make_key(name, *parts, user_id=None):
+    """Clave versionada de un resultado"""
+    generation_keys = _generation_keys(user_id)
+    return _versioned_key(name, parts, user_id, generation_keys, _cache().get_many(generation_keys))
+
+
+def _store(cache, key, ttl, value):
+    cache.set(key, (time.time() + ttl, value), ttl + STALE_GRACE)
+    return value
+
+
+def get_or_compute(name, compute, *parts, user_id=None, ttl=None):
+    """
+    Retorna el resultado guardado para (name, parts) o lo calcula con `compute()`
+    Solo un proceso calcula a la vez cada clave
+    """
+    cache = _cache()
+    ttl = ttl_for(name) if ttl is None else ttl
+    key = make_key(name, *parts, user_id=user_id)
+    entry = cache.get(key)
+    if entry is not None and entry[0] > time.time():
+        return entry[1]
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            return _store(cache, key, ttl, compute())
+        finally:
+            cache.delete(lock_key)
+
+    # Otro proceso está recalculando
+    if entry is not None:
+        return entry[1]
+    deadline = time.time() + LOCK_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[1]
+        if cache.get(lock_key) is None:
+            break
+    # El otro proceso falló o tardó demasiado: se calcula aquí
+    return _store(cache, key, ttl, compute())
+
+
+async def aget_or_compute(name, compute, *parts, user_id=None, ttl=None):
+    """Versión asíncrona de get_or_compute; `compute` es una función async"""
+    cache = _cache()
+    ttl = ttl_for(name) if ttl is None else ttl
+    generation_keys = _generation_keys(user_id)
+    key = _versioned_key(name, parts, user_id, generation_keys, await cache.aget_many(generation_keys))
+    entry = await cache.aget(key)
+    if entry is not None and entry[0] > time.time():
+        return entry[1]
+
+    lock_key = f'{key}:lock'
+    if await cache.aadd(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            value = await compute()
+            await cache.aset(key, (time.time() + ttl, value), ttl + STALE_GRACE)
+            return value
+        finally:
+            await cache.adelete(lock_key)
+
+    if entry is not None:
+        return entry[1]
+    deadline = time.time() + LOCK_TIMEOUT
+    while time.time() < deadline:
+        await asyncio.sleep(POLL_INTERVAL)
+        entry = await cache.aget(key)
+        if entry is not None:
+            return entry[1]
+        if await cache.aget(lock_key) is None:
+            break
+    value = await compute()
+    await cache.aset(key, (time.time() + ttl, value), ttl + STALE_GRACE)
+    return value
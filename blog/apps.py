@@ -1,5 +1,17 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class BlogConfig(AppConfig):
     name = 'blog'
+
+    def ready(self):
+        from django.core import checks
+        import blog.signals
+        from . import analytics_cache
+        from .neo4j_connection import init_neo4j_connection, start_health_probe
+        checks.register(analytics_cache.check_shared_backend, checks.Tags.caches, deploy=True)
+        start_health_probe()
+        # Sin el flag la conexión sigue siendo diferida hasta la primera consulta
+        if getattr(settings, 'NEO4J_ENSURE_SCHEMA', False):
+            init_neo4j_connection()
@@ -0,0 +1,359 @@
+"""
+Estadísticas aproximadas de uso y participación, calculadas con sketches
+
+Cada proceso acumula en memoria los eventos de sus vistas (posts, likes y
+comentarios) y cada SKETCH_FLUSH_INTERVAL segundos (y al terminar) los
+escribe en un archivo nuevo dentro de SKETCH_DIR y empieza de cero: cada
+archivo es un delta que ya no cambia. Para responder se combinan todos los
+archivos, así que no hace falta recontar nada en Neo4j. Cuando hay más de
+COMPACT_THRESHOLD archivos se compactan en uno solo:
+
+- Frecuencia de cada hashtag y los más usados (Count-Min Sketch + heap)
+- Usuarios distintos que dieron like a cada post (HyperLogLog)
+- Usuarios activos (publicaron, comentaron o dieron like) por día (HyperLogLog)
+
+Los likes quitados no restan: un HyperLogLog no admite borrados, así que
+cuenta los usuarios que alguna vez dieron like. Solo se conservan los likers
+de los MAX_LIKER_POSTS posts con likes más recientes.
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .sketches import CountMinSketch, HeavyHitters, HyperLogLog
+
+# Error de las frecuencias de hashtags: como mucho TAG_EPSILON * total con probabilidad 1 - TAG_DELTA
+TAG_EPSILON = 0.001
+TAG_DELTA = 0.01
+TOP_TAGS = 100
+# Precisión de los HyperLogLog: error estándar de ~3.3% por post y ~0.8% por día
+LIKERS_PRECISION = 10
+ACTIVE_USERS_PRECISION = 14
+# Días de usuarios activos que se conservan
+RETENTION_DAYS = 30
+# Posts con likers que se conservan (los de likes más recientes)
+MAX_LIKER_POSTS = 20000
+# Segundos durante los que se reutiliza la combinación de todos los archivos
+MERGE_INTERVAL = 5
+# Archivos a partir de los cuales se compactan en uno
+COMPACT_THRESHOLD = 20
+# Segundos tras los que el candado de una compactación interrumpida se considera abandonado
+COMPACT_LOCK_TIMEOUT = 60
+
+
+class EngagementSketches:
+    """Los sketches de un proceso (o la combinación de varios)"""
+
+    def __init__(self):
+        self.tags = HeavyHitters(TOP_TAGS, CountMinSketch.from_error(TAG_EPSILON, TAG_DELTA))
+        self.likers = {}  # {post_id: HyperLogLog}, del like más antiguo al más reciente
+        self.active_users = {}  # {'YYYY-MM-DD': HyperLogLog}
+
+    def _active(self, user_id, day):
+        key = day.isoformat()
+        if key not in self.active_users:
+            self.active_users[key] = HyperLogLog(ACTIVE_USERS_PRECISION)
+        self.active_users[key].add(user_id)
+
+    def record_post(self, user_id, tags, day):
+        for tag in tags:
+            self.tags.add(tag)
+        self._active(user_id, day)
+
+    def _liked(self, post_id, hll=None):
+        # Mueve el post al final (el más reciente) y descarta los más antiguos sobre MAX_LIKER_POSTS
+        current = self.likers.pop(post_id, None)
+        if current is None:
+            current = HyperLogLog(LIKERS_PRECISION) if hll is None else HyperLogLog.from_dict(hll.to_dict())
+        elif hll is not None:
+            current.merge(hll)
+        self.likers[post_id] = current
+        while len(self.likers) > MAX_LIKER_POSTS:
+            del self.likers[next(iter(self.likers))]
+        return current
+
+    def record_liker(self, user_id, post_id):
+        self._liked(post_id).add(user_id)
+
+    def record_like(self, user_id, post_id, day):
+        self.record_liker(user_id, post_id)
+        self._active(user_id, day)
+
+    def record_comment(self, user_id, day):
+        self._active(user_id, day)
+
+    def prune(self, today):
+        oldest = (today - timedelta(days=RETENTION_DAYS)).isoformat()
+        for key in [key for key in self.active_users if key < oldest]:
+            del self.active_users[key]
+
+    def merge(self, other):
+        """Suma `other`, que se considera más reciente (sus posts pasan al final de likers)"""
+        self.tags.merge(other.tags)
+        for post_id, hll in other.likers.items():
+            self._liked(post_id, hll)
+        for key, hll in other.active_users.items():
+            if key in self.active_users:
+                self.active_users[key].merge(hll)
+            else:
+                self.active_users[key] = HyperLogLog.from_dict(hll.to_dict())
+        return self
+
+    def to_dict(self):
+        return {
+            'tags': self.tags.to_dict(),
+            'likers': {str(post_id): hll.to_dict() for post_id, hll in self.likers.items()},
+            'active_users': {key: hll.to_dict() for key, hll in self.active_users.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketches = cls()
+        sketches.tags = HeavyHitters.from_dict(data['tags'])
+        sketches.likers = {int(post_id): HyperLogLog.from_dict(hll) for post_id, hll in data['likers'].items()}
+        sketches.active_users = {key: HyperLogLog.from_dict(hll) for key, hll in data['active_users'].items()}
+        return sketches
+
+
+_lock = threading.Lock()
+_local = EngagementSketches()
+_owner = {'pid': os.getpid(), 'flushed_at': time.time(), 'dirty': False}
+_merged = {'sketches': None, 'at': 0.0, 'shards': None}
+# Cada archivo ya no cambia tras escribirse: se parsea una vez y se reutiliza mientras no cambie su mtime
+_parsed = {}  # {path: (mtime, datos)}
+
+
+def _sketch_dir():
+    return getattr(settings, 'SKETCH_DIR', os.path.join(settings.BASE_DIR, 'sketches'))
+
+
+def _shard_paths():
+    return glob.glob(os.path.join(_sketch_dir(), 'engagement-*.json'))
+
+
+def _write_shard(data, name):
+    """Escribe un archivo nuevo de forma atómica (un lector nunca ve uno a medias)"""
+    os.makedirs(_sketch_dir(), exist_ok=True)
+    path = os.path.join(_sketch_dir(), f'engagement-{name}.json')
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _check_fork():
+    # Tras un fork el hijo empieza vacío: lo pendiente del padre lo escribe el padre
+    global _local
+    if _owner['pid'] != os.getpid():
+        _local = EngagementSketches()
+        _owner.update(pid=os.getpid(), flushed_at=time.time(), dirty=False)
+
+
+def _record(method, *args):
+    today = timezone.localdate()
+    with _lock:
+        _check_fork()
+        getattr(_local, method)(*args, today)
+        _owner['dirty'] = True
+        due = time.time() - _owner['flushed_at'] >= getattr(settings, 'SKETCH_FLUSH_INTERVAL', 10)
+    if due:
+        flush()
+
+
+def record_post(user_id, tags):
+    _record('record_post', user_id, list(tags))
+
+
+def record_like(user_id, post_id):
+    _record('record_like', user_id, post_id)
+
+
+def record_comment(user_id):
+    _record('record_comment', user_id)
+
+
+def flush():
+    """
+    Escribe lo acumulado por este proceso desde el último flush en un archivo
+    nuevo y vuelve a empezar de cero. Los procesos sin eventos no crean archivo
+    """
+    global _local
+    with _lock:
+        _check_fork()
+        if not _owner['dirty']:
+            return
+        _local.prune(timezone.localdate())
+        data = _local.to_dict()
+        _local = EngagementSketches()
+        _owner.update(flushed_at=time.time(), dirty=False)
+    _write_shard(data, uuid.uuid4().hex)
+
+
+# Lo pendiente se escribe también al terminar el proceso (reinicios, despliegues)
+atexit.register(flush)
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
+
+
+def _read_shards(paths):
+    """
+    {nombre: datos} de los archivos vigentes de `paths`, del más antiguo al más reciente
+    Se omiten los que una compactación ya incluyó aunque aún no los haya borrado
+    """
+    shards = {}
+    for path in sorted(paths, key=_mtime):
+        mtime = _mtime(path)
+        cached = _parsed.get(path)
+        if cached is not None and cached[0] == mtime:
+            shards[os.path.basename(path)] = cached[1]
+            continue
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            # Una compactación lo borró después de listarlo: ya está en el archivo compactado
+            _parsed.pop(path, None)
+            continue
+        except (OSError, ValueError) as e:
+            print(f"Error leyendo {path}: {e}")
+            continue
+        _parsed[path] = (mtime, data)
+        shards[os.path.basename(path)] = data
+    compacted = {source for data in shards.values() for source in data.get('sources', [])}
+    return {name: data for name, data in shards.items() if name not in compacted}
+
+
+def load_shards(paths=None):
+    """Combina los archivos de todos los procesos (o los de `paths`)"""
+    merged = EngagementSketches()
+    for name, data in _read_shards(_shard_paths() if paths is None else paths).items():
+        try:
+            merged.merge(EngagementSketches.from_dict(data))
+        except (KeyError, ValueError) as e:
+            print(f"Error combinando {name}: {e}")
+    return merged
+
+
+def _acquire_compact_lock():
+    path = os.path.join(_sketch_dir(), '.compact.lock')
+    try:
+        if time.time() - os.path.getmtime(path) > COMPACT_LOCK_TIMEOUT:
+            os.remove(path)
+    except OSError:
+        pass
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return path
+    except FileExistsError:
+        return None
+
+
+def compact():
+    """
+    Combina todos los archivos en uno solo y borra los combinados
+    Solo compacta un proceso a la vez; retorna cuántos archivos reemplazó
+    """
+    os.makedirs(_sketch_dir(), exist_ok=True)
+    lock_path = _acquire_compact_lock()
+    if lock_path is None:
+        return 0
+    try:
+        # Solo los archivos listados aquí: los que se escriban mientras tanto quedan para la próxima
+        paths = _shard_paths()
+        if len(paths) < 2:
+            return 0
+        sources = sorted(os.path.basename(path) for path in paths)
+        merged = load_shards(paths)
+        merged.prune(timezone.localdate())
+        # `sources` permite a los lectores omitir los archivos combinados hasta que se borren
+        _write_shard(dict(merged.to_dict(), sources=sources), f'compacted-{uuid.uuid4().hex}')
+        for name in sources:
+            try:
+                os.remove(os.path.join(_sketch_dir(), name))
+            except FileNotFoundError:
+                pass
+        return len(sources)
+    finally:
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+
+
+def merged_sketches():
+    """
+    Sketches de todos los procesos; se revisan como mucho cada MERGE_INTERVAL
+    segundos y solo se recombinan si algún archivo apareció, cambió o desapareció
+    """
+    if _merged['sketches'] is None or time.time() - _merged['at'] >= MERGE_INTERVAL:
+        flush()
+        paths = _shard_paths()
+        if len(paths) > COMPACT_THRESHOLD and compact():
+            paths = _shard_paths()
+        shards = {path: _mtime(path) for path in paths}
+        for path in set(_parsed) - set(shards):
+            _parsed.pop(path, None)
+        if _merged['sketches'] is None or shards != _merged['shards']:
+            _merged.update(sketches=load_shards(paths), shards=shards)
+        _merged['at'] = time.time()
+    return _merged['sketches']
+
+
+def reset_shards():
+    """Borra los archivos de todos los procesos y los sketches de este"""
+    global _local
+    with _lock:
+        _local = EngagementSketches()
+        _owner['dirty'] = False
+        _merged.update(sketches=None, at=0.0, shards=None)
+        _parsed.clear()
+    for path in _shard_paths():
+        os.remove(path)
+
+
+def save_shard(sketches, name):
+    """Guarda un conjunto de sketches como un archivo más (por ejemplo, uno reconstruido desde SQLite)"""
+    _write_shard(sketches.to_dict(), name)
+
+
+# Consultas
+
+def top_tags(limit=10):
+    """[{name, count, error}]: los hashtags más usados; count nunca es menor que el real"""
+    tags = merged_sketches().tags
+    return [{'name': name, 'count': count, 'error': round(tags.sketch.error)} for name, count in tags.top(limit)]
+
+
+def tag_count(tag):
+    tags = merged_sketches().tags
+    return {'count': tags.estimate(tag.lower()), 'error': round(tags.sketch.error)}
+
+
+def distinct_likers(post_id):
+    hll = merged_sketches().likers.get(post_id)
+    if hll is None:
+        return {'count': 0, 'relative_error': 0.0}
+    return {'count': hll.count(), 'relative_error': round(hll.standard_error, 4)}
+
+
+def active_users(day=None):
+    day = day or timezone.localdate()
+    key = day.isoformat() if isinstance(day, date) else str(day)
+    hll = merged_sketches().active_users.get(key)
+    if hll is None:
+        return {'count': 0, 'relative_error': 0.0}
+    return {'count': hll.count(), 'relative_error': round(hll.standard_error, 4)}
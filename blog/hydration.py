@@ -0,0 +1,29 @@
+"""
+Conversión de nodos de Neo4j a usuarios de Django
+Resuelve listas de user_id con una sola consulta en lugar de una por nodo
+"""
+from operator import attrgetter
+
+from django.contrib.auth.models import User
+
+
+def users_by_id(user_ids):
+    """
+    Retorna un diccionario {user_id: User} con el perfil ya cargado
+    Los ids que no existen en Django simplemente no aparecen
+    """
+    ids = list(dict.fromkeys(user_ids))
+    if not ids:
+        return {}
+    return User.objects.select_related('profile').in_bulk(ids)
+
+
+def hydrate_users(items, key=attrgetter('user_id')):
+    """
+    Retorna [(item, User)] en el mismo orden que `items` (el orden de Neo4j),
+    descartando los que no existen en Django
+    `key` obtiene el user_id de cada item (por defecto, el atributo de un nodo)
+    """
+    items = list(items)
+    users = users_by_id(key(item) for item in items)
+    return [(item, users[key(item)]) for item in items if key(item) in users]
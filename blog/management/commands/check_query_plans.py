@@ -0,0 +1,87 @@
+"""
+Comando Django para detectar regresiones en los planes de las consultas Cypher
+
+Uso habitual, sobre una base de datos de Neo4j vacía (por ejemplo en CI):
+    python manage.py check_query_plans --seed --profile
+y para regenerar la línea base versionada tras un cambio intencional:
+    python manage.py check_query_plans --seed --profile --update-baseline
+"""
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from blog.neo4j_connection import init_neo4j_connection
+from blog.neo4j_schema import install_schema
+from blog.query_plans import compare, graph_is_empty, load_baseline, record_all, save_baseline, seed_graph
+
+
+class Command(BaseCommand):
+    help = 'Compara los planes de ejecución de las consultas de los servicios con la línea base'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--baseline',
+            default=os.path.join(settings.BASE_DIR, 'blog', 'query_plans_baseline.json'),
+            help='Archivo JSON con la línea base de planes',
+        )
+        parser.add_argument(
+            '--seed',
+            action='store_true',
+            help='Instala el esquema y crea el grafo de ejemplo antes de medir (requiere una base vacía)',
+        )
+        parser.add_argument(
+            '--profile',
+            action='store_true',
+            help='Ejecuta las consultas de lectura con PROFILE para registrar db hits y filas',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=1.5,
+            help='Factor de crecimiento de db hits permitido (default: 1.5)',
+        )
+        parser.add_argument(
+            '--update-baseline',
+            action='store_true',
+            help='Guarda los planes actuales como nueva línea base',
+        )
+
+    def handle(self, *args, **options):
+        if not init_neo4j_connection():
+            raise CommandError('Error al conectar con Neo4j')
+
+        if options['seed']:
+            # Sobre un grafo con otros datos los db hits no serían comparables (ni se deben mezclar)
+            if not graph_is_empty():
+                raise CommandError('--seed necesita una base de datos de Neo4j vacía')
+            self.stdout.write('Creando el grafo de ejemplo...')
+            install_schema()
+            for entity, count in seed_graph().items():
+                self.stdout.write(f'  ✓ {count} {entity}')
+
+        self.stdout.write('Obteniendo planes de ejecución...')
+        skipped = []
+        plans = record_all(profile=options['profile'], skipped=skipped)
+        for name, plan in plans.items():
+            detail = f'{plan["db_hits"]} db hits' if 'db_hits' in plan else f'~{plan["estimated_rows"]} filas'
+            self.stdout.write(f'  {name}: {detail}, {", ".join(plan["operators"])}')
+        for name in skipped:
+            self.stdout.write(self.style.WARNING(f'  ! {name}: consulta armada en tiempo de ejecución, sin medir'))
+
+        if options['update_baseline']:
+            save_baseline(options['baseline'], plans)
+            self.stdout.write(self.style.SUCCESS(f'✓ Línea base guardada en {options["baseline"]}'))
+            return
+
+        if not os.path.exists(options['baseline']):
+            raise CommandError('No existe la línea base; créala con --seed --profile --update-baseline')
+
+        regressions, notes = compare(load_baseline(options['baseline']), plans, options['tolerance'])
+        for note in notes:
+            self.stdout.write(self.style.WARNING(f'  ! {note}'))
+        for regression in regressions:
+            self.stdout.write(self.style.ERROR(f'  ✗ {regression}'))
+
+        if regressions:
+            raise CommandError(f'{len(regressions)} consultas empeoraron su plan')
+        self.stdout.write(self.style.SUCCESS(f'✓ {len(plans)} planes sin regresiones'))
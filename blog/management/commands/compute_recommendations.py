@@ -0,0 +1,96 @@
+"""
+Comando Django para precalcular las recomendaciones de seguimiento y amistad
+"""
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from blog import analytics_cache, recommendations
+from blog.models import UserRecommendations
+from blog.neo4j_connection import init_neo4j_connection
+from blog.neo4j_services import Neo4jBulkService
+
+
+class Command(BaseCommand):
+    help = 'Exporta el grafo de Neo4j a matrices CSR y precalcula las sugerencias de cada usuario'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Procesos de cálculo (default: número de núcleos)',
+        )
+        parser.add_argument(
+            '--partitions',
+            type=int,
+            default=None,
+            help='Rangos de user_id en que se reparte el cálculo (default: 4 por proceso)',
+        )
+        parser.add_argument(
+            '--top-n',
+            type=int,
+            default=recommendations.TOP_N,
+            help=f'Sugerencias guardadas por usuario (default: {recommendations.TOP_N})',
+        )
+        parser.add_argument(
+            '--max-degree',
+            type=int,
+            default=recommendations.MAX_DEGREE,
+            help=f'Intereses o amigos con más vecinos no se usan como intermediarios (default: {recommendations.MAX_DEGREE})',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=5000,
+            help='Usuarios exportados de Neo4j por consulta (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        if recommendations.np is None:
+            raise CommandError('Este comando necesita NumPy (pip install numpy)')
+        if not init_neo4j_connection():
+            raise CommandError('Error al conectar con Neo4j')
+
+        started = time.time()
+        self.stdout.write('Exportando relaciones de Neo4j...')
+        rows = []
+        after_id = -1
+        while True:
+            page = Neo4jBulkService.get_adjacency_page(after_id, options['page_size'])
+            if not page:
+                break
+            rows.extend(page)
+            after_id = page[-1][0]
+        graph = recommendations.SocialGraph.from_adjacency(rows)
+        del rows
+        self.stdout.write(
+            f'  ✓ {len(graph.user_ids)} usuarios, {len(graph.following.indices)} FOLLOWS, '
+            f'{len(graph.friends.indices)} FRIEND_OF, {len(graph.interests.indices)} INTERESTED_IN'
+        )
+
+        self.stdout.write(f'Calculando con {options["workers"]} procesos...')
+        computed_at = timezone.now()
+        saved = 0
+        for results in recommendations.compute_all(
+            graph,
+            workers=options['workers'],
+            partitions=options['partitions'],
+            top_n=options['top_n'],
+            max_degree=options['max_degree'],
+        ):
+            saved += recommendations.save_results(results, computed_at)
+            self.stdout.write(f'  ✓ {saved}/{len(graph.user_ids)} usuarios')
+
+        # Los usuarios que ya no están en el grafo conservarían sugerencias viejas
+        removed, _ = UserRecommendations.objects.filter(computed_at__lt=computed_at).delete()
+        analytics_cache.invalidate_all()
+        if analytics_cache.is_process_local():
+            self.stdout.write(self.style.WARNING(
+                'La caché de análisis es local a cada proceso: los workers web '
+                'seguirán sirviendo sus sugerencias hasta que venza el TTL'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Recomendaciones de {saved} usuarios en {time.time() - started:.1f}s ({removed} obsoletas eliminadas)'
+        ))
@@ -216,6 +216,9 @@ class Command(BaseCommand):
             
         self.stdout.write(f'Creados {num_comments} comentarios')
 
+        # Sincronizar contadores desnormalizados de likes y comentarios
+        Post.recount_counters()
+
         self.stdout.write(
             self.style.SUCCESS(
                 f'✅ Datos dummy creados exitosamente!\n'
@@ -0,0 +1,84 @@
+"""
+Comando Django que aplica en Neo4j los cambios registrados en el outbox
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from blog.models import OutboxEntry
+from blog.outbox import OutboxBusy, drain, retry_failed
+
+
+class Command(BaseCommand):
+    help = 'Aplica en Neo4j, en orden y por lotes, las entradas pendientes del outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Entradas procesadas por lote (default: 100)',
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=5,
+            help='Intentos antes de marcar una entrada como fallida (default: 5)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Sigue esperando nuevas entradas en lugar de terminar cuando la cola está vacía',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Segundos de espera entre revisiones de la cola en modo --loop (default: 1)',
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Devuelve a la cola las entradas marcadas como fallidas antes de empezar',
+        )
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            requeued = retry_failed()
+            self.stdout.write(f'{requeued} entradas fallidas devueltas a la cola')
+
+        backoff = options['interval']
+        total = 0
+        while True:
+            try:
+                applied, error = drain(options['batch_size'], options['max_attempts'])
+            except OutboxBusy as e:
+                # Otro drainer tiene la cola: este no aplica nada para no romper el orden
+                self.stdout.write(self.style.WARNING(f'  … {e}'))
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+                continue
+            total += applied
+            if applied:
+                self.stdout.write(f'  ✓ {applied} entradas aplicadas')
+
+            if error:
+                self.stdout.write(self.style.ERROR(f'  ✗ {error}'))
+                if not options['loop']:
+                    break
+                # Reintento con espera exponencial mientras Neo4j siga fallando
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+
+            backoff = options['interval']
+            if applied:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        failed = OutboxEntry.objects.filter(status=OutboxEntry.FAILED).count()
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} entradas fallidas en el outbox (usa --retry-failed)'))
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} entradas aplicadas en Neo4j'))
@@ -0,0 +1,51 @@
+"""
+Comando Django para instalar los índices y restricciones de Neo4j
+"""
+from django.core.management.base import BaseCommand, CommandError
+from blog.neo4j_connection import init_neo4j_connection
+from blog.neo4j_schema import (
+    install_schema, missing_schema, scanning_hot_queries,
+    UNIQUE_CONSTRAINTS, RANGE_INDEXES
+)
+
+
+class Command(BaseCommand):
+    help = 'Crea los índices y restricciones de Neo4j y verifica que las consultas frecuentes los usen'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--timeout',
+            type=int,
+            default=300,
+            help='Segundos de espera para que los índices queden ONLINE (default: 300)',
+        )
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Solo verifica el esquema, sin crear nada',
+        )
+
+    def handle(self, *args, **options):
+        if not init_neo4j_connection():
+            raise CommandError('Error al conectar con Neo4j')
+
+        if not options['check']:
+            self.stdout.write('Instalando restricciones e índices...')
+            install_schema(options['timeout'])
+            for label, prop in UNIQUE_CONSTRAINTS:
+                self.stdout.write(f'  ✓ UNIQUE {label}.{prop}')
+            for label, prop in RANGE_INDEXES:
+                self.stdout.write(f'  ✓ RANGE {label}.{prop}')
+
+        self.stdout.write('Verificando esquema...')
+        missing = missing_schema()
+        for item in missing:
+            self.stdout.write(self.style.ERROR(f'  ✗ Falta {item}'))
+
+        scans = scanning_hot_queries()
+        for name, operators in scans.items():
+            self.stdout.write(self.style.ERROR(f'  ✗ "{name}" usa {", ".join(operators)}'))
+
+        if missing or scans:
+            raise CommandError('El esquema de Neo4j no cubre las consultas frecuentes')
+        self.stdout.write(self.style.SUCCESS('✓ Esquema de Neo4j completo'))
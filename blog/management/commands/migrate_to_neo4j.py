@@ -1,14 +1,40 @@
 """
 Comando Django para migrar datos de SQLite a Neo4j
 """
-from django.core.management.base import BaseCommand
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
-from blog.models import Post, Comment, Type, PostTag
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils import timezone
+from blog.models import Post, Comment, Type, PostTag, SyncTombstone
 from blog.neo4j_services import (
     Neo4jUserService, Neo4jPostService, Neo4jCommentService, 
-    Neo4jInterestService
+    Neo4jInterestService, Neo4jBulkService, Neo4jTimelineService, _extract_hashtags
 )
-from blog.neo4j_connection import init_neo4j_connection
+from blog import analytics_cache
+from blog.neo4j_connection import cypher_query, init_neo4j_connection
+
+# Fases del modo --bulk: las entidades de una misma fase no dependen entre sí
+# y pueden migrarse en paralelo (comentarios y likes tocan los mismos posts:
+# los deadlocks que eso provoca se reintentan en Neo4jBulkService)
+BULK_PHASES = [['users'], ['posts'], ['comments', 'likes']]
+
+# Campo de fecha con el que --since detecta filas nuevas de cada entidad
+# (los likes no tienen fecha y se detectan solo por id)
+DELTA_DATE_FIELDS = {
+    'users': 'date_joined',
+    'posts': 'post_date',
+    'comments': 'comment_date',
+    'likes': None,
+}
 
 
 class Command(BaseCommand):
@@ -20,6 +46,63 @@ class Command(BaseCommand):
             action='store_true',
             help='Limpia la base de datos de Neo4j antes de migrar',
         )
+        parser.add_argument(
+            '--clear-batch-size',
+            type=int,
+            default=10000,
+            help='Relaciones o nodos eliminados por transacción al limpiar (default: 10000)',
+        )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Migra por lotes con una consulta UNWIND por lote',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Filas por lote en modo --bulk (default: 1000)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Entidades migradas en paralelo en modo --bulk (default: 2)',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continúa una migración --bulk interrumpida desde el último checkpoint',
+        )
+        parser.add_argument(
+            '--checkpoint-file',
+            default=os.path.join(settings.BASE_DIR, '.neo4j_migration_checkpoint.json'),
+            help='Archivo donde se guarda el último id migrado de cada entidad',
+        )
+        parser.add_argument(
+            '--since',
+            nargs='?',
+            const='',
+            default=None,
+            help='Sincroniza solo los cambios desde la fecha ISO indicada; '
+                 'sin valor usa la marca de agua de la última ejecución',
+        )
+        parser.add_argument(
+            '--all-likes',
+            action='store_true',
+            help='Con --since, reconcilia los likes de todos los posts y no solo de los que cambiaron',
+        )
+        parser.add_argument(
+            '--scan-deletions',
+            action='store_true',
+            help='Con --since, busca también los borrados comparando todos los ids de Neo4j con SQLite '
+                 '(recorre el grafo completo; útil para borrados anteriores al registro de borrados)',
+        )
+        parser.add_argument(
+            '--watermark-file',
+            default=os.path.join(settings.BASE_DIR, '.neo4j_sync_watermark.json'),
+            help='Archivo con la fecha y los últimos ids sincronizados',
+        )
 
     def handle(self, *args, **options):
         self.stdout.write('Iniciando migración de datos a Neo4j...')
@@ -32,7 +115,17 @@ class Command(BaseCommand):
         # Limpiar base de datos si se especificó
         if options['clear']:
             self.stdout.write('Limpiando base de datos de Neo4j...')
-            self.clear_neo4j()
+            self.clear_neo4j(options['clear_batch_size'])
+        
+        if options['since'] is not None and not options['clear']:
+            self.sync_delta(options)
+            self.invalidate_analytics()
+            return
+        
+        if options['bulk']:
+            self.migrate_bulk(options)
+            self.invalidate_analytics()
+            return
         
         # Migrar usuarios
         self.stdout.write('Migrando usuarios...')
@@ -50,16 +143,62 @@ class Command(BaseCommand):
         self.stdout.write('Migrando likes...')
         self.migrate_likes()
         
+        self.invalidate_analytics()
         self.stdout.write(self.style.SUCCESS('✓ Migración completada exitosamente'))
 
-    def clear_neo4j(self):
-        """Limpia todos los nodos y relaciones de Neo4j"""
-        from neomodel import db
+    def invalidate_analytics(self):
+        """Los resultados de análisis guardados ya no reflejan el grafo"""
+        analytics_cache.invalidate_all()
+        if analytics_cache.is_process_local():
+            self.stdout.write(self.style.WARNING(
+                'La caché de análisis es local a cada proceso: los workers web '
+                'seguirán sirviendo sus resultados hasta que venza el TTL'
+            ))
+
+    def clear_neo4j(self, batch_size=10000):
+        """
+        Limpia todos los nodos y relaciones de Neo4j
+        Borra por lotes (primero relaciones por tipo, luego nodos por etiqueta)
+        para que ninguna transacción tenga que cargar el grafo completo en memoria
+        Si un lote falla el comando termina con error: no se migra sobre un grafo a medio limpiar
+        """
         try:
-            db.cypher_query("MATCH (n) DETACH DELETE n")
-            self.stdout.write(self.style.SUCCESS('✓ Base de datos limpiada'))
+            # Tipos y etiquetas se leen del primario, igual que los borrados (modo escritura)
+            rel_types = [row[0] for row in cypher_query("CALL db.relationshipTypes()")[0]]
+            for rel_type in rel_types:
+                deleted = self.delete_in_batches(
+                    f"MATCH ()-[r:`{rel_type}`]->() WITH r LIMIT $batch_size DELETE r RETURN count(r)",
+                    batch_size, rel_type
+                )
+                self.stdout.write(f'  ✓ {deleted} relaciones {rel_type} eliminadas')
+
+            labels = [row[0] for row in cypher_query("CALL db.labels()")[0]]
+            for label in labels:
+                deleted = self.delete_in_batches(
+                    f"MATCH (n:`{label}`) WITH n LIMIT $batch_size DETACH DELETE n RETURN count(n)",
+                    batch_size, label
+                )
+                self.stdout.write(f'  ✓ {deleted} nodos {label} eliminados')
+
+            # Nodos sin etiqueta que hayan quedado
+            self.delete_in_batches(
+                "MATCH (n) WITH n LIMIT $batch_size DETACH DELETE n RETURN count(n)",
+                batch_size, 'sin etiqueta'
+            )
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Error limpiando base de datos: {e}'))
+            raise CommandError(f'Error limpiando base de datos: {e}') from e
+        self.stdout.write(self.style.SUCCESS('✓ Base de datos limpiada'))
+
+    def delete_in_batches(self, query, batch_size, description):
+        """Repite una consulta de borrado con LIMIT (una transacción por lote) hasta que no borre nada"""
+        total = 0
+        while True:
+            results, meta = cypher_query(query, {'batch_size': batch_size})
+            deleted = results[0][0] if results else 0
+            if not deleted:
+                return total
+            total += deleted
+            self.stdout.write(f'    {description}: {total} eliminados...')
 
     def migrate_users(self):
         """Migra usuarios de Django a Neo4j"""
@@ -127,3 +266,311 @@ class Command(BaseCommand):
                     self.stdout.write(self.style.ERROR(f'  ✗ Error migrando like: {e}'))
         
         self.stdout.write(f'  ✓ {total_likes} likes migrados')
+
+    # ============================================
+    # Modo --bulk
+    # ============================================
+
+    def migrate_bulk(self, options):
+        """Migra todas las entidades por lotes, con checkpoint después de cada lote"""
+        self.chunk_size = options['chunk_size']
+        self.checkpoint_file = options['checkpoint_file']
+        self.checkpoint_lock = threading.Lock()
+        self.skipped, self.skipped_lock = {}, threading.Lock()
+        self.checkpoint = self.load_json(self.checkpoint_file) if options['resume'] and not options['clear'] else {}
+        if self.checkpoint:
+            self.stdout.write(f'Reanudando desde el checkpoint: {self.checkpoint}')
+        # Se toma antes de empezar: lo creado durante la migración entra en el siguiente --since
+        watermark = self.current_watermark()
+
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            for phase in BULK_PHASES:
+                self.stdout.write(f'Migrando {", ".join(phase)}...')
+                futures = [pool.submit(self.migrate_entity_bulk, entity) for entity in phase]
+                for future in futures:
+                    # Propaga el primer error; el checkpoint conserva el avance
+                    future.result()
+
+        if os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+        self.save_json(options['watermark_file'], watermark)
+        if self.report_skipped():
+            self.stdout.write(self.style.SUCCESS('✓ Migración completada exitosamente'))
+
+    def bulk_sources(self):
+        """
+        Por entidad: (queryset de tuplas cuyo primer valor es la pk,
+        función que arma la fila para Neo4j, escritura masiva)
+        """
+        return {
+            'users': (
+                User.objects.values_list(
+                    'id', 'username', 'email', 'first_name', 'last_name', 'profile__bio', 'date_joined'
+                ),
+                lambda row: {
+                    'user_id': row[0],
+                    'username': row[1],
+                    'email': row[2],
+                    'first_name': row[3],
+                    'last_name': row[4],
+                    'bio': row[5] or '',
+                    'date_joined': row[6].timestamp(),
+                },
+                Neo4jBulkService.upsert_users,
+            ),
+            'posts': (
+                Post.objects.values_list('post_id', 'username_id', 'post_content', 'post_date'),
+                lambda row: {
+                    'post_id': row[0],
+                    'user_id': row[1],
+                    'content': row[2],
+                    'created_at': row[3].timestamp(),
+                    'tags': _extract_hashtags(row[2]),
+                },
+                Neo4jBulkService.upsert_posts,
+            ),
+            'comments': (
+                Comment.objects.values_list('comment_id', 'username_id', 'post_id_id', 'comment_content', 'comment_date'),
+                lambda row: {
+                    'comment_id': row[0],
+                    'user_id': row[1],
+                    'post_id': row[2],
+                    'content': row[3],
+                    'created_at': row[4].timestamp(),
+                },
+                Neo4jBulkService.upsert_comments,
+            ),
+            'likes': (
+                Post.likes.through.objects.values_list('id', 'user_id', 'post_id'),
+                lambda row: {
+                    'user_id': row[1],
+                    'post_id': row[2],
+                },
+                Neo4jBulkService.upsert_likes,
+            ),
+        }
+
+    def migrate_entity_bulk(self, entity):
+        """Recorre la tabla en orden de pk y escribe cada lote con una sola consulta"""
+        queryset, build_row, write_rows = self.bulk_sources()[entity]
+        last_pk = self.checkpoint.get(entity, 0)
+        total = 0
+        try:
+            for chunk in self.iter_chunks(queryset.filter(pk__gt=last_pk)):
+                self.write_chunk(entity, write_rows, build_row, chunk)
+                last_pk = chunk[-1][0]
+                total += len(chunk)
+                self.save_checkpoint(entity, last_pk)
+                self.stdout.write(f'  ✓ {entity}: {total} migrados (último id {last_pk})')
+        finally:
+            # Cada hilo abre su propia conexión a SQLite
+            connections.close_all()
+        return total
+
+    def write_chunk(self, entity, write_rows, build_row, chunk):
+        """
+        Escribe un lote y avisa si Neo4j descartó filas (su usuario o post no existe en el grafo)
+        Las filas descartadas no se reintentan: quedan reportadas para revisarlas
+        """
+        written = write_rows([build_row(row) for row in chunk])
+        if written != len(chunk):
+            with self.skipped_lock:
+                self.skipped[entity] = self.skipped.get(entity, 0) + len(chunk) - written
+            self.stderr.write(self.style.WARNING(
+                f'  ⚠ {entity}: {len(chunk) - written} de {len(chunk)} filas descartadas '
+                f'(ids {chunk[0][0]} a {chunk[-1][0]}): falta su usuario o post en Neo4j'
+            ))
+        return written
+
+    def report_skipped(self):
+        """Resumen de las filas descartadas; retorna True si no hubo ninguna"""
+        if not self.skipped:
+            return True
+        details = ', '.join(f'{entity}: {count}' for entity, count in self.skipped.items())
+        self.stderr.write(self.style.WARNING(f'⚠ Filas no escritas en Neo4j ({details})'))
+        return False
+
+    def iter_chunks(self, queryset):
+        """Recorre un queryset de tuplas en orden de pk, en listas de chunk_size filas"""
+        rows = queryset.order_by('pk').iterator(chunk_size=self.chunk_size)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def save_checkpoint(self, entity, last_pk):
+        """Guarda el último id migrado de una entidad"""
+        with self.checkpoint_lock:
+            self.checkpoint[entity] = last_pk
+            self.save_json(self.checkpoint_file, self.checkpoint)
+
+    def load_json(self, path):
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def save_json(self, path, data):
+        """Escritura atómica: un corte a mitad no deja el archivo a medias"""
+        tmp_file = f'{path}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_file, path)
+
+    # ============================================
+    # Modo --since (sincronización incremental)
+    # ============================================
+
+    def current_watermark(self):
+        """Fecha actual y último id de cada entidad en SQLite"""
+        sources = self.bulk_sources()
+        watermark = {'synced_at': timezone.now().isoformat()}
+        for entity in DELTA_DATE_FIELDS:
+            queryset = sources[entity][0]
+            watermark[entity] = queryset.model.objects.aggregate(last=Max('pk'))['last'] or 0
+        return watermark
+
+    def sync_delta(self, options):
+        """
+        Sincroniza solo lo que cambió desde la última ejecución:
+        - filas nuevas, por id mayor a la marca de agua o fecha posterior a --since;
+          los posts nuevos se distribuyen a los timelines de sus seguidores
+        - filas borradas en SQLite, desde los registros de SyncTombstone posteriores
+          a la fecha (con --scan-deletions, comparando todos los ids de Neo4j)
+        - likes quitados, en los posts con likes_updated_at posterior a la fecha
+          (con --all-likes, en todos), comparando contadores y los pares solo donde difieren
+
+        Las ediciones de contenido no tienen fecha propia; esas llegan por el outbox.
+        """
+        self.chunk_size = options['chunk_size']
+        self.skipped, self.skipped_lock = {}, threading.Lock()
+        watermark_file = options['watermark_file']
+        previous = self.load_json(watermark_file)
+
+        if options['since']:
+            since = datetime.fromisoformat(options['since'])
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        elif 'synced_at' in previous:
+            since = datetime.fromisoformat(previous['synced_at'])
+        else:
+            self.stdout.write(self.style.ERROR(
+                'No hay marca de agua previa: ejecuta primero una migración --bulk o indica --since FECHA'
+            ))
+            return
+
+        self.stdout.write(f'Sincronizando cambios desde {since.isoformat()}...')
+        watermark = self.current_watermark()
+
+        sources = self.bulk_sources()
+        for entity, date_field in DELTA_DATE_FIELDS.items():
+            queryset, build_row, write_rows = sources[entity]
+            changed = Q(**{f'{date_field}__gte': since}) if date_field else Q()
+            if entity in previous:
+                changed |= Q(pk__gt=previous[entity])
+            if not changed:
+                continue
+            total = 0
+            for chunk in self.iter_chunks(queryset.filter(changed)):
+                total += self.write_chunk(entity, write_rows, build_row, chunk)
+                if entity == 'posts':
+                    self.fan_out_posts(chunk)
+            self.stdout.write(f'  ✓ {entity}: {total} nuevos o actualizados')
+
+        if options['scan_deletions']:
+            self.scan_deletions()
+        else:
+            self.sync_deletions(since)
+        self.sync_likes(None if options['all_likes'] else since)
+
+        self.save_json(watermark_file, watermark)
+        # Los registros anteriores a esta ejecución ya se aplicaron en la anterior
+        SyncTombstone.objects.filter(deleted_at__lt=since).delete()
+        if self.report_skipped():
+            self.stdout.write(self.style.SUCCESS('✓ Sincronización incremental completada'))
+
+    def fan_out_posts(self, chunk):
+        """
+        Distribuye los posts de un lote a los timelines materializados
+        Sin esto los seguidores no verían los posts que llegan por --since
+        (los del outbox ya se distribuyen al aplicarse; repetirlo no duplica)
+        """
+        failed = [post_id for post_id, user_id, *_ in chunk
+                  if Neo4jTimelineService.fan_out_post(post_id, user_id) is None]
+        if failed:
+            self.stderr.write(self.style.WARNING(
+                f'  ⚠ posts: {len(failed)} no se distribuyeron a los timelines (ids {failed[0]} a {failed[-1]})'
+            ))
+
+    def deleters(self):
+        return {
+            'users': Neo4jBulkService.delete_users,
+            'posts': Neo4jBulkService.delete_posts,
+            'comments': Neo4jBulkService.delete_comments,
+        }
+
+    def sync_deletions(self, since):
+        """Aplica en Neo4j los borrados registrados en SyncTombstone desde `since`"""
+        deleters = self.deleters()
+        for entity, _ in SyncTombstone.ENTITY_CHOICES:
+            tombstones = (
+                SyncTombstone.objects
+                .filter(entity=entity, deleted_at__gte=since)
+                .values_list('pk', 'object_id')
+            )
+            removed = 0
+            for chunk in self.iter_chunks(tombstones):
+                ids = list({object_id for _, object_id in chunk})
+                deleters[entity](ids)
+                removed += len(ids)
+            self.stdout.write(f'  ✓ {entity}: {removed} borrados aplicados')
+
+    def scan_deletions(self):
+        """Elimina de Neo4j los nodos cuyo id ya no existe en SQLite (recorre todo el grafo)"""
+        models_by_entity = {'users': User, 'posts': Post, 'comments': Comment}
+        deleters = self.deleters()
+        for entity, model in models_by_entity.items():
+            removed = 0
+            after_id = -1
+            while True:
+                ids = Neo4jBulkService.get_id_page(entity, after_id, self.chunk_size)
+                if not ids:
+                    break
+                after_id = ids[-1]
+                existing = set(model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+                missing = [pk for pk in ids if pk not in existing]
+                if missing:
+                    deleters[entity](missing)
+                    removed += len(missing)
+            self.stdout.write(f'  ✓ {entity}: {removed} eliminados')
+
+    def sync_likes(self, since=None):
+        """
+        Reconcilia los likes (incluidos los quitados) comparando primero
+        like_count con el grado en Neo4j; solo se leen los pares de los posts que difieren
+        Con `since` solo revisa los posts cuyos likes cambiaron desde esa fecha
+        """
+        through = Post.likes.through
+        posts = Post.objects.values_list('post_id', 'like_count')
+        if since is not None:
+            posts = posts.filter(likes_updated_at__gte=since)
+        added = removed = 0
+        for chunk in self.iter_chunks(posts):
+            graph_counts = Neo4jBulkService.get_like_counts([post_id for post_id, _ in chunk])
+            mismatched = [post_id for post_id, count in chunk if graph_counts.get(post_id, 0) != count]
+            if not mismatched:
+                continue
+            expected = set(through.objects.filter(post_id__in=mismatched).values_list('post_id', 'user_id'))
+            current = set(Neo4jBulkService.get_like_pairs(mismatched))
+            if expected - current:
+                Neo4jBulkService.upsert_likes(
+                    [{'post_id': post_id, 'user_id': user_id} for post_id, user_id in expected - current]
+                )
+            if current - expected:
+                Neo4jBulkService.delete_likes(
+                    [{'post_id': post_id, 'user_id': user_id} for post_id, user_id in current - expected]
+                )
+            added += len(expected - current)
+            removed += len(current - expected)
+        self.stdout.write(f'  ✓ likes: {added} agregados, {removed} eliminados')
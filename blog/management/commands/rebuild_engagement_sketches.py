@@ -0,0 +1,42 @@
+"""
+Comando Django para reconstruir desde SQLite los sketches de estadísticas aproximadas
+"""
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from blog import engagement
+from blog.models import Comment, Post, PostTag
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye los sketches de hashtags, likes y usuarios activos desde SQLite '
+        'y reemplaza los archivos de SKETCH_DIR (ejecutar con los workers detenidos)'
+    )
+
+    def handle(self, *args, **options):
+        sketches = engagement.EngagementSketches()
+        tz = timezone.get_current_timezone()
+
+        self.stdout.write('Procesando posts y hashtags...')
+        tags_by_post = {}
+        for post_id, tag in PostTag.objects.values_list('post_id', 'type_id__type_name').iterator(chunk_size=5000):
+            tags_by_post.setdefault(post_id, []).append(tag)
+        for post_id, user_id, post_date in Post.objects.values_list('post_id', 'username_id', 'post_date').iterator(chunk_size=5000):
+            sketches.record_post(user_id, tags_by_post.get(post_id, []), post_date.astimezone(tz).date())
+
+        # Los likes no guardan fecha: cuentan para los likers de cada post, no para los activos del día
+        self.stdout.write('Procesando likes...')
+        for post_id, user_id in Post.likes.through.objects.values_list('post_id', 'user_id').iterator(chunk_size=5000):
+            sketches.record_liker(user_id, post_id)
+
+        self.stdout.write('Procesando comentarios...')
+        for user_id, comment_date in Comment.objects.values_list('username_id', 'comment_date').iterator(chunk_size=5000):
+            sketches.record_comment(user_id, comment_date.astimezone(tz).date())
+
+        sketches.prune(timezone.localdate())
+        engagement.reset_shards()
+        engagement.save_shard(sketches, 'rebuild')
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Sketches reconstruidos ({sketches.tags.sketch.total} hashtags, '
+            f'{len(sketches.likers)} posts con likes, {len(sketches.active_users)} días)'
+        ))
@@ -0,0 +1,84 @@
+"""
+Comando Django para recalcular los contadores de red guardados en UserNode
+También ajusta el modo de fan-out (pull_based) de cada autor a sus seguidores
+"""
+from django.core.management.base import BaseCommand
+from neo4j import READ_ACCESS
+from blog.neo4j_connection import cypher_query, init_neo4j_connection
+from blog.neo4j_services import Neo4jTimelineService
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los contadores de seguidores, seguidos, amigos, posts e intereses de cada UserNode'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Número de usuarios recalculados por transacción (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        if not init_neo4j_connection():
+            self.stdout.write(self.style.ERROR('Error al conectar con Neo4j'))
+            return
+
+        self.stdout.write('Recalculando contadores de usuarios...')
+        last_user_id = -1
+        total = 0
+        while True:
+            user_ids = self.next_batch(last_user_id, batch_size)
+            if not user_ids:
+                break
+            switched = self.repair_batch(user_ids)
+            total += len(user_ids)
+            if switched:
+                self.stdout.write(f'  ↔ {switched} autores cambiaron de modo de fan-out')
+            last_user_id = user_ids[-1]
+            self.stdout.write(f'  ✓ {total} usuarios recalculados')
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Contadores recalculados para {total} usuarios'))
+
+    def next_batch(self, last_user_id, batch_size):
+        """Obtiene el siguiente lote de user_ids en orden ascendente"""
+        query = """
+        MATCH (u:UserNode)
+        WHERE u.user_id > $last_user_id
+        RETURN u.user_id
+        ORDER BY u.user_id
+        LIMIT $batch_size
+        """
+        results, meta = cypher_query(query, {'last_user_id': last_user_id, 'batch_size': batch_size}, access_mode=READ_ACCESS)
+        return [row[0] for row in results]
+
+    def repair_batch(self, user_ids):
+        """
+        Recalcula los contadores de un lote de usuarios en una sola consulta
+        Retorna cuántos autores cambiaron de modo de fan-out
+        """
+        query = """
+        MATCH (u:UserNode)
+        WHERE u.user_id IN $user_ids
+        CALL {
+            WITH u
+            // Solo cuentan las amistades con las dos direcciones, igual que en add_friend
+            OPTIONAL MATCH (u)-[:FRIEND_OF]->(friend:UserNode)-[:FRIEND_OF]->(u)
+            RETURN count(DISTINCT friend) AS friends_count
+        }
+        SET u.following_count = COUNT { (u)-[:FOLLOWS]->(:UserNode) },
+            u.followers_count = COUNT { (u)<-[:FOLLOWS]-(:UserNode) },
+            u.friends_count = friends_count,
+            u.posts_count = COUNT { (u)-[:POSTED]->(:PostNode) },
+            u.interests_count = COUNT { (u)-[:INTERESTED_IN]->(:InterestNode) }
+        RETURN u.user_id, u.followers_count, coalesce(u.pull_based, false)
+        """
+        results, meta = cypher_query(query, {'user_ids': user_ids}, retry=True)
+        # Los autores que cruzaron un umbral (o que nunca tuvieron modo) migran sus timelines
+        switched = 0
+        for user_id, followers_count, pull_based in results:
+            if Neo4jTimelineService.update_fanout_mode(user_id, pull_based, followers_count) != pull_based:
+                switched += 1
+        return switched
@@ -0,0 +1,25 @@
+"""
+Middleware de la app blog
+"""
+from neo4j import READ_ACCESS
+
+from .neo4j_connection import neo4j_session
+from .neo4j_request_cache import request_cache
+
+
+class Neo4jSessionMiddleware:
+    """
+    Abre por petición una sesión de Neo4j para escrituras y otra para
+    lecturas: todas las consultas de los servicios durante la petición las
+    comparten en lugar de abrir una cada una
+    La sesión no conecta hasta la primera consulta, así que las peticiones
+    que no usan Neo4j no pagan nada
+    También activa la caché de lecturas de la petición (ver neo4j_request_cache)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with request_cache(), neo4j_session(), neo4j_session(READ_ACCESS):
+            return self.get_response(request)
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.11 on 2026-10-18 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_post_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-post_date', '-post_id'], name='post_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['username', '-post_date', '-post_id'], name='post_user_date_id_idx'),
+        ),
+    ]
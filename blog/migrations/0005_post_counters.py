@@ -0,0 +1,49 @@
+# Generated by Django 4.2.11 on 2026-10-18 17:13
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    Comment = apps.get_model('blog', 'Comment')
+    likes = (
+        Post.likes.through.objects
+        .filter(post_id=OuterRef('pk'))
+        .values('post_id')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    comments = (
+        Comment.objects
+        .filter(post_id=OuterRef('pk'))
+        .values('post_id')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    Post.objects.update(
+        like_count=Coalesce(Subquery(likes), 0),
+        comment_count=Coalesce(Subquery(comments), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_post_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-18 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_user_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='likes_updated_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.11 on 2026-10-18 18:07
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_post_likes_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxLease',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('owner', models.CharField(blank=True, max_length=64)),
+                ('expires_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
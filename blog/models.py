@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.urls import reverse
@@ -11,9 +13,19 @@ class Post(models.Model):
     username = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     likes = models.ManyToManyField(User, related_name='liked_posts', blank=True)
     image = models.ImageField(upload_to='post_images', blank=True, null=True)
+    # Contadores desnormalizados, se actualizan con expresiones F()
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    # Último cambio de likes; con él migrate_to_neo4j --since reconcilia solo los posts que cambiaron
+    likes_updated_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     class Meta:
         ordering = ['-post_date']
+        indexes = [
+            # Soportan la paginación por cursor sobre (post_date, post_id)
+            models.Index(fields=['-post_date', '-post_id'], name='post_date_id_idx'),
+            models.Index(fields=['username', '-post_date', '-post_id'], name='post_user_date_id_idx'),
+        ]
 
     def __str__(self):
         return self.post_content[:50]
@@ -23,7 +35,42 @@ class Post(models.Model):
 
     @property
     def number_of_likes(self):
-        return self.likes.count()
+        return self.like_count
+
+    @classmethod
+    def ids_liked_by(cls, user, posts):
+        """Retorna el conjunto de post_ids de `posts` a los que `user` dio like (una sola consulta)"""
+        if not user.is_authenticated:
+            return set()
+        post_ids = [post.post_id for post in posts]
+        return set(
+            cls.likes.through.objects
+            .filter(user_id=user.pk, post_id__in=post_ids)
+            .values_list('post_id', flat=True)
+        )
+
+    @classmethod
+    def recount_counters(cls, queryset=None):
+        """Recalcula like_count y comment_count desde las tablas de likes y comentarios"""
+        queryset = cls.objects.all() if queryset is None else queryset
+        likes = (
+            cls.likes.through.objects
+            .filter(post_id=OuterRef('pk'))
+            .values('post_id')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        comments = (
+            Comment.objects
+            .filter(post_id=OuterRef('pk'))
+            .values('post_id')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return queryset.update(
+            like_count=Coalesce(Subquery(likes), 0),
+            comment_count=Coalesce(Subquery(comments), 0),
+        )
 
 
 class Type(models.Model):
@@ -57,3 +104,85 @@ class PostTag(models.Model):
 
     def __str__(self):
         return f"{self.post_id.post_id} -> {self.type_id.type_name}"
+
+
+class OutboxEntry(models.Model):
+    """
+    Cambio pendiente de aplicar en Neo4j
+    Se escribe en la misma transacción que el cambio en SQLite y lo aplica
+    el comando drain_neo4j_outbox, en orden de entry_id
+    """
+    PENDING = 'pending'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pendiente'),
+        (FAILED, 'Fallido'),
+    ]
+
+    entry_id = models.AutoField(primary_key=True)
+    operation = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['entry_id']
+        indexes = [
+            models.Index(fields=['status', 'entry_id'], name='outbox_status_entry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.entry_id} {self.operation} ({self.status})"
+
+
+class OutboxLease(models.Model):
+    """
+    Candado del outbox: solo un proceso lo vacía a la vez
+    Dos drainers en paralelo aplicarían las mismas entradas dos veces y
+    fuera de orden. El candado vence en `expires_at`, así que un drainer
+    que muere no bloquea la cola para siempre
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    owner = models.CharField(max_length=64, blank=True)
+    expires_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} ({self.owner or 'libre'})"
+
+
+class SyncTombstone(models.Model):
+    """
+    Borrado en SQLite pendiente de reflejar en Neo4j con migrate_to_neo4j --since
+    Lo escriben las señales de blog.signals; así la sincronización
+    incremental solo repasa los borrados posteriores a la marca de agua
+    """
+    ENTITY_CHOICES = [
+        ('users', 'Usuario'),
+        ('posts', 'Post'),
+        ('comments', 'Comentario'),
+    ]
+
+    entity = models.CharField(max_length=20, choices=ENTITY_CHOICES)
+    object_id = models.IntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.entity} {self.object_id} ({self.deleted_at:%Y-%m-%d %H:%M})"
+
+
+class UserRecommendations(models.Model):
+    """
+    Sugerencias de seguimiento y amistad precalculadas por compute_recommendations
+    Una fila por usuario, así que leerlas es una sola búsqueda por clave primaria
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='recommendations')
+    # [[user_id, intereses en común, puntaje Adamic-Adar], ...] de mayor a menor puntaje
+    follow = models.JSONField(default=list)
+    # [[user_id, amigos en común, Jaccard], ...] de mayor a menor número de amigos en común
+    friends = models.JSONField(default=list)
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Recomendaciones de {self.user_id}"
@@ -0,0 +1,98 @@
+"""
+Versiones asíncronas de los servicios de lectura de Neo4j
+Usan el driver asíncrono para que las vistas puedan lanzar varias consultas
+independientes a la vez con asyncio.gather. El Cypher es el mismo de los
+servicios síncronos (constantes *_QUERY de neo4j_services)
+"""
+from typing import Iterable
+from asgiref.sync import sync_to_async
+from neo4j import READ_ACCESS
+from . import analytics_cache, recommendations, trending
+from .neo4j_models import UserNode, InterestNode
+from .neo4j_connection import async_cypher_query
+from .neo4j_services import (
+    FOLLOWED_IDS_QUERY, INFLUENCERS_QUERY, SUGGEST_USERS_TO_FOLLOW_QUERY,
+    USER_INTERESTS_QUERY, USER_NETWORK_STATS_QUERY
+)
+
+
+class AsyncNeo4jUserService:
+    """Consultas de usuarios en versión asíncrona"""
+
+    @staticmethod
+    async def get_followed_ids(follower_id: int, target_ids: Iterable[int]):
+        """Retorna el subconjunto de `target_ids` que el usuario sigue"""
+        target_ids = list(set(target_ids))
+        if not target_ids:
+            return set()
+        query = FOLLOWED_IDS_QUERY
+        results, meta = await async_cypher_query(query, {'user_id': follower_id, 'target_ids': target_ids}, access_mode=READ_ACCESS)
+        return {row[0] for row in results}
+
+
+class AsyncNeo4jInterestService:
+    """Consultas de intereses en versión asíncrona"""
+
+    @staticmethod
+    async def get_user_interests(user_id: int):
+        """Obtiene todos los intereses de un usuario"""
+        query = USER_INTERESTS_QUERY
+        results, meta = await async_cypher_query(query, {'user_id': user_id}, access_mode=READ_ACCESS)
+        return [InterestNode.inflate(row[0]) for row in results]
+
+
+class AsyncNeo4jAnalyticsService:
+    """Consultas de análisis de red en versión asíncrona"""
+
+    @staticmethod
+    async def suggest_users_to_follow(user_id: int, limit: int = 10):
+        """Sugiere usuarios para seguir (precalculadas o, si no hay, desde Neo4j; en caché, por usuario)"""
+        async def compute():
+            precomputed = await sync_to_async(recommendations.follow_suggestions)(user_id, limit)
+            if precomputed is not None:
+                return precomputed
+            query = SUGGEST_USERS_TO_FOLLOW_QUERY
+            results, meta = await async_cypher_query(query, {'user_id': user_id, 'limit': limit}, access_mode=READ_ACCESS)
+            return [
+                {
+                    'user_id': row[0],
+                    'common_interests': row[1]
+                }
+                for row in results
+            ]
+        return await analytics_cache.aget_or_compute('suggestions', compute, limit, user_id=user_id)
+
+    @staticmethod
+    async def get_trending_interests(limit: int = 10, window: str = trending.DEFAULT_WINDOW):
+        """Obtiene los intereses en tendencia de una ventana, desde el motor de tendencias"""
+        return await sync_to_async(trending.get_trending)(window, limit)
+
+    @staticmethod
+    async def get_influencers(limit: int = 10):
+        """Obtiene los usuarios más influyentes (con más seguidores), desde la caché de análisis"""
+        async def compute():
+            query = INFLUENCERS_QUERY
+            results, meta = await async_cypher_query(query, {'limit': limit}, access_mode=READ_ACCESS)
+            return [
+                {
+                    'user': UserNode.inflate(row[0]),
+                    'followers': row[1]
+                }
+                for row in results
+            ]
+        return await analytics_cache.aget_or_compute('influencers', compute, limit)
+
+    @staticmethod
+    async def get_user_network_stats(user_id: int):
+        """Obtiene las estadísticas de red guardadas en el nodo del usuario"""
+        query = USER_NETWORK_STATS_QUERY
+        results, meta = await async_cypher_query(query, {'user_id': user_id}, access_mode=READ_ACCESS)
+        if results:
+            return {
+                'following': results[0][0],
+                'followers': results[0][1],
+                'friends': results[0][2],
+                'posts': results[0][3],
+                'interests': results[0][4]
+            }
+        return None
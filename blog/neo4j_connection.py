@@ -1,9 +1,32 @@
 """
 Módulo para gestionar la conexión con Neo4j
+
+Importar este módulo no abre ninguna conexión: solo configura neomodel,
+que conecta en la primera consulta. Así `manage.py`, los tests y el
+arranque de los workers no dependen de que Neo4j esté disponible.
+
+Todo el proceso comparte un único driver (un único pool de conexiones).
+Dentro de `neo4j_session()` (por ejemplo durante una petición, ver
+Neo4jSessionMiddleware) todas las consultas de `cypher_query` usan la misma sesión.
+Las consultas asíncronas usan un driver asíncrono, también único por proceso,
+que vive en un event loop propio (ver `_async_loop`).
+
+Cada consulta corre en una transacción de lectura o de escritura según su
+`access_mode`. Con un clúster (URI neo4j://) el driver envía las lecturas a
+los followers; con NEO4J_READ_URI las lecturas van a esa réplica. Todas las
+sesiones del proceso comparten un bookmark manager, así que una lectura
+espera a que la réplica tenga las escrituras anteriores del proceso (por
+ejemplo, leer un timeline justo después de reconstruirlo).
 """
+import asyncio
+from contextlib import contextmanager
+from neo4j import AsyncGraphDatabase, Bookmarks, GraphDatabase, READ_ACCESS, WRITE_ACCESS
 from neomodel import config, db
 from django.conf import settings
+from . import neo4j_request_cache as request_cache
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
@@ -11,11 +34,51 @@ load_dotenv()
 
 # Variable global para rastrear si ya se inicializó
 _connection_initialized = False
+_configured = False
+
+# Estado de la última comprobación del health probe (None = aún no comprobado)
+_neo4j_healthy = None
+_health_probe = None
+
+# Drivers compartidos por todo el proceso; se recrean si el proceso hace fork
+_driver = None
+_read_driver = None
+_driver_pid = None
+
+# Sesiones activas del hilo actual, una por driver (ver neo4j_session)
+_local = threading.local()
+
+# Bookmarks de las escrituras del proceso: las sesiones de lectura los pasan a la réplica
+_bookmark_manager = GraphDatabase.bookmark_manager()
+# Las sesiones asíncronas (solo lecturas) toman los mismos bookmarks
+_async_bookmark_manager = AsyncGraphDatabase.bookmark_manager(
+    bookmarks_supplier=lambda: Bookmarks.from_raw_values(_bookmark_manager.get_bookmarks())
+)
+
+# Loop propio de los drivers asíncronos y sus drivers ({pid, loop, drivers: {uri: driver}})
+_async_runner = None
+_async_lock = threading.Lock()
+
+
+def configure_neo4j_connection():
+    """
+    Configura neomodel para que use el driver compartido, sin conectarse
+    La conexión real se abre en la primera consulta
+    """
+    global _configured
+    
+    if _configured:
+        return
+    
+    config.DRIVER = get_neo4j_driver()
+    _configured = True
 
 
 def init_neo4j_connection():
     """
-    Inicializa la conexión con Neo4j usando neomodel
+    Configura la conexión con Neo4j y la verifica con una consulta
+    La usan los comandos que necesitan Neo4j antes de empezar y, con
+    NEO4J_ENSURE_SCHEMA, el arranque de la aplicación (BlogConfig.ready)
     """
     global _connection_initialized
     
@@ -23,53 +86,271 @@ def init_neo4j_connection():
     if _connection_initialized:
         return True
     
-    # Obtener credenciales de variables de entorno o usar valores por defecto
-    neo4j_uri = os.getenv('NEO4J_URI', 'bolt://localhost:7687')
-    neo4j_user = os.getenv('NEO4J_USER', 'neo4j')
-    neo4j_password = os.getenv('NEO4J_PASSWORD', 'password')
-    
-    print(f"DEBUG: Conectando a Neo4j con usuario: {neo4j_user}")
-    
-    # Configurar la conexión
-    connection_url = f"{neo4j_uri.replace('bolt://', 'bolt://' + neo4j_user + ':' + neo4j_password + '@')}"
-    config.DATABASE_URL = connection_url
+    configure_neo4j_connection()
     
     # Verificar la conexión
     try:
         db.cypher_query("RETURN 1")
         _connection_initialized = True
         print("✓ Conexión exitosa con Neo4j")
-        return True
     except Exception as e:
         print(f"✗ Error al conectar con Neo4j: {e}")
         return False
+    
+    # Fuera del try: un esquema incompleto debe detener el arranque, no solo imprimirse
+    if getattr(settings, 'NEO4J_ENSURE_SCHEMA', False):
+        from .neo4j_schema import ensure_schema
+        ensure_schema()
+        print("✓ Esquema de Neo4j verificado")
+    return True
 
 
 def get_neo4j_driver():
     """
-    Retorna una instancia del driver de Neo4j para queries personalizadas
+    Retorna el driver de Neo4j del proceso (crearlo no abre conexiones)
+    Después de un fork (p. ej. gunicorn --preload) se crea uno nuevo,
+    porque las conexiones del pool no se pueden compartir entre procesos
+    """
+    global _driver, _read_driver, _driver_pid
+    
+    if _driver is not None and _driver_pid == os.getpid():
+        return _driver
+    
+    _driver = _build_driver(os.getenv('NEO4J_URI', 'bolt://localhost:7687'))
+    _read_driver = None
+    _driver_pid = os.getpid()
+    config.DRIVER = _driver
+    if db.driver is not None:
+        # neomodel conserva en este hilo el driver anterior al fork
+        db.driver = _driver
+    return _driver
+
+
+def get_neo4j_read_driver():
+    """
+    Driver para lecturas: el de la réplica de NEO4J_READ_URI si está
+    configurada; si no, el driver principal
     """
-    from neo4j import GraphDatabase
+    global _read_driver
     
-    neo4j_uri = os.getenv('NEO4J_URI', 'bolt://localhost:7687')
+    driver = get_neo4j_driver()
+    read_uri = getattr(settings, 'NEO4J_READ_URI', '')
+    if not read_uri:
+        return driver
+    if _read_driver is None:
+        _read_driver = _build_driver(read_uri)
+    return _read_driver
+
+
+def _build_driver(uri, driver_class=GraphDatabase):
+    # Obtener credenciales de variables de entorno o usar valores por defecto
     neo4j_user = os.getenv('NEO4J_USER', 'neo4j')
     neo4j_password = os.getenv('NEO4J_PASSWORD', 'password')
     
-    return GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
+    return driver_class.driver(
+        uri,
+        auth=(neo4j_user, neo4j_password),
+        max_connection_pool_size=getattr(settings, 'NEO4J_MAX_POOL_SIZE', 50),
+        max_connection_lifetime=getattr(settings, 'NEO4J_MAX_CONNECTION_LIFETIME', 3600),
+        connection_acquisition_timeout=getattr(settings, 'NEO4J_CONNECTION_ACQUISITION_TIMEOUT', 10.0),
+        # Sin timeout corto, una petición quedaría colgada si Neo4j no responde
+        connection_timeout=getattr(settings, 'NEO4J_CONNECT_TIMEOUT', 5.0),
+        keep_alive=getattr(settings, 'NEO4J_KEEP_ALIVE', True),
+    )
+
+
+@contextmanager
+def neo4j_session(access_mode=WRITE_ACCESS):
+    """
+    Abre una sesión que reutilizan todas las consultas del bloque
+    Las lecturas usan la sesión del driver de lectura (si hay réplica).
+    Los bloques anidados reutilizan la sesión del bloque exterior
+    """
+    driver = get_neo4j_read_driver() if access_mode == READ_ACCESS else get_neo4j_driver()
+    key = (id(driver), access_mode)
+    sessions = _local.__dict__.setdefault('sessions', {})
+    session = sessions.get(key)
+    if session is not None:
+        yield session
+        return
+    
+    session = driver.session(default_access_mode=access_mode, bookmark_manager=_bookmark_manager)
+    sessions[key] = session
+    try:
+        yield session
+    finally:
+        del sessions[key]
+        session.close()
+
+
+def _run_query(tx, query, params):
+    # Los resultados se leen dentro de la transacción, antes de que se cierre
+    result = tx.run(query, params or {})
+    records = [list(record.values()) for record in result]
+    return records, result.keys()
+
+
+def cypher_query(query, params=None, access_mode=WRITE_ACCESS, retry=False):
+    """
+    Ejecuta una consulta y retorna (resultados, columnas) como db.cypher_query
+    Corre en una transacción explícita de lectura o escritura según access_mode,
+    en la sesión de neo4j_session() si hay una abierta. Dentro de una
+    transacción explícita de neomodel usa esa.
+
+    Por defecto no se usan execute_read/execute_write: sus reintentos harían
+    esperar hasta 30 s cada consulta cuando Neo4j no está disponible. Con
+    `retry` sí se usan, para escrituras masivas que pueden chocar entre sí
+    (deadlocks y otros errores transitorios se reintentan).
+
+    Las lecturas se memorizan en la caché de la petición (si hay una activa)
+    y las escrituras la invalidan; ver neo4j_request_cache.
+    """
+    if access_mode == READ_ACCESS:
+        key = request_cache.query_key(query, params)
+        found, cached = request_cache.get_cached(key)
+        if found:
+            return cached
+    else:
+        key = None
+        request_cache.invalidate()
+    
+    if db._active_transaction:
+        return request_cache.set_cached(key, db.cypher_query(query, params))
+    with neo4j_session(access_mode) as session:
+        if retry:
+            execute = session.execute_read if access_mode == READ_ACCESS else session.execute_write
+            records, keys = execute(_run_query, query, params)
+        else:
+            with session.begin_transaction() as tx:
+                records, keys = _run_query(tx, query, params)
+                tx.commit()
+    return request_cache.set_cached(key, (records, keys))
+
+
+def _async_loop():
+    """
+    Event loop propio (en un hilo daemon) donde viven los drivers asíncronos
+    Bajo WSGI cada vista asíncrona corre en un loop nuevo que se descarta al
+    terminar; si los drivers vivieran en ese loop, cada petición pagaría de
+    nuevo las conexiones TCP, Bolt y la autenticación. Se recrea tras un fork
+    """
+    global _async_runner
+    with _async_lock:
+        if _async_runner is None or _async_runner['pid'] != os.getpid():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='neo4j-async', daemon=True).start()
+            _async_runner = {'pid': os.getpid(), 'loop': loop, 'drivers': {}}
+        return _async_runner
+
+
+def get_async_neo4j_driver(access_mode=WRITE_ACCESS):
+    """
+    Driver asíncrono del proceso (con la misma configuración del pool)
+    Solo se usa dentro del loop de _async_loop(); ver async_cypher_query
+    """
+    uri = os.getenv('NEO4J_URI', 'bolt://localhost:7687')
+    if access_mode == READ_ACCESS and getattr(settings, 'NEO4J_READ_URI', ''):
+        uri = settings.NEO4J_READ_URI
+    drivers = _async_loop()['drivers']
+    if uri not in drivers:
+        drivers[uri] = _build_driver(uri, AsyncGraphDatabase)
+    return drivers[uri]
+
+
+async def _run_async_query(query, params, access_mode):
+    driver = get_async_neo4j_driver(access_mode)
+    async with driver.session(default_access_mode=access_mode, bookmark_manager=_async_bookmark_manager) as session:
+        async with await session.begin_transaction() as tx:
+            result = await tx.run(query, params or {})
+            records = [list(record.values()) async for record in result]
+            keys = result.keys()
+            await tx.commit()
+    return records, keys
+
+
+async def async_cypher_query(query, params=None, access_mode=WRITE_ACCESS):
+    """
+    Versión asíncrona de cypher_query
+    Cada llamada usa su propia sesión, así que varias pueden correr a la vez
+    con asyncio.gather (las conexiones salen del pool del driver). La consulta
+    corre en el loop de los drivers y se espera desde el loop de quien llama
+    """
+    if access_mode == READ_ACCESS:
+        key = request_cache.query_key(query, params)
+        found, cached = request_cache.get_cached(key)
+        if found:
+            return cached
+    else:
+        key = None
+        request_cache.invalidate()
+    
+    future = asyncio.run_coroutine_threadsafe(
+        _run_async_query(query, params, access_mode), _async_loop()['loop']
+    )
+    return request_cache.set_cached(key, await asyncio.wrap_future(future))
 
 
 def close_neo4j_connection():
     """
     Cierra la conexión con Neo4j
+    Cierra los drivers del proceso (principal, de lectura y asíncronos); la
+    siguiente consulta crea drivers nuevos
     """
-    global _connection_initialized
+    global _connection_initialized, _driver, _read_driver, _driver_pid, _configured, _async_runner
     try:
         db.close_connection()
+        # Un driver heredado de otro proceso no se cierra: sus conexiones son del padre
+        if _driver_pid == os.getpid():
+            for driver in (_driver, _read_driver):
+                if driver is not None:
+                    driver.close()
+        _driver = None
+        _read_driver = None
+        _driver_pid = None
+        if _async_runner is not None and _async_runner['pid'] == os.getpid():
+            runner, _async_runner = _async_runner, None
+            for driver in runner['drivers'].values():
+                asyncio.run_coroutine_threadsafe(driver.close(), runner['loop']).result()
+            runner['loop'].call_soon_threadsafe(runner['loop'].stop)
+        _configured = False
         _connection_initialized = False
         print("✓ Conexión con Neo4j cerrada")
     except Exception as e:
         print(f"✗ Error al cerrar conexión con Neo4j: {e}")
 
 
-# Inicializar conexión automáticamente al importar el módulo
-init_neo4j_connection()
+def _probe_loop(interval):
+    global _neo4j_healthy
+    while True:
+        try:
+            db.cypher_query("RETURN 1")
+            _neo4j_healthy = True
+        except Exception:
+            _neo4j_healthy = False
+        time.sleep(interval)
+
+
+def start_health_probe(interval=None):
+    """
+    Inicia un hilo en segundo plano que comprueba Neo4j cada `interval` segundos
+    Con intervalo 0 no se inicia
+    """
+    global _health_probe
+    
+    interval = getattr(settings, 'NEO4J_HEALTH_PROBE_INTERVAL', 0) if interval is None else interval
+    if not interval or _health_probe is not None:
+        return
+    _health_probe = threading.Thread(target=_probe_loop, args=(interval,), name='neo4j-health-probe', daemon=True)
+    _health_probe.start()
+
+
+def is_neo4j_healthy():
+    """
+    Resultado de la última comprobación del health probe
+    None si el probe no está activo o todavía no comprobó
+    """
+    return _neo4j_healthy
+
+
+# Configurar (sin conectar) al importar el módulo
+configure_neo4j_connection()
@@ -23,6 +23,15 @@ class UserNode(StructuredNode):
     bio = StringProperty(default='')
     date_joined = DateTimeProperty(default_now=True)
     
+    # Contadores de la red, mantenidos de forma incremental por los servicios
+    # (Neo4jUserService, Neo4jPostService, Neo4jInterestService) y
+    # recalculables con `python manage.py repair_neo4j_counters`
+    following_count = IntegerProperty(default=0)
+    followers_count = IntegerProperty(default=0)
+    friends_count = IntegerProperty(default=0)
+    posts_count = IntegerProperty(default=0)
+    interests_count = IntegerProperty(default=0)
+    
     # Relaciones
     posts = RelationshipTo('PostNode', 'POSTED')
     comments = RelationshipTo('CommentNode', 'COMMENTED')
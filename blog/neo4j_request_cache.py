@@ -0,0 +1,82 @@
+"""
+Caché de lecturas de Neo4j con alcance de petición
+
+Mientras está activa (Neo4jSessionMiddleware la abre en cada petición),
+cypher_query guarda el resultado de cada consulta de lectura por
+(consulta, parámetros), y los nodos cargados por id se reutilizan como una
+misma instancia (identity map). Cualquier escritura en la misma petición
+vacía la caché, así que nunca se lee un resultado anterior a un cambio propio.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Un ContextVar (y no un threading.local) para que también la compartan
+# las corrutinas lanzadas con asyncio.gather dentro de una vista asíncrona
+_cache = ContextVar('neo4j_request_cache', default=None)
+
+
+@contextmanager
+def request_cache():
+    """Activa la caché durante el bloque; los bloques anidados usan la del exterior"""
+    if _cache.get() is not None:
+        yield
+        return
+    token = _cache.set({})
+    try:
+        yield
+    finally:
+        _cache.reset(token)
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+def query_key(query, params):
+    """Clave de caché de una consulta, o None si sus parámetros no son hashables"""
+    key = ('query', query, _freeze(params or {}))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def get_cached(key):
+    """Retorna (encontrado, valor)"""
+    cache = _cache.get()
+    if cache is None or key is None or key not in cache:
+        return False, None
+    return True, cache[key]
+
+
+def set_cached(key, value):
+    cache = _cache.get()
+    if cache is not None and key is not None:
+        cache[key] = value
+    return value
+
+
+def invalidate():
+    """Descarta todo lo leído en la petición (se llama en cada escritura)"""
+    cache = _cache.get()
+    if cache is not None:
+        cache.clear()
+
+
+def identity(label, node_id, load):
+    """
+    Retorna la instancia de nodo de la petición para (label, node_id),
+    cargándola con `load()` solo la primera vez
+    """
+    key = ('node', label, node_id)
+    found, node = get_cached(key)
+    if found:
+        return node
+    return set_cached(key, load())
@@ -0,0 +1,134 @@
+"""
+Esquema de Neo4j: restricciones e índices que necesitan las consultas de neo4j_services
+
+Sin estos índices, las búsquedas por id y los ORDER BY por fecha recorren
+todos los nodos de la etiqueta. Se instalan con
+`python manage.py install_neo4j_schema` o, si NEO4J_ENSURE_SCHEMA=True, al
+arrancar cualquier proceso de Django (BlogConfig.ready).
+"""
+from neo4j import READ_ACCESS
+
+from .neo4j_connection import cypher_query, neo4j_session
+
+# (etiqueta, propiedad) con restricción de unicidad; cada una crea su propio índice RANGE
+UNIQUE_CONSTRAINTS = [
+    ('UserNode', 'user_id'),
+    ('UserNode', 'username'),
+    ('PostNode', 'post_id'),
+    ('CommentNode', 'comment_id'),
+    ('InterestNode', 'name'),
+]
+
+# Índices RANGE para filtros y ORDER BY sobre fechas
+RANGE_INDEXES = [
+    ('PostNode', 'created_at'),
+    ('CommentNode', 'created_at'),
+    ('UserNode', 'date_joined'),
+]
+
+# Consultas frecuentes que deben resolverse con un índice y nunca con un scan
+HOT_QUERIES = {
+    'usuario por id': "MATCH (u:UserNode {user_id: $id}) RETURN u",
+    'post por id': "MATCH (p:PostNode {post_id: $id}) RETURN p",
+    'comentario por id': "MATCH (c:CommentNode {comment_id: $id}) RETURN c",
+    'interés por nombre': "MATCH (i:InterestNode {name: $name}) RETURN i",
+    'posts recientes': (
+        "MATCH (p:PostNode) WHERE p.created_at IS NOT NULL "
+        "RETURN p ORDER BY p.created_at DESC LIMIT 10"
+    ),
+}
+HOT_QUERY_PARAMS = {'id': 1, 'name': 'python'}
+
+SCAN_OPERATORS = ('AllNodesScan', 'NodeByLabelScan')
+
+
+class SchemaError(Exception):
+    """Falta un índice o restricción, o una consulta frecuente usa un scan"""
+
+
+def _schema_name(kind, label, prop):
+    return f'{kind}_{label}_{prop}'.lower()
+
+
+def install_schema(timeout=300):
+    """Crea las restricciones e índices que falten y espera a que estén ONLINE"""
+    for label, prop in UNIQUE_CONSTRAINTS:
+        cypher_query(
+            f"CREATE CONSTRAINT {_schema_name('unique', label, prop)} IF NOT EXISTS "
+            f"FOR (n:{label}) REQUIRE n.{prop} IS UNIQUE"
+        )
+    for label, prop in RANGE_INDEXES:
+        cypher_query(
+            f"CREATE RANGE INDEX {_schema_name('range', label, prop)} IF NOT EXISTS "
+            f"FOR (n:{label}) ON (n.{prop})"
+        )
+    cypher_query("CALL db.awaitIndexes($timeout)", {'timeout': timeout})
+
+
+def missing_schema():
+    """Retorna la lista de restricciones e índices que no existen o no están ONLINE"""
+    indexes, meta = cypher_query(
+        "SHOW INDEXES YIELD type, labelsOrTypes, properties, state", access_mode=READ_ACCESS
+    )
+    online = {
+        (labels[0], props[0])
+        for index_type, labels, props, state in indexes
+        if index_type == 'RANGE' and state == 'ONLINE' and labels and len(props) == 1
+    }
+    constraints, meta = cypher_query(
+        "SHOW CONSTRAINTS YIELD type, labelsOrTypes, properties", access_mode=READ_ACCESS
+    )
+    unique = {
+        (labels[0], props[0])
+        for constraint_type, labels, props in constraints
+        if 'UNIQUENESS' in constraint_type and labels and len(props) == 1
+    }
+
+    missing = [f'restricción UNIQUE {label}.{prop}' for label, prop in UNIQUE_CONSTRAINTS
+               if (label, prop) not in unique]
+    missing += [f'índice RANGE {label}.{prop}' for label, prop in UNIQUE_CONSTRAINTS + RANGE_INDEXES
+                if (label, prop) not in online]
+    return missing
+
+
+def explain_plan(query, params=None):
+    """Retorna el plan de EXPLAIN de una consulta (sin ejecutarla)"""
+    with neo4j_session() as session:
+        summary = session.run(f"EXPLAIN {query}", params or {}).consume()
+    return summary.plan
+
+
+def plan_operators(plan):
+    """Lista los operadores de un plan, recorriendo todos sus hijos"""
+    if not plan:
+        return []
+    operators = [plan['operatorType'].split('@')[0]]
+    for child in plan.get('children', []):
+        operators.extend(plan_operators(child))
+    return operators
+
+
+def scanning_hot_queries():
+    """Retorna {nombre: operadores de scan} para las consultas frecuentes que no usan índice"""
+    scans = {}
+    for name, query in HOT_QUERIES.items():
+        operators = plan_operators(explain_plan(query, HOT_QUERY_PARAMS))
+        found = [op for op in operators if op in SCAN_OPERATORS]
+        if found:
+            scans[name] = found
+    return scans
+
+
+def ensure_schema(timeout=300):
+    """
+    Instala el esquema y verifica que las consultas frecuentes usen índices
+    Lanza SchemaError si algo falta
+    """
+    install_schema(timeout)
+    missing = missing_schema()
+    if missing:
+        raise SchemaError(f"Esquema de Neo4j incompleto: {', '.join(missing)}")
+    scans = scanning_hot_queries()
+    if scans:
+        detail = ', '.join(f"{name} ({', '.join(ops)})" for name, ops in scans.items())
+        raise SchemaError(f"Consultas frecuentes sin índice: {detail}")
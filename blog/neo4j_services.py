@@ -2,14 +2,69 @@
 Servicios para interactuar con Neo4j
 Proporciona funciones de alto nivel para operaciones de la red social
 """
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import List, Dict, Optional
-from neomodel import db
+from django.conf import settings
 from .neo4j_models import UserNode, PostNode, CommentNode, InterestNode
-from . import neo4j_connection  # Importar para inicializar conexión
+from neo4j import READ_ACCESS
+from .neo4j_connection import cypher_query
+from . import analytics_cache, engagement, recommendations, trending, neo4j_request_cache as request_cache
 import re
 
 
+# Consultas de lectura que también usan los servicios asíncronos
+# (neo4j_async_services): se definen una sola vez para que no diverjan
+FOLLOWED_IDS_QUERY = """
+MATCH (target:UserNode)
+WHERE target.user_id IN $target_ids
+MATCH (u:UserNode {user_id: $user_id})
+WHERE (u)-[:FOLLOWS]->(target)
+RETURN target.user_id
+"""
+
+USER_INTERESTS_QUERY = """
+MATCH (:UserNode {user_id: $user_id})-[:INTERESTED_IN]->(i:InterestNode)
+RETURN i
+"""
+
+SUGGEST_USERS_TO_FOLLOW_QUERY = """
+MATCH (u:UserNode {user_id: $user_id})-[:INTERESTED_IN]->(i:InterestNode)<-[:INTERESTED_IN]-(suggestion)
+WHERE NOT (u)-[:FOLLOWS]->(suggestion) AND u <> suggestion
+WITH suggestion, count(DISTINCT i) as common_interests
+RETURN suggestion.user_id, common_interests
+ORDER BY common_interests DESC
+LIMIT $limit
+"""
+
+INFLUENCERS_QUERY = """
+MATCH (u:UserNode)<-[:FOLLOWS]-(follower)
+WITH u, count(follower) as follower_count
+RETURN u, follower_count
+ORDER BY follower_count DESC
+LIMIT $limit
+"""
+
+USER_NETWORK_STATS_QUERY = """
+MATCH (u:UserNode {user_id: $user_id})
+RETURN
+    coalesce(u.following_count, 0) as following_count,
+    coalesce(u.followers_count, 0) as followers_count,
+    coalesce(u.friends_count, 0) as friends_count,
+    coalesce(u.posts_count, 0) as posts_count,
+    coalesce(u.interests_count, 0) as interests_count
+"""
+
+
+def _extract_hashtags(content: str) -> List[str]:
+    """Extrae los hashtags de un texto en minúsculas y sin duplicados, conservando el orden"""
+    return list(dict.fromkeys(tag.lower() for tag in re.findall(r"#(\w+)", content)))
+
+
+def _now_timestamp() -> float:
+    """Fecha actual en el formato de DateTimeProperty de neomodel (epoch UTC)"""
+    return datetime.now(timezone.utc).timestamp()
+
+
 class Neo4jUserService:
     """Servicios relacionados con usuarios"""
     
@@ -18,34 +73,48 @@ class Neo4jUserService:
                              first_name: str = '', last_name: str = '', bio: str = ''):
         """
         Crea o actualiza un usuario en Neo4j
+        Solo escribe los datos del perfil, sin tocar los contadores de la red
+        """
+        query = """
+        MERGE (u:UserNode {user_id: $user_id})
+        ON CREATE SET u.date_joined = $now,
+                      u.following_count = 0, u.followers_count = 0, u.friends_count = 0,
+                      u.posts_count = 0, u.interests_count = 0
+        SET u.username = $username, u.email = $email,
+            u.first_name = $first_name, u.last_name = $last_name, u.bio = $bio
+        RETURN u
         """
         try:
-            user = UserNode.nodes.get_or_none(user_id=user_id)
-            if user:
-                user.username = username
-                user.email = email
-                user.first_name = first_name
-                user.last_name = last_name
-                user.bio = bio
-                user.save()
-            else:
-                user = UserNode(
-                    user_id=user_id,
-                    username=username,
-                    email=email,
-                    first_name=first_name,
-                    last_name=last_name,
-                    bio=bio
-                ).save()
-            return user
+            results, meta = cypher_query(query, {
+                'user_id': user_id,
+                'username': username,
+                'email': email,
+                'first_name': first_name,
+                'last_name': last_name,
+                'bio': bio,
+                'now': _now_timestamp()
+            })
+            return UserNode.inflate(results[0][0]) if results else None
         except Exception as e:
             print(f"Error creando/actualizando usuario: {e}")
             return None
     
     @staticmethod
     def get_user_by_id(user_id: int):
-        """Obtiene un usuario por su ID"""
-        return UserNode.nodes.get_or_none(user_id=user_id)
+        """
+        Obtiene un usuario por su ID
+        Dentro de una petición retorna siempre la misma instancia
+        """
+        return request_cache.identity('UserNode', user_id, lambda: Neo4jUserService._load_user(user_id))
+    
+    @staticmethod
+    def _load_user(user_id: int):
+        query = """
+        MATCH (u:UserNode {user_id: $user_id})
+        RETURN u
+        """
+        results, meta = cypher_query(query, {'user_id': user_id}, access_mode=READ_ACCESS)
+        return UserNode.inflate(results[0][0]) if results else None
     
     @staticmethod
     def get_user_by_username(username: str):
@@ -54,82 +123,181 @@ class Neo4jUserService:
     
     @staticmethod
     def delete_user(user_id: int):
-        """Elimina un usuario y todas sus relaciones"""
-        user = UserNode.nodes.get_or_none(user_id=user_id)
-        if user:
-            user.delete()
-            return True
-        return False
+        """
+        Elimina un usuario y todas sus relaciones
+        Descuenta los contadores de los usuarios conectados con él
+        """
+        query = """
+        MATCH (u:UserNode {user_id: $user_id})
+        CALL {
+            WITH u
+            MATCH (u)-[:FOLLOWS]->(followed:UserNode)
+            SET followed.followers_count = CASE WHEN followed.followers_count > 0 THEN followed.followers_count - 1 ELSE 0 END
+        }
+        CALL {
+            WITH u
+            MATCH (u)<-[:FOLLOWS]-(follower:UserNode)
+            SET follower.following_count = CASE WHEN follower.following_count > 0 THEN follower.following_count - 1 ELSE 0 END
+        }
+        CALL {
+            WITH u
+            MATCH (u)-[:FRIEND_OF]->(friend:UserNode)-[:FRIEND_OF]->(u)
+            SET friend.friends_count = CASE WHEN friend.friends_count > 0 THEN friend.friends_count - 1 ELSE 0 END
+        }
+        DETACH DELETE u
+        RETURN count(*) > 0
+        """
+        results, meta = cypher_query(query, {'user_id': user_id})
+        return bool(results and results[0][0])
     
     @staticmethod
     def follow_user(follower_id: int, followed_id: int):
         """Un usuario sigue a otro"""
-        follower = UserNode.nodes.get_or_none(user_id=follower_id)
-        followed = UserNode.nodes.get_or_none(user_id=followed_id)
-        
-        if follower and followed:
-            follower.following.connect(followed)
+        query = """
+        MATCH (follower:UserNode {user_id: $follower_id})
+        MATCH (followed:UserNode {user_id: $followed_id})
+        OPTIONAL MATCH (follower)-[existing:FOLLOWS]->(followed)
+        FOREACH (_ IN CASE WHEN existing IS NULL THEN [1] ELSE [] END |
+            CREATE (follower)-[:FOLLOWS]->(followed)
+            SET follower.following_count = coalesce(follower.following_count, 0) + 1,
+                followed.followers_count = coalesce(followed.followers_count, 0) + 1
+        )
+        RETURN coalesce(followed.followers_count, 0), coalesce(followed.pull_based, false)
+        """
+        results, meta = cypher_query(query, {'follower_id': follower_id, 'followed_id': followed_id})
+        if results:
+            followers_count, pull_based = results[0]
+            Neo4jTimelineService.update_fanout_mode(followed_id, pull_based, followers_count)
+            # Copiar los posts recientes del seguido al timeline del seguidor
+            Neo4jTimelineService.backfill(follower_id, followed_id)
+            recommendations.discard(follower_id, followed_id, 'follow')
+            analytics_cache.invalidate_user(follower_id)
             return True
         return False
     
     @staticmethod
     def unfollow_user(follower_id: int, followed_id: int):
         """Un usuario deja de seguir a otro"""
-        follower = UserNode.nodes.get_or_none(user_id=follower_id)
-        followed = UserNode.nodes.get_or_none(user_id=followed_id)
-        
-        if follower and followed:
-            follower.following.disconnect(followed)
+        query = """
+        MATCH (follower:UserNode {user_id: $follower_id})
+        MATCH (followed:UserNode {user_id: $followed_id})
+        OPTIONAL MATCH (follower)-[existing:FOLLOWS]->(followed)
+        WITH follower, followed, collect(existing) AS edges
+        FOREACH (_ IN CASE WHEN size(edges) > 0 THEN [1] ELSE [] END |
+            SET follower.following_count = CASE WHEN follower.following_count > 0 THEN follower.following_count - 1 ELSE 0 END,
+                followed.followers_count = CASE WHEN followed.followers_count > 0 THEN followed.followers_count - 1 ELSE 0 END
+        )
+        FOREACH (edge IN edges | DELETE edge)
+        RETURN coalesce(followed.followers_count, 0), coalesce(followed.pull_based, false)
+        """
+        results, meta = cypher_query(query, {'follower_id': follower_id, 'followed_id': followed_id})
+        if results:
+            followers_count, pull_based = results[0]
+            Neo4jTimelineService.update_fanout_mode(followed_id, pull_based, followers_count)
+            # Quitar del timeline del seguidor los posts del usuario
+            Neo4jTimelineService.prune(follower_id, followed_id)
+            analytics_cache.invalidate_user(follower_id)
             return True
         return False
     
     @staticmethod
     def add_friend(user1_id: int, user2_id: int):
-        """Agrega una relación de amistad bidireccional"""
-        user1 = UserNode.nodes.get_or_none(user_id=user1_id)
-        user2 = UserNode.nodes.get_or_none(user_id=user2_id)
-        
-        if user1 and user2:
-            user1.friends.connect(user2)
-            user2.friends.connect(user1)
+        """
+        Agrega una relación de amistad bidireccional
+        Los contadores solo suben si faltaba alguna de las dos direcciones:
+        una amistad a medias (datos antiguos) no se había contado
+        """
+        query = """
+        MATCH (user1:UserNode {user_id: $user1_id})
+        MATCH (user2:UserNode {user_id: $user2_id})
+        WITH user1, user2,
+             EXISTS { (user1)-[:FRIEND_OF]->(user2) } AND EXISTS { (user2)-[:FRIEND_OF]->(user1) } AS were_friends
+        MERGE (user1)-[:FRIEND_OF]->(user2)
+        MERGE (user2)-[:FRIEND_OF]->(user1)
+        FOREACH (_ IN CASE WHEN were_friends THEN [] ELSE [1] END |
+            SET user1.friends_count = coalesce(user1.friends_count, 0) + 1,
+                user2.friends_count = coalesce(user2.friends_count, 0) + 1
+        )
+        RETURN count(*) > 0
+        """
+        results, meta = cypher_query(query, {'user1_id': user1_id, 'user2_id': user2_id})
+        if results and results[0][0]:
+            recommendations.discard(user1_id, user2_id, 'friends')
+            recommendations.discard(user2_id, user1_id, 'friends')
             return True
         return False
     
     @staticmethod
     def remove_friend(user1_id: int, user2_id: int):
-        """Elimina una relación de amistad"""
-        user1 = UserNode.nodes.get_or_none(user_id=user1_id)
-        user2 = UserNode.nodes.get_or_none(user_id=user2_id)
-        
-        if user1 and user2:
-            user1.friends.disconnect(user2)
-            user2.friends.disconnect(user1)
-            return True
-        return False
+        """
+        Elimina una relación de amistad
+        Los contadores solo bajan si existían las dos direcciones
+        """
+        query = """
+        MATCH (user1:UserNode {user_id: $user1_id})
+        MATCH (user2:UserNode {user_id: $user2_id})
+        WITH user1, user2,
+             EXISTS { (user1)-[:FRIEND_OF]->(user2) } AND EXISTS { (user2)-[:FRIEND_OF]->(user1) } AS were_friends
+        OPTIONAL MATCH (user1)-[edge:FRIEND_OF]-(user2)
+        WITH user1, user2, were_friends, collect(edge) AS edges
+        FOREACH (_ IN CASE WHEN were_friends THEN [1] ELSE [] END |
+            SET user1.friends_count = CASE WHEN user1.friends_count > 0 THEN user1.friends_count - 1 ELSE 0 END,
+                user2.friends_count = CASE WHEN user2.friends_count > 0 THEN user2.friends_count - 1 ELSE 0 END
+        )
+        FOREACH (edge IN edges | DELETE edge)
+        RETURN count(*) > 0
+        """
+        results, meta = cypher_query(query, {'user1_id': user1_id, 'user2_id': user2_id})
+        return bool(results and results[0][0])
     
     @staticmethod
     def get_followers(user_id: int):
         """Obtiene la lista de seguidores de un usuario"""
-        user = UserNode.nodes.get_or_none(user_id=user_id)
-        if user:
-            return user.followers.all()
-        return []
+        query = """
+        MATCH (:UserNode {user_id: $user_id})<-[:FOLLOWS]-(follower:UserNode)
+        RETURN follower
+        """
+        results, meta = cypher_query(query, {'user_id': user_id}, access_mode=READ_ACCESS)
+        return [UserNode.inflate(row[0]) for row in results]
     
     @staticmethod
     def get_following(user_id: int):
         """Obtiene la lista de usuarios que sigue un usuario"""
-        user = UserNode.nodes.get_or_none(user_id=user_id)
-        if user:
-            return user.following.all()
-        return []
+        query = """
+        MATCH (:UserNode {user_id: $user_id})-[:FOLLOWS]->(followed:UserNode)
+        RETURN followed
+        """
+        results, meta = cypher_query(query, {'user_id': user_id}, access_mode=READ_ACCESS)
+        return [UserNode.inflate(row[0]) for row in results]
+    
+    @staticmethod
+    def get_followed_ids(follower_id: int, target_ids):
+        """
+        Retorna el subconjunto de `target_ids` que el usuario sigue
+        El costo depende del número de ids consultados, no de cuántos
+        usuarios sigue en total
+        """
+        target_ids = list(set(target_ids))
+        if not target_ids:
+            return set()
+        query = FOLLOWED_IDS_QUERY
+        results, meta = cypher_query(query, {'user_id': follower_id, 'target_ids': target_ids}, access_mode=READ_ACCESS)
+        return {row[0] for row in results}
+    
+    @staticmethod
+    def is_following(follower_id: int, followed_id: int):
+        """Verifica si un usuario sigue a otro"""
+        return followed_id in Neo4jUserService.get_followed_ids(follower_id, [followed_id])
     
     @staticmethod
     def get_friends(user_id: int):
         """Obtiene la lista de amigos de un usuario"""
-        user = UserNode.nodes.get_or_none(user_id=user_id)
-        if user:
-            return user.friends.all()
-        return []
+        query = """
+        MATCH (:UserNode {user_id: $user_id})-[:FRIEND_OF]->(friend:UserNode)
+        RETURN friend
+        """
+        results, meta = cypher_query(query, {'user_id': user_id}, access_mode=READ_ACCESS)
+        return [UserNode.inflate(row[0]) for row in results]
 
 
 class Neo4jPostService:
@@ -140,68 +308,75 @@ class Neo4jPostService:
         """
         Crea una publicación y la conecta con su autor
         También extrae y asocia hashtags
+        Todo se escribe en una sola consulta, sin importar cuántos hashtags tenga
+        """
+        query = """
+        MATCH (u:UserNode {user_id: $user_id})
+        MERGE (p:PostNode {post_id: $post_id})
+        ON CREATE SET p.content = $content, p.created_at = $now, p.updated_at = $now,
+                      u.posts_count = coalesce(u.posts_count, 0) + 1
+        MERGE (u)-[:POSTED]->(p)
+        FOREACH (tag_name IN $tags |
+            MERGE (i:InterestNode {name: tag_name})
+            ON CREATE SET i.description = '', i.created_at = $now
+            MERGE (p)-[:TAGGED_WITH]->(i)
+        )
+        RETURN p
         """
         try:
-            user = UserNode.nodes.get_or_none(user_id=user_id)
-            if not user:
-                return None
-            
-            post = PostNode(
-                post_id=post_id,
-                content=content
-            ).save()
-            
-            # Conectar el post con su autor
-            user.posts.connect(post)
-            
-            # Extraer y asociar hashtags
-            hashtags = re.findall(r"#(\w+)", content)
-            for tag_name in hashtags:
-                tag_name = tag_name.lower()
-                interest = InterestNode.nodes.get_or_none(name=tag_name)
-                if not interest:
-                    interest = InterestNode(name=tag_name).save()
-                post.tags.connect(interest)
-            
-            return post
+            results, meta = cypher_query(query, {
+                'user_id': user_id,
+                'post_id': post_id,
+                'content': content,
+                'tags': _extract_hashtags(content),
+                'now': _now_timestamp()
+            })
+            return PostNode.inflate(results[0][0]) if results else None
         except Exception as e:
             print(f"Error creando post: {e}")
             return None
     
     @staticmethod
     def update_post(post_id: int, content: str):
-        """Actualiza el contenido de una publicación"""
-        post = PostNode.nodes.get_or_none(post_id=post_id)
-        if post:
-            post.content = content
-            post.updated_at = datetime.now()
-            post.save()
-            
-            # Actualizar hashtags
-            # Primero eliminar los existentes
-            for tag in post.tags.all():
-                post.tags.disconnect(tag)
-            
-            # Luego agregar los nuevos
-            hashtags = re.findall(r"#(\w+)", content)
-            for tag_name in hashtags:
-                tag_name = tag_name.lower()
-                interest = InterestNode.nodes.get_or_none(name=tag_name)
-                if not interest:
-                    interest = InterestNode(name=tag_name).save()
-                post.tags.connect(interest)
-            
-            return post
-        return None
+        """
+        Actualiza el contenido de una publicación
+        Solo elimina las etiquetas que ya no están y crea las nuevas
+        """
+        query = """
+        MATCH (p:PostNode {post_id: $post_id})
+        SET p.content = $content, p.updated_at = $now
+        WITH p
+        OPTIONAL MATCH (p)-[old:TAGGED_WITH]->(i:InterestNode)
+        WHERE NOT i.name IN $tags
+        DELETE old
+        WITH DISTINCT p
+        FOREACH (tag_name IN $tags |
+            MERGE (i:InterestNode {name: tag_name})
+            ON CREATE SET i.description = '', i.created_at = $now
+            MERGE (p)-[:TAGGED_WITH]->(i)
+        )
+        RETURN p
+        """
+        results, meta = cypher_query(query, {
+            'post_id': post_id,
+            'content': content,
+            'tags': _extract_hashtags(content),
+            'now': _now_timestamp()
+        })
+        return PostNode.inflate(results[0][0]) if results else None
     
     @staticmethod
     def delete_post(post_id: int):
-        """Elimina una publicación"""
-        post = PostNode.nodes.get_or_none(post_id=post_id)
-        if post:
-            post.delete()
-            return True
-        return False
+        """Elimina una publicación y descuenta el contador de su autor"""
+        query = """
+        MATCH (p:PostNode {post_id: $post_id})
+        OPTIONAL MATCH (author:UserNode)-[:POSTED]->(p)
+        SET author.posts_count = CASE WHEN author.posts_count > 0 THEN author.posts_count - 1 ELSE 0 END
+        DETACH DELETE p
+        RETURN count(*) > 0
+        """
+        results, meta = cypher_query(query, {'post_id': post_id})
+        return bool(results and results[0][0])
     
     @staticmethod
     def get_post_by_id(post_id: int):
@@ -217,61 +392,62 @@ class Neo4jPostService:
         ORDER BY p.created_at DESC
         LIMIT $limit
         """
-        results, meta = db.cypher_query(query, {'user_id': user_id, 'limit': limit})
+        results, meta = cypher_query(query, {'user_id': user_id, 'limit': limit}, access_mode=READ_ACCESS)
         return [PostNode.inflate(row[0]) for row in results]
     
     @staticmethod
     def get_all_posts(limit: int = 50):
         """Obtiene todas las publicaciones ordenadas por fecha"""
+        # El filtro IS NOT NULL permite que el índice de created_at resuelva el ORDER BY ... LIMIT
         query = """
         MATCH (p:PostNode)
+        WHERE p.created_at IS NOT NULL
         RETURN p
         ORDER BY p.created_at DESC
         LIMIT $limit
         """
-        results, meta = db.cypher_query(query, {'limit': limit})
+        results, meta = cypher_query(query, {'limit': limit}, access_mode=READ_ACCESS)
         return [PostNode.inflate(row[0]) for row in results]
     
     @staticmethod
     def get_feed_posts(user_id: int, limit: int = 50):
         """
         Obtiene el feed de un usuario (posts de quien sigue + propios)
+        Lee el timeline materializado, por lo que el costo no depende
+        del número de seguidos ni del historial de publicaciones
         """
-        query = """
-        MATCH (u:UserNode {user_id: $user_id})
-        OPTIONAL MATCH (u)-[:FOLLOWS]->(followed:UserNode)-[:POSTED]->(p:PostNode)
-        OPTIONAL MATCH (u)-[:POSTED]->(own_post:PostNode)
-        WITH collect(DISTINCT p) + collect(DISTINCT own_post) as all_posts
-        UNWIND all_posts as post
-        WHERE post IS NOT NULL
-        RETURN post
-        ORDER BY post.created_at DESC
-        LIMIT $limit
-        """
-        results, meta = db.cypher_query(query, {'user_id': user_id, 'limit': limit})
-        return [PostNode.inflate(row[0]) for row in results]
+        posts = Neo4jTimelineService.read_timeline(user_id, limit)
+        if posts is None:
+            # El timeline aún no existe: se construye una sola vez. La lectura lleva
+            # los bookmarks de esta escritura, así que una réplica no lo ve vacío
+            Neo4jTimelineService.rebuild_timeline(user_id)
+            posts = Neo4jTimelineService.read_timeline(user_id, limit) or []
+        return posts
     
     @staticmethod
     def like_post(user_id: int, post_id: int):
-        """Un usuario da like a una publicación"""
-        user = UserNode.nodes.get_or_none(user_id=user_id)
-        post = PostNode.nodes.get_or_none(post_id=post_id)
-        
-        if user and post:
-            user.liked_posts.connect(post)
-            return True
-        return False
+        """Un usuario da like a una publicación (una sola consulta, idempotente)"""
+        query = """
+        MATCH (u:UserNode {user_id: $user_id})
+        MATCH (p:PostNode {post_id: $post_id})
+        MERGE (u)-[:LIKES]->(p)
+        RETURN count(p) > 0
+        """
+        results, meta = cypher_query(query, {'user_id': user_id, 'post_id': post_id})
+        return bool(results and results[0][0])
     
     @staticmethod
     def unlike_post(user_id: int, post_id: int):
-        """Un usuario quita el like de una publicación"""
-        user = UserNode.nodes.get_or_none(user_id=user_id)
-        post = PostNode.nodes.get_or_none(post_id=post_id)
-        
-        if user and post:
-            user.liked_posts.disconnect(post)
-            return True
-        return False
+        """Un usuario quita el like de una publicación (una sola consulta)"""
+        query = """
+        MATCH (u:UserNode {user_id: $user_id})
+        MATCH (p:PostNode {post_id: $post_id})
+        OPTIONAL MATCH (u)-[r:LIKES]->(p)
+        DELETE r
+        RETURN count(p) > 0
+        """
+        results, meta = cypher_query(query, {'user_id': user_id, 'post_id': post_id})
+        return bool(results and results[0][0])
     
     @staticmethod
     def get_post_likes_count(post_id: int):
@@ -280,7 +456,7 @@ class Neo4jPostService:
         MATCH (u:UserNode)-[:LIKES]->(p:PostNode {post_id: $post_id})
         RETURN count(u) as likes_count
         """
-        results, meta = db.cypher_query(query, {'post_id': post_id})
+        results, meta = cypher_query(query, {'post_id': post_id}, access_mode=READ_ACCESS)
         return results[0][0] if results else 0
     
     @staticmethod
@@ -290,33 +466,304 @@ class Neo4jPostService:
         MATCH (u:UserNode {user_id: $user_id})-[:LIKES]->(p:PostNode {post_id: $post_id})
         RETURN count(*) > 0 as has_liked
         """
-        results, meta = db.cypher_query(query, {'user_id': user_id, 'post_id': post_id})
+        results, meta = cypher_query(query, {'user_id': user_id, 'post_id': post_id}, access_mode=READ_ACCESS)
         return results[0][0] if results else False
 
 
+class Neo4jTimelineService:
+    """
+    Timelines materializados (fan-out on write)
+    
+    Cada UserNode guarda en la propiedad `timeline` una lista acotada de
+    post_ids ordenada del más reciente al más antiguo. Los post_ids son
+    autoincrementales, así que ordenar por id equivale a ordenar por fecha.
+    Un timeline en NULL significa que aún no se ha materializado y se
+    construye en la primera lectura.
+    
+    Modo híbrido: los autores con muchos seguidores no hacen fan-out. Sus
+    posts se guardan solo en la propiedad `recent_posts` del autor y se
+    mezclan con el timeline del lector al momento de leerlo. El modo se
+    guarda en la propiedad `pull_based` del autor y se recalcula en cada
+    follow/unfollow a partir de `followers_count`, con histéresis: pasa a
+    pull al llegar a FEED_FANOUT_FOLLOWER_THRESHOLD y vuelve a push al bajar
+    de FEED_FANOUT_RELEASE_THRESHOLD. Al cambiar de modo se migran una vez
+    los timelines de sus seguidores (ver switch_to_pull y switch_to_push).
+    """
+    
+    @staticmethod
+    def _max_length():
+        return getattr(settings, 'FEED_TIMELINE_MAX_LENGTH', 800)
+    
+    @staticmethod
+    def _backfill_count():
+        return getattr(settings, 'FEED_BACKFILL_COUNT', 50)
+    
+    @staticmethod
+    def _fanout_threshold():
+        return getattr(settings, 'FEED_FANOUT_FOLLOWER_THRESHOLD', 1000)
+    
+    @staticmethod
+    def _release_threshold():
+        return getattr(settings, 'FEED_FANOUT_RELEASE_THRESHOLD', int(Neo4jTimelineService._fanout_threshold() * 0.9))
+    
+    @staticmethod
+    def next_pull_based(pull_based: bool, followers_count: int) -> bool:
+        """
+        Modo que le corresponde a un autor según sus seguidores
+        Entre los dos umbrales conserva el modo actual, así que un autor
+        cerca del límite no cambia de modo con cada follow/unfollow
+        """
+        if pull_based:
+            return followers_count >= Neo4jTimelineService._release_threshold()
+        return followers_count >= Neo4jTimelineService._fanout_threshold()
+    
+    @staticmethod
+    def update_fanout_mode(author_id: int, pull_based: bool, followers_count: int):
+        """
+        Cambia el modo del autor si cruzó un umbral
+        Retorna el modo resultante
+        """
+        target = Neo4jTimelineService.next_pull_based(pull_based, followers_count)
+        if target != pull_based:
+            if target:
+                Neo4jTimelineService.switch_to_pull(author_id)
+            else:
+                Neo4jTimelineService.switch_to_push(author_id)
+        return target
+    
+    @staticmethod
+    def switch_to_pull(author_id: int):
+        """
+        Pasa un autor a modo pull
+        Sus posts recientes se leerán de `recent_posts`, así que se quitan de
+        los timelines de sus seguidores para no ocupar dos veces el espacio
+        """
+        query = """
+        MATCH (author:UserNode {user_id: $author_id})
+        SET author.pull_based = true
+        WITH author, coalesce(author.recent_posts, []) AS recent
+        OPTIONAL MATCH (author)<-[:FOLLOWS]-(follower:UserNode)
+        WHERE follower.timeline IS NOT NULL
+        SET follower.timeline = [pid IN follower.timeline WHERE NOT pid IN recent]
+        RETURN count(follower)
+        """
+        results, meta = cypher_query(query, {'author_id': author_id})
+        return results[0][0] if results else 0
+    
+    @staticmethod
+    def switch_to_push(author_id: int):
+        """
+        Pasa un autor a modo push
+        Los posts de la etapa pull nunca se distribuyeron: se copian ahora sus
+        posts recientes a los timelines materializados de sus seguidores
+        """
+        query = """
+        MATCH (author:UserNode {user_id: $author_id})
+        SET author.pull_based = false
+        WITH author, coalesce(author.recent_posts, []) AS recent
+        MATCH (author)<-[:FOLLOWS]-(follower:UserNode)
+        WHERE follower.timeline IS NOT NULL
+        CALL {
+            WITH follower, recent
+            UNWIND follower.timeline + recent AS pid
+            WITH pid
+            ORDER BY pid DESC
+            RETURN collect(DISTINCT pid) AS merged
+        }
+        SET follower.timeline = merged[0..$max_length]
+        RETURN count(follower)
+        """
+        results, meta = cypher_query(query, {
+            'author_id': author_id,
+            'max_length': Neo4jTimelineService._max_length()
+        })
+        return results[0][0] if results else 0
+    
+    @staticmethod
+    def _recent_posts_size():
+        return getattr(settings, 'FEED_RECENT_POSTS_SIZE', 20)
+    
+    @staticmethod
+    def fan_out_post(post_id: int, author_id: int):
+        """
+        Inserta un post nuevo en el timeline del autor y de sus seguidores
+        Si el autor está en modo pull solo se actualiza su caché
+        de posts recientes, evitando miles de escrituras por publicación.
+        Los timelines no materializados se omiten: se construirán completos
+        en su primera lectura
+        Retorna el número de timelines actualizados, o None si falló
+        """
+        query = """
+        MATCH (author:UserNode {user_id: $author_id})
+        SET author.recent_posts = ([$post_id] + [pid IN coalesce(author.recent_posts, []) WHERE pid <> $post_id])[0..$recent_size]
+        WITH author, coalesce(author.pull_based, false) AS pull_based
+        CALL {
+            WITH author, pull_based
+            WITH author WHERE NOT pull_based
+            MATCH (author)<-[:FOLLOWS]-(follower:UserNode)
+            WHERE follower.timeline IS NOT NULL
+            RETURN collect(follower) AS followers
+        }
+        WITH author, followers + [author] AS owners
+        UNWIND owners AS owner
+        WITH DISTINCT owner
+        WHERE owner.timeline IS NOT NULL
+        SET owner.timeline = ([$post_id] + [pid IN owner.timeline WHERE pid <> $post_id])[0..$max_length]
+        RETURN count(owner)
+        """
+        try:
+            results, meta = cypher_query(query, {
+                'author_id': author_id,
+                'post_id': post_id,
+                'recent_size': Neo4jTimelineService._recent_posts_size(),
+                'max_length': Neo4jTimelineService._max_length()
+            })
+            return results[0][0] if results else 0
+        except Exception as e:
+            print(f"Error distribuyendo post {post_id} a los timelines: {e}")
+            return None
+    
+    @staticmethod
+    def backfill(follower_id: int, followed_id: int):
+        """Agrega los posts recientes de un usuario recién seguido al timeline del seguidor"""
+        query = """
+        MATCH (follower:UserNode {user_id: $follower_id})
+        WHERE follower.timeline IS NOT NULL
+        MATCH (followed:UserNode {user_id: $followed_id})
+        WHERE NOT coalesce(followed.pull_based, false)
+        CALL {
+            WITH followed
+            MATCH (followed)-[:POSTED]->(p:PostNode)
+            RETURN p.post_id AS recent_id
+            ORDER BY p.created_at DESC
+            LIMIT $backfill_count
+        }
+        WITH follower, collect(recent_id) AS recent
+        UNWIND follower.timeline + recent AS pid
+        WITH follower, pid
+        ORDER BY pid DESC
+        WITH follower, collect(DISTINCT pid) AS merged
+        SET follower.timeline = merged[0..$max_length]
+        """
+        try:
+            cypher_query(query, {
+                'follower_id': follower_id,
+                'followed_id': followed_id,
+                'backfill_count': Neo4jTimelineService._backfill_count(),
+                'max_length': Neo4jTimelineService._max_length()
+            })
+            return True
+        except Exception as e:
+            print(f"Error completando timeline de {follower_id}: {e}")
+            return False
+    
+    @staticmethod
+    def prune(follower_id: int, followed_id: int):
+        """Elimina del timeline del seguidor los posts del usuario que dejó de seguir"""
+        query = """
+        MATCH (follower:UserNode {user_id: $follower_id})
+        WHERE follower.timeline IS NOT NULL
+        MATCH (followed:UserNode {user_id: $followed_id})
+        SET follower.timeline = [
+            pid IN follower.timeline
+            WHERE NOT EXISTS { MATCH (followed)-[:POSTED]->(:PostNode {post_id: pid}) }
+        ]
+        """
+        try:
+            cypher_query(query, {'follower_id': follower_id, 'followed_id': followed_id})
+            return True
+        except Exception as e:
+            print(f"Error depurando timeline de {follower_id}: {e}")
+            return False
+    
+    @staticmethod
+    def rebuild_timeline(user_id: int):
+        """
+        Reconstruye el timeline de un usuario desde el grafo
+        Toma los posts más recientes de cada usuario seguido (excepto los
+        que no hacen fan-out) y los propios
+        """
+        query = """
+        MATCH (u:UserNode {user_id: $user_id})
+        SET u.timeline = []
+        WITH u
+        OPTIONAL MATCH (u)-[:FOLLOWS]->(followed:UserNode)
+        WHERE NOT coalesce(followed.pull_based, false)
+        WITH u, collect(followed) + [u] AS authors
+        UNWIND authors AS author
+        CALL {
+            WITH author
+            MATCH (author)-[:POSTED]->(p:PostNode)
+            RETURN p.post_id AS pid
+            ORDER BY p.created_at DESC
+            LIMIT $backfill_count
+        }
+        WITH u, pid
+        ORDER BY pid DESC
+        WITH u, collect(DISTINCT pid) AS merged
+        SET u.timeline = merged[0..$max_length]
+        """
+        cypher_query(query, {
+            'user_id': user_id,
+            'backfill_count': Neo4jTimelineService._backfill_count(),
+            'max_length': Neo4jTimelineService._max_length()
+        })
+    
+    @staticmethod
+    def read_timeline(user_id: int, limit: int = 50):
+        """
+        Lee los primeros `limit` posts del timeline de un usuario, mezclando
+        los posts recientes de los autores seguidos que no hacen fan-out
+        Retorna None si el timeline todavía no se ha materializado
+        """
+        query = """
+        MATCH (u:UserNode {user_id: $user_id})
+        CALL {
+            WITH u
+            OPTIONAL MATCH (u)-[:FOLLOWS]->(popular:UserNode)
+            WHERE popular.pull_based = true
+            RETURN reduce(ids = [], recent IN collect(coalesce(popular.recent_posts, [])) | ids + recent) AS pulled
+        }
+        WITH u, coalesce(u.timeline, [])[0..$limit] + pulled AS candidate_ids
+        OPTIONAL MATCH (p:PostNode)
+        WHERE p.post_id IN candidate_ids
+        RETURN u.timeline IS NOT NULL AS materialized, p
+        ORDER BY p.created_at DESC
+        LIMIT $limit
+        """
+        results, meta = cypher_query(query, {
+            'user_id': user_id,
+            'limit': limit
+        }, access_mode=READ_ACCESS)
+        if not results or not results[0][0]:
+            return None
+        return [PostNode.inflate(row[1]) for row in results if row[1] is not None]
+
+
 class Neo4jCommentService:
     """Servicios relacionados con comentarios"""
     
     @staticmethod
     def create_comment(comment_id: int, user_id: int, post_id: int, content: str):
-        """Crea un comentario en una publicación"""
+        """Crea un comentario en una publicación (idempotente, una sola consulta)"""
+        query = """
+        MATCH (u:UserNode {user_id: $user_id})
+        MATCH (p:PostNode {post_id: $post_id})
+        MERGE (c:CommentNode {comment_id: $comment_id})
+        ON CREATE SET c.content = $content, c.created_at = $now
+        MERGE (u)-[:COMMENTED]->(c)
+        MERGE (c)-[:COMMENT_ON]->(p)
+        RETURN c
+        """
         try:
-            user = UserNode.nodes.get_or_none(user_id=user_id)
-            post = PostNode.nodes.get_or_none(post_id=post_id)
-            
-            if not user or not post:
-                return None
-            
-            comment = CommentNode(
-                comment_id=comment_id,
-                content=content
-            ).save()
-            
-            # Conectar el comentario con su autor y el post
-            user.comments.connect(comment)
-            comment.post.connect(post)
-            
-            return comment
+            results, meta = cypher_query(query, {
+                'comment_id': comment_id,
+                'user_id': user_id,
+                'post_id': post_id,
+                'content': content,
+                'now': _now_timestamp()
+            })
+            return CommentNode.inflate(results[0][0]) if results else None
         except Exception as e:
             print(f"Error creando comentario: {e}")
             return None
@@ -338,7 +785,7 @@ class Neo4jCommentService:
         RETURN c
         ORDER BY c.created_at DESC
         """
-        results, meta = db.cypher_query(query, {'post_id': post_id})
+        results, meta = cypher_query(query, {'post_id': post_id}, access_mode=READ_ACCESS)
         return [CommentNode.inflate(row[0]) for row in results]
 
 
@@ -349,7 +796,7 @@ class Neo4jInterestService:
     def add_user_interest(user_id: int, interest_name: str):
         """Agrega un interés a un usuario"""
         try:
-            user = UserNode.nodes.get_or_none(user_id=user_id)
+            user = Neo4jUserService.get_user_by_id(user_id)
             
             # Si el usuario no existe en Neo4j, intentar crearlo desde Django
             if not user:
@@ -370,22 +817,34 @@ class Neo4jInterestService:
                     print(f"❌ Usuario con ID {user_id} no existe en Django")
                     return False
             
-            interest = InterestNode.nodes.get_or_none(name=interest_name.lower())
-            
-            if not interest:
-                interest = InterestNode(name=interest_name.lower()).save()
-                print(f"✅ Interés '{interest_name}' creado en Neo4j")
+            if not user:
+                return False
             
-            if user and interest:
-                # Verificar si ya existe la relación
-                if not user.interests.is_connected(interest):
-                    user.interests.connect(interest)
-                    print(f"✅ Interés '{interest_name}' agregado al usuario {user.username}")
-                    return True
-                else:
-                    print(f"⚠️ El usuario {user.username} ya tiene el interés '{interest_name}'")
-                    return True  # Retornar True porque técnicamente el interés está agregado
-            return False
+            # Crear el interés si no existe y conectarlo, actualizando el contador
+            query = """
+            MATCH (u:UserNode {user_id: $user_id})
+            MERGE (i:InterestNode {name: $name})
+            ON CREATE SET i.description = '', i.created_at = $now
+            WITH u, i, EXISTS { (u)-[:INTERESTED_IN]->(i) } AS already_connected
+            FOREACH (_ IN CASE WHEN already_connected THEN [] ELSE [1] END |
+                CREATE (u)-[:INTERESTED_IN]->(i)
+                SET u.interests_count = coalesce(u.interests_count, 0) + 1
+            )
+            RETURN already_connected
+            """
+            results, meta = cypher_query(query, {
+                'user_id': user_id,
+                'name': interest_name.lower(),
+                'now': _now_timestamp()
+            })
+            if not results:
+                return False
+            if results[0][0]:
+                print(f"⚠️ El usuario {user.username} ya tiene el interés '{interest_name}'")
+            else:
+                analytics_cache.invalidate_user(user_id)
+                print(f"✅ Interés '{interest_name}' agregado al usuario {user.username}")
+            return True  # Si ya existía, técnicamente el interés está agregado
         except Exception as e:
             print(f"❌ Error agregando interés: {str(e)}")
             import traceback
@@ -395,21 +854,29 @@ class Neo4jInterestService:
     @staticmethod
     def remove_user_interest(user_id: int, interest_name: str):
         """Elimina un interés de un usuario"""
-        user = UserNode.nodes.get_or_none(user_id=user_id)
-        interest = InterestNode.nodes.get_or_none(name=interest_name.lower())
-        
-        if user and interest:
-            user.interests.disconnect(interest)
+        query = """
+        MATCH (u:UserNode {user_id: $user_id})
+        MATCH (i:InterestNode {name: $name})
+        OPTIONAL MATCH (u)-[edge:INTERESTED_IN]->(i)
+        WITH u, collect(edge) AS edges
+        FOREACH (_ IN CASE WHEN size(edges) > 0 THEN [1] ELSE [] END |
+            SET u.interests_count = CASE WHEN u.interests_count > 0 THEN u.interests_count - 1 ELSE 0 END
+        )
+        FOREACH (edge IN edges | DELETE edge)
+        RETURN count(*) > 0
+        """
+        results, meta = cypher_query(query, {'user_id': user_id, 'name': interest_name.lower()})
+        if results and results[0][0]:
+            analytics_cache.invalidate_user(user_id)
             return True
         return False
     
     @staticmethod
     def get_user_interests(user_id: int):
         """Obtiene todos los intereses de un usuario"""
-        user = UserNode.nodes.get_or_none(user_id=user_id)
-        if user:
-            return user.interests.all()
-        return []
+        query = USER_INTERESTS_QUERY
+        results, meta = cypher_query(query, {'user_id': user_id}, access_mode=READ_ACCESS)
+        return [InterestNode.inflate(row[0]) for row in results]
     
     @staticmethod
     def get_posts_by_interest(interest_name: str, limit: int = 50):
@@ -420,8 +887,29 @@ class Neo4jInterestService:
         ORDER BY p.created_at DESC
         LIMIT $limit
         """
-        results, meta = db.cypher_query(query, {'interest_name': interest_name.lower(), 'limit': limit})
+        results, meta = cypher_query(query, {'interest_name': interest_name.lower(), 'limit': limit}, access_mode=READ_ACCESS)
         return [PostNode.inflate(row[0]) for row in results]
+    
+    @staticmethod
+    def get_posts_by_interest_with_authors(interest_name: str, limit: int = 50):
+        """
+        Igual que get_posts_by_interest, pero incluye el user_id del autor
+        de cada publicación en la misma consulta
+        """
+        query = """
+        MATCH (author:UserNode)-[:POSTED]->(p:PostNode)-[:TAGGED_WITH]->(i:InterestNode {name: $interest_name})
+        RETURN p, author.user_id
+        ORDER BY p.created_at DESC
+        LIMIT $limit
+        """
+        results, meta = cypher_query(query, {'interest_name': interest_name.lower(), 'limit': limit}, access_mode=READ_ACCESS)
+        return [
+            {
+                'post': PostNode.inflate(row[0]),
+                'author_id': row[1]
+            }
+            for row in results
+        ]
 
 
 class Neo4jAnalyticsService:
@@ -432,19 +920,23 @@ class Neo4jAnalyticsService:
         """
         Sugiere amigos basándose en amigos en común
         (Amigos de amigos que no son amigos del usuario)
+        Usa las sugerencias precalculadas y, si el usuario aún no tiene, las calcula en Neo4j
         """
+        precomputed = recommendations.friend_suggestions(user_id, limit)
+        if precomputed is not None:
+            return precomputed
         query = """
         MATCH (u:UserNode {user_id: $user_id})-[:FRIEND_OF]->(friend)-[:FRIEND_OF]->(suggestion)
         WHERE NOT (u)-[:FRIEND_OF]->(suggestion) AND u <> suggestion
         WITH suggestion, count(*) as common_friends
-        RETURN suggestion, common_friends
+        RETURN suggestion.user_id, common_friends
         ORDER BY common_friends DESC
         LIMIT $limit
         """
-        results, meta = db.cypher_query(query, {'user_id': user_id, 'limit': limit})
+        results, meta = cypher_query(query, {'user_id': user_id, 'limit': limit}, access_mode=READ_ACCESS)
         return [
             {
-                'user': UserNode.inflate(row[0]),
+                'user_id': row[0],
                 'common_friends': row[1]
             }
             for row in results
@@ -454,23 +946,24 @@ class Neo4jAnalyticsService:
     def suggest_users_to_follow(user_id: int, limit: int = 10):
         """
         Sugiere usuarios para seguir basándose en intereses comunes
+        Usa las sugerencias precalculadas (ver recommendations.py) y, si el
+        usuario aún no tiene, las calcula en Neo4j
+        El resultado se guarda en la caché de análisis, por usuario
         """
-        query = """
-        MATCH (u:UserNode {user_id: $user_id})-[:INTERESTED_IN]->(i:InterestNode)<-[:INTERESTED_IN]-(suggestion)
-        WHERE NOT (u)-[:FOLLOWS]->(suggestion) AND u <> suggestion
-        WITH suggestion, count(DISTINCT i) as common_interests
-        RETURN suggestion, common_interests
-        ORDER BY common_interests DESC
-        LIMIT $limit
-        """
-        results, meta = db.cypher_query(query, {'user_id': user_id, 'limit': limit})
-        return [
-            {
-                'user': UserNode.inflate(row[0]),
-                'common_interests': row[1]
-            }
-            for row in results
-        ]
+        def compute():
+            precomputed = recommendations.follow_suggestions(user_id, limit)
+            if precomputed is not None:
+                return precomputed
+            query = SUGGEST_USERS_TO_FOLLOW_QUERY
+            results, meta = cypher_query(query, {'user_id': user_id, 'limit': limit}, access_mode=READ_ACCESS)
+            return [
+                {
+                    'user_id': row[0],
+                    'common_interests': row[1]
+                }
+                for row in results
+            ]
+        return analytics_cache.get_or_compute('suggestions', compute, limit, user_id=user_id)
     
     @staticmethod
     def get_common_interests(user1_id: int, user2_id: int):
@@ -479,65 +972,64 @@ class Neo4jAnalyticsService:
         MATCH (u1:UserNode {user_id: $user1_id})-[:INTERESTED_IN]->(i:InterestNode)<-[:INTERESTED_IN]-(u2:UserNode {user_id: $user2_id})
         RETURN i
         """
-        results, meta = db.cypher_query(query, {'user1_id': user1_id, 'user2_id': user2_id})
+        results, meta = cypher_query(query, {'user1_id': user1_id, 'user2_id': user2_id}, access_mode=READ_ACCESS)
         return [InterestNode.inflate(row[0]) for row in results]
     
     @staticmethod
-    def get_trending_interests(limit: int = 10):
-        """Obtiene los intereses más populares (con más posts)"""
-        query = """
-        MATCH (p:PostNode)-[:TAGGED_WITH]->(i:InterestNode)
-        WITH i, count(p) as post_count
-        RETURN i, post_count
-        ORDER BY post_count DESC
-        LIMIT $limit
+    def get_trending_interests(limit: int = 10, window: str = trending.DEFAULT_WINDOW):
         """
-        results, meta = db.cypher_query(query, {'limit': limit})
-        return [
-            {
-                'interest': InterestNode.inflate(row[0]),
-                'count': row[1]
-            }
-            for row in results
-        ]
+        Obtiene los intereses en tendencia de una ventana de tiempo ('1h', '24h', '7d')
+        Se responden desde el motor de tendencias en memoria (ver trending.py),
+        no con un recuento en Neo4j
+        """
+        return trending.get_trending(window, limit)
     
     @staticmethod
-    def get_influencers(limit: int = 10):
-        """Obtiene los usuarios más influyentes (con más seguidores)"""
-        query = """
-        MATCH (u:UserNode)<-[:FOLLOWS]-(follower)
-        WITH u, count(follower) as follower_count
-        RETURN u, follower_count
-        ORDER BY follower_count DESC
-        LIMIT $limit
+    def get_top_tags(limit: int = 10):
         """
-        results, meta = db.cypher_query(query, {'limit': limit})
-        return [
-            {
-                'user': UserNode.inflate(row[0]),
-                'followers': row[1]
-            }
-            for row in results
-        ]
+        Hashtags más usados de toda la historia, desde los sketches (ver engagement.py)
+        Cada count sobreestima el real como mucho en `error` (con 99% de probabilidad)
+        """
+        return engagement.top_tags(limit)
+    
+    @staticmethod
+    def estimate_tag_count(tag: str):
+        """Número aproximado de usos de un hashtag: {count, error}"""
+        return engagement.tag_count(tag)
+    
+    @staticmethod
+    def estimate_distinct_likers(post_id: int):
+        """Número aproximado de usuarios distintos que dieron like a un post: {count, relative_error}"""
+        return engagement.distinct_likers(post_id)
+    
+    @staticmethod
+    def estimate_active_users(day=None):
+        """Número aproximado de usuarios activos en un día (hoy por defecto): {count, relative_error}"""
+        return engagement.active_users(day)
+    
+    @staticmethod
+    def get_influencers(limit: int = 10):
+        """Obtiene los usuarios más influyentes (con más seguidores), desde la caché de análisis"""
+        def compute():
+            query = INFLUENCERS_QUERY
+            results, meta = cypher_query(query, {'limit': limit}, access_mode=READ_ACCESS)
+            return [
+                {
+                    'user': UserNode.inflate(row[0]),
+                    'followers': row[1]
+                }
+                for row in results
+            ]
+        return analytics_cache.get_or_compute('influencers', compute, limit)
     
     @staticmethod
     def get_user_network_stats(user_id: int):
-        """Obtiene estadísticas de la red de un usuario"""
-        query = """
-        MATCH (u:UserNode {user_id: $user_id})
-        OPTIONAL MATCH (u)-[:FOLLOWS]->(following)
-        OPTIONAL MATCH (u)<-[:FOLLOWS]-(follower)
-        OPTIONAL MATCH (u)-[:FRIEND_OF]-(friend)
-        OPTIONAL MATCH (u)-[:POSTED]->(post)
-        OPTIONAL MATCH (u)-[:INTERESTED_IN]->(interest)
-        RETURN 
-            count(DISTINCT following) as following_count,
-            count(DISTINCT follower) as followers_count,
-            count(DISTINCT friend) as friends_count,
-            count(DISTINCT post) as posts_count,
-            count(DISTINCT interest) as interests_count
-        """
-        results, meta = db.cypher_query(query, {'user_id': user_id})
+        """
+        Obtiene estadísticas de la red de un usuario
+        Lee los contadores guardados en el nodo (una sola búsqueda por índice)
+        """
+        query = USER_NETWORK_STATS_QUERY
+        results, meta = cypher_query(query, {'user_id': user_id}, access_mode=READ_ACCESS)
         if results:
             return {
                 'following': results[0][0],
@@ -547,3 +1039,237 @@ class Neo4jAnalyticsService:
                 'interests': results[0][4]
             }
         return None
+
+
+class Neo4jBulkService:
+    """
+    Escrituras masivas para migraciones y sincronizaciones
+    Cada método escribe un lote completo con una sola consulta UNWIND
+    y usa MERGE, así que repetir un lote no duplica datos.
+    Los upsert retornan cuántas filas escribieron: las filas cuyo usuario o
+    post no existe en Neo4j se descartan. Se reintentan ante errores
+    transitorios (por ejemplo, deadlocks entre lotes paralelos)
+    """
+    
+    @staticmethod
+    def _write(query: str, rows: List[Dict]):
+        results, meta = cypher_query(query, {'rows': rows}, retry=True)
+        return results[0][0] if results else 0
+    
+    @staticmethod
+    def upsert_users(rows: List[Dict]):
+        """
+        rows: [{user_id, username, email, first_name, last_name, bio, date_joined}]
+        """
+        query = """
+        UNWIND $rows AS row
+        MERGE (u:UserNode {user_id: row.user_id})
+        ON CREATE SET u.date_joined = row.date_joined,
+                      u.following_count = 0, u.followers_count = 0, u.friends_count = 0,
+                      u.posts_count = 0, u.interests_count = 0
+        SET u.username = row.username, u.email = row.email,
+            u.first_name = row.first_name, u.last_name = row.last_name, u.bio = row.bio
+        RETURN count(*)
+        """
+        return Neo4jBulkService._write(query, rows)
+    
+    @staticmethod
+    def upsert_posts(rows: List[Dict]):
+        """
+        rows: [{post_id, user_id, content, created_at, tags}]
+        """
+        query = """
+        UNWIND $rows AS row
+        MATCH (u:UserNode {user_id: row.user_id})
+        MERGE (p:PostNode {post_id: row.post_id})
+        ON CREATE SET p.created_at = row.created_at,
+                      u.posts_count = coalesce(u.posts_count, 0) + 1
+        SET p.content = row.content, p.updated_at = row.created_at
+        MERGE (u)-[:POSTED]->(p)
+        FOREACH (tag_name IN row.tags |
+            MERGE (i:InterestNode {name: tag_name})
+            ON CREATE SET i.description = '', i.created_at = row.created_at
+            MERGE (p)-[:TAGGED_WITH]->(i)
+        )
+        RETURN count(*)
+        """
+        return Neo4jBulkService._write(query, rows)
+    
+    @staticmethod
+    def upsert_comments(rows: List[Dict]):
+        """
+        rows: [{comment_id, user_id, post_id, content, created_at}]
+        """
+        query = """
+        UNWIND $rows AS row
+        MATCH (u:UserNode {user_id: row.user_id})
+        MATCH (p:PostNode {post_id: row.post_id})
+        MERGE (c:CommentNode {comment_id: row.comment_id})
+        ON CREATE SET c.created_at = row.created_at
+        SET c.content = row.content
+        MERGE (u)-[:COMMENTED]->(c)
+        MERGE (c)-[:COMMENT_ON]->(p)
+        RETURN count(*)
+        """
+        return Neo4jBulkService._write(query, rows)
+    
+    @staticmethod
+    def upsert_likes(rows: List[Dict]):
+        """
+        rows: [{user_id, post_id}]
+        """
+        query = """
+        UNWIND $rows AS row
+        MATCH (u:UserNode {user_id: row.user_id})
+        MATCH (p:PostNode {post_id: row.post_id})
+        MERGE (u)-[:LIKES]->(p)
+        RETURN count(*)
+        """
+        return Neo4jBulkService._write(query, rows)
+    
+    # Nodos que migrate_to_neo4j --scan-deletions compara por id contra SQLite
+    # (consultas fijas, sin f-strings, para que check_query_plans las cubra)
+    ID_PAGE_QUERIES = {
+        'users': """
+        MATCH (n:UserNode)
+        WHERE n.user_id > $after_id
+        RETURN n.user_id
+        ORDER BY n.user_id
+        LIMIT $limit
+        """,
+        'posts': """
+        MATCH (n:PostNode)
+        WHERE n.post_id > $after_id
+        RETURN n.post_id
+        ORDER BY n.post_id
+        LIMIT $limit
+        """,
+        'comments': """
+        MATCH (n:CommentNode)
+        WHERE n.comment_id > $after_id
+        RETURN n.comment_id
+        ORDER BY n.comment_id
+        LIMIT $limit
+        """,
+    }
+    
+    @staticmethod
+    def get_id_page(entity: str, after_id: int, limit: int):
+        """Ids de `entity` en Neo4j mayores que `after_id`, en orden ascendente"""
+        query = Neo4jBulkService.ID_PAGE_QUERIES[entity]
+        results, meta = cypher_query(query, {'after_id': after_id, 'limit': limit}, access_mode=READ_ACCESS)
+        return [row[0] for row in results]
+    
+    @staticmethod
+    def get_adjacency_page(after_id: int, limit: int):
+        """
+        Vecinos de los usuarios con user_id mayor que `after_id`, en orden ascendente:
+        [(user_id, [seguidos], [amigos], [intereses])]
+        """
+        query = """
+        MATCH (u:UserNode)
+        WHERE u.user_id > $after_id
+        WITH u
+        ORDER BY u.user_id
+        LIMIT $limit
+        CALL {
+            WITH u
+            OPTIONAL MATCH (u)-[:FOLLOWS]->(followed:UserNode)
+            RETURN collect(followed.user_id) AS following
+        }
+        CALL {
+            WITH u
+            OPTIONAL MATCH (u)-[:FRIEND_OF]->(friend:UserNode)
+            RETURN collect(friend.user_id) AS friends
+        }
+        CALL {
+            WITH u
+            OPTIONAL MATCH (u)-[:INTERESTED_IN]->(i:InterestNode)
+            RETURN collect(i.name) AS interests
+        }
+        RETURN u.user_id, following, friends, interests
+        ORDER BY u.user_id
+        """
+        results, meta = cypher_query(query, {'after_id': after_id, 'limit': limit}, access_mode=READ_ACCESS)
+        return [tuple(row) for row in results]
+    
+    @staticmethod
+    def delete_users(user_ids: List[int]):
+        """Elimina un lote de usuarios descontando los contadores de sus vecinos"""
+        query = """
+        UNWIND $user_ids AS user_id
+        MATCH (u:UserNode {user_id: user_id})
+        CALL {
+            WITH u
+            MATCH (u)-[:FOLLOWS]->(followed:UserNode)
+            SET followed.followers_count = CASE WHEN followed.followers_count > 0 THEN followed.followers_count - 1 ELSE 0 END
+        }
+        CALL {
+            WITH u
+            MATCH (u)<-[:FOLLOWS]-(follower:UserNode)
+            SET follower.following_count = CASE WHEN follower.following_count > 0 THEN follower.following_count - 1 ELSE 0 END
+        }
+        CALL {
+            WITH u
+            MATCH (u)-[:FRIEND_OF]->(friend:UserNode)-[:FRIEND_OF]->(u)
+            SET friend.friends_count = CASE WHEN friend.friends_count > 0 THEN friend.friends_count - 1 ELSE 0 END
+        }
+        DETACH DELETE u
+        """
+        cypher_query(query, {'user_ids': user_ids})
+    
+    @staticmethod
+    def delete_posts(post_ids: List[int]):
+        """Elimina un lote de publicaciones descontando el contador de sus autores"""
+        query = """
+        UNWIND $post_ids AS post_id
+        MATCH (p:PostNode {post_id: post_id})
+        OPTIONAL MATCH (author:UserNode)-[:POSTED]->(p)
+        SET author.posts_count = CASE WHEN author.posts_count > 0 THEN author.posts_count - 1 ELSE 0 END
+        DETACH DELETE p
+        """
+        cypher_query(query, {'post_ids': post_ids})
+    
+    @staticmethod
+    def delete_comments(comment_ids: List[int]):
+        """Elimina un lote de comentarios"""
+        query = """
+        UNWIND $comment_ids AS comment_id
+        MATCH (c:CommentNode {comment_id: comment_id})
+        DETACH DELETE c
+        """
+        cypher_query(query, {'comment_ids': comment_ids})
+    
+    @staticmethod
+    def get_like_counts(post_ids: List[int]):
+        """Retorna {post_id: número de likes en Neo4j} para un lote de publicaciones"""
+        query = """
+        UNWIND $post_ids AS post_id
+        MATCH (p:PostNode {post_id: post_id})
+        RETURN post_id, COUNT { (p)<-[:LIKES]-(:UserNode) }
+        """
+        results, meta = cypher_query(query, {'post_ids': post_ids}, access_mode=READ_ACCESS)
+        return {row[0]: row[1] for row in results}
+    
+    @staticmethod
+    def get_like_pairs(post_ids: List[int]):
+        """Retorna los pares (post_id, user_id) de los likes de un lote de publicaciones"""
+        query = """
+        UNWIND $post_ids AS post_id
+        MATCH (u:UserNode)-[:LIKES]->(p:PostNode {post_id: post_id})
+        RETURN post_id, u.user_id
+        """
+        results, meta = cypher_query(query, {'post_ids': post_ids}, access_mode=READ_ACCESS)
+        return [(row[0], row[1]) for row in results]
+    
+    @staticmethod
+    def delete_likes(rows: List[Dict]):
+        """
+        rows: [{user_id, post_id}]
+        """
+        query = """
+        UNWIND $rows AS row
+        MATCH (u:UserNode {user_id: row.user_id})-[r:LIKES]->(p:PostNode {post_id: row.post_id})
+        DELETE r
+        """
+        cypher_query(query, {'rows': rows})
@@ -0,0 +1,239 @@
+"""
+Outbox transaccional para la doble escritura SQLite -> Neo4j
+
+Las vistas no llaman a Neo4j durante la petición: registran el cambio con
+`enqueue` dentro de la misma transacción de SQLite, y el comando
+`drain_neo4j_outbox` lo aplica después en orden. Todas las operaciones usan
+MERGE (o son borrados), así que aplicar una entrada dos veces es seguro.
+
+El orden solo se garantiza con un drainer a la vez: `drain` toma antes el
+candado OutboxLease y, si otro proceso lo tiene, lanza OutboxBusy sin tocar
+la cola.
+"""
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboxEntry, OutboxLease
+from .neo4j_connection import cypher_query, neo4j_session
+from .neo4j_services import (
+    Neo4jUserService, Neo4jPostService, Neo4jCommentService, Neo4jTimelineService
+)
+
+
+# Segundos que dura el candado del drainer; se renueva en cada entrada
+LEASE_SECONDS = 300
+LEASE_NAME = 'drain'
+
+
+class OutboxError(Exception):
+    """Una entrada del outbox no pudo aplicarse en Neo4j"""
+
+
+class OutboxBusy(OutboxError):
+    """Otro proceso está vaciando el outbox"""
+
+
+def enqueue(operation, **payload):
+    """
+    Registra una operación pendiente para Neo4j
+    Debe llamarse dentro de la misma transacción que el cambio en Django
+    """
+    if operation not in HANDLERS:
+        raise ValueError(f"Operación de outbox desconocida: {operation}")
+    return OutboxEntry.objects.create(operation=operation, payload=payload)
+
+
+def _user_payload(user):
+    profile = getattr(user, 'profile', None)
+    return {
+        'user_id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'bio': getattr(profile, 'bio', '') if profile else '',
+    }
+
+
+def enqueue_user(user):
+    """Registra la sincronización de un usuario de Django"""
+    return enqueue('upsert_user', **_user_payload(user))
+
+
+def _require(result, description):
+    # Los servicios capturan sus errores y retornan None/False
+    if not result:
+        raise OutboxError(f"No se pudo {description}")
+
+
+def _upsert_user(user_id, username, email, first_name='', last_name='', bio=''):
+    _require(
+        Neo4jUserService.create_or_update_user(user_id, username, email, first_name, last_name, bio),
+        f"sincronizar el usuario {user_id}"
+    )
+
+
+def _with_user(user_id, write):
+    """
+    Ejecuta `write()` y, si falla, sincroniza el usuario desde Django y reintenta
+    Cubre a los usuarios que aún no existen en Neo4j (anteriores a la
+    sincronización o cuyo upsert_user quedó fallido). Así las vistas no tienen
+    que encolar un upsert del usuario en cada post, comentario o like
+    """
+    result = write()
+    if not result:
+        user = User.objects.select_related('profile').filter(pk=user_id).first()
+        if user:
+            _upsert_user(**_user_payload(user))
+            result = write()
+    return result
+
+
+def _create_post(post_id, user_id, content):
+    post = _with_user(user_id, lambda: Neo4jPostService.create_post(post_id=post_id, user_id=user_id, content=content))
+    _require(post, f"crear el post {post_id}")
+    # 0 es válido (nadie con timeline materializado); None es un error y la entrada se reintenta
+    if Neo4jTimelineService.fan_out_post(post_id, user_id) is None:
+        raise OutboxError(f"No se pudo distribuir el post {post_id} a los timelines")
+
+
+def _update_post(post_id, content):
+    _require(Neo4jPostService.update_post(post_id=post_id, content=content),
+             f"actualizar el post {post_id}")
+
+
+def _delete_post(post_id):
+    Neo4jPostService.delete_post(post_id)
+
+
+def _create_comment(comment_id, user_id, post_id, content):
+    _require(
+        _with_user(user_id, lambda: Neo4jCommentService.create_comment(
+            comment_id=comment_id, user_id=user_id, post_id=post_id, content=content
+        )),
+        f"crear el comentario {comment_id}"
+    )
+
+
+def _delete_comment(comment_id):
+    Neo4jCommentService.delete_comment(comment_id)
+
+
+def _like_post(user_id, post_id):
+    _require(_with_user(user_id, lambda: Neo4jPostService.like_post(user_id, post_id)),
+             f"registrar el like de {user_id} en {post_id}")
+
+
+def _unlike_post(user_id, post_id):
+    Neo4jPostService.unlike_post(user_id, post_id)
+
+
+HANDLERS = {
+    'upsert_user': _upsert_user,
+    'create_post': _create_post,
+    'update_post': _update_post,
+    'delete_post': _delete_post,
+    'create_comment': _create_comment,
+    'delete_comment': _delete_comment,
+    'like_post': _like_post,
+    'unlike_post': _unlike_post,
+}
+
+
+def _neo4j_available():
+    try:
+        cypher_query("RETURN 1")
+        return True
+    except Exception:
+        return False
+
+
+def _acquire_lease(owner):
+    """Toma el candado del drainer; False si otro proceso lo tiene vigente"""
+    now = timezone.now()
+    OutboxLease.objects.get_or_create(name=LEASE_NAME, defaults={'expires_at': now})
+    # UPDATE condicional: atómico en cualquier base de datos
+    return OutboxLease.objects.filter(
+        Q(owner=owner) | Q(expires_at__lte=now), name=LEASE_NAME
+    ).update(owner=owner, expires_at=now + timedelta(seconds=LEASE_SECONDS)) == 1
+
+
+def _renew_lease(owner):
+    now = timezone.now()
+    return OutboxLease.objects.filter(name=LEASE_NAME, owner=owner).update(
+        expires_at=now + timedelta(seconds=LEASE_SECONDS)
+    ) == 1
+
+
+def _release_lease(owner):
+    OutboxLease.objects.filter(name=LEASE_NAME, owner=owner).update(owner='', expires_at=timezone.now())
+
+
+def drain(batch_size=100, max_attempts=5):
+    """
+    Aplica en orden un lote de entradas pendientes
+    Lanza OutboxBusy si otro proceso está vaciando el outbox
+
+    Si una entrada falla, el lote se detiene para no aplicar cambios
+    posteriores fuera de orden. Los fallos de conexión no cuentan como
+    intento; una entrada que falla `max_attempts` veces con Neo4j disponible
+    se marca como fallida (queda en la tabla para revisarla) y deja de
+    bloquear la cola.
+
+    Retorna (aplicadas, error) donde error es None si el lote terminó completo.
+    """
+    owner = uuid.uuid4().hex
+    if not _acquire_lease(owner):
+        raise OutboxBusy("Otro proceso está vaciando el outbox")
+    try:
+        return _drain_batch(owner, batch_size, max_attempts)
+    finally:
+        _release_lease(owner)
+
+
+def _drain_batch(owner, batch_size, max_attempts):
+    entries = list(
+        OutboxEntry.objects
+        .filter(status=OutboxEntry.PENDING)
+        .order_by('entry_id')[:batch_size]
+    )
+    applied = []
+    error = None
+    # Una sola sesión de Neo4j para todo el lote
+    with neo4j_session():
+        for entry in entries:
+            # Si el candado venció (lote muy lento) otro drainer pudo tomarlo: se para aquí
+            if not _renew_lease(owner):
+                error = "Se perdió el candado del outbox"
+                break
+            try:
+                HANDLERS[entry.operation](**entry.payload)
+            except Exception as e:
+                error = f"Entrada {entry.entry_id} ({entry.operation}): {e}"
+                if not _neo4j_available():
+                    break
+                entry.attempts += 1
+                entry.last_error = str(e)
+                if entry.attempts >= max_attempts:
+                    entry.status = OutboxEntry.FAILED
+                    entry.save(update_fields=['attempts', 'last_error', 'status'])
+                    error = None
+                    continue
+                entry.save(update_fields=['attempts', 'last_error'])
+                break
+            applied.append(entry.entry_id)
+
+    if applied:
+        OutboxEntry.objects.filter(entry_id__in=applied).delete()
+    return len(applied), error
+
+
+def retry_failed():
+    """Devuelve a la cola las entradas marcadas como fallidas"""
+    return OutboxEntry.objects.filter(status=OutboxEntry.FAILED).update(
+        status=OutboxEntry.PENDING, attempts=0
+    )
@@ -0,0 +1,117 @@
+"""
+Paginación por cursor (keyset) para listados de publicaciones
+
+Los listados se ordenan por (post_date, post_id) descendente y cada página
+se obtiene filtrando a partir de la última fila vista, sin OFFSET ni COUNT(*).
+Así una página profunda cuesta lo mismo que la primera.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, post):
+    """Genera un token opaco a partir de la posición de un post"""
+    raw = f"{direction}|{post.post_date.isoformat()}|{post.post_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Decodifica un token de cursor
+    Retorna (dirección, post_date, post_id) o None si el token no es válido
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, post_date, post_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        if direction not in (NEXT, PREVIOUS):
+            return None
+        return direction, datetime.fromisoformat(post_date), int(post_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class CursorPage:
+    """Página de resultados con tokens para la página siguiente y anterior"""
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return encode_cursor(NEXT, self.object_list[-1])
+        return ''
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return encode_cursor(PREVIOUS, self.object_list[0])
+        return ''
+
+
+def paginate_by_cursor(queryset, token, per_page):
+    """
+    Obtiene una página de `queryset` a partir de un token de cursor
+    Solo se lee una fila extra para saber si hay más resultados
+    """
+    cursor = decode_cursor(token)
+    if cursor is None:
+        rows = list(queryset.order_by('-post_date', '-post_id')[:per_page + 1])
+        return CursorPage(rows[:per_page], has_next=len(rows) > per_page, has_previous=False)
+
+    direction, post_date, post_id = cursor
+    if direction == NEXT:
+        rows = list(
+            queryset
+            .filter(Q(post_date__lt=post_date) | Q(post_date=post_date, post_id__lt=post_id))
+            .order_by('-post_date', '-post_id')[:per_page + 1]
+        )
+        return CursorPage(rows[:per_page], has_next=len(rows) > per_page, has_previous=True)
+
+    rows = list(
+        queryset
+        .filter(Q(post_date__gt=post_date) | Q(post_date=post_date, post_id__gt=post_id))
+        .order_by('post_date', 'post_id')[:per_page + 1]
+    )
+    page_rows = rows[:per_page]
+    page_rows.reverse()
+    return CursorPage(page_rows, has_next=True, has_previous=len(rows) > per_page)
+
+
+class CursorPaginationMixin:
+    """
+    Reemplaza la paginación por número de página de ListView
+    Lee el token del parámetro GET `cursor`
+    """
+    cursor_param = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        page = paginate_by_cursor(queryset, self.request.GET.get(self.cursor_param), page_size)
+        return None, page, page.object_list, page.has_other_pages()
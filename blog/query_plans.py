@@ -0,0 +1,329 @@
+"""
+Registro y comparación de planes de ejecución de las consultas de neo4j_services
+
+Cada consulta `query = \"\"\"...\"\"\"` (o `query = CONSTANTE`) de las clases de
+servicio se ejecuta con EXPLAIN (o PROFILE, solo las de lectura) y se
+guardan sus operadores, filas y db hits. `python manage.py check_query_plans`
+compara el resultado con la línea base versionada y falla si una consulta
+pasa de usar un índice a hacer un scan o si sus db hits crecen más de lo
+tolerado.
+
+Los db hits dependen de los datos, así que la línea base y cada
+comprobación se miden sobre el mismo grafo pequeño y determinista
+(`seed_graph`, opción --seed del comando) en una base de datos vacía.
+"""
+import ast
+import json
+import re
+import textwrap
+
+from neo4j import READ_ACCESS
+
+from . import neo4j_async_services, neo4j_services
+from .neo4j_connection import cypher_query, neo4j_session
+from .neo4j_schema import explain_plan, plan_operators
+from .neo4j_services import Neo4jBulkService, Neo4jTimelineService
+
+SERVICE_CLASSES = (
+    'Neo4jUserService',
+    'Neo4jPostService',
+    'Neo4jTimelineService',
+    'Neo4jCommentService',
+    'Neo4jInterestService',
+    'Neo4jAnalyticsService',
+    'Neo4jBulkService',
+    'AsyncNeo4jUserService',
+    'AsyncNeo4jInterestService',
+    'AsyncNeo4jAnalyticsService',
+)
+SERVICE_MODULES = (neo4j_services, neo4j_async_services)
+
+# Operadores que indican un plan caro; si aparecen y no estaban en la línea base es una regresión
+WATCHED_OPERATORS = ('AllNodesScan', 'NodeByLabelScan', 'CartesianProduct', 'Eager')
+
+# Tamaño del grafo de ejemplo: los parámetros de sample_value (ids 1 a 3,
+# el interés 'python') siempre existen en él
+SEED_USERS = 60
+SEED_POSTS_PER_USER = 4
+SEED_TAGS = ('python', 'django', 'neo4j', 'go', 'rust')
+
+SEED_RELATIONSHIPS_QUERY = """
+UNWIND $rows AS row
+MATCH (u:UserNode {user_id: row.user_id})
+CALL {
+    WITH u, row
+    UNWIND row.follows AS followed_id
+    MATCH (followed:UserNode {user_id: followed_id})
+    MERGE (u)-[:FOLLOWS]->(followed)
+}
+CALL {
+    WITH u, row
+    UNWIND row.friends AS friend_id
+    MATCH (friend:UserNode {user_id: friend_id})
+    MERGE (u)-[:FRIEND_OF]->(friend)
+    MERGE (friend)-[:FRIEND_OF]->(u)
+}
+CALL {
+    WITH u, row
+    UNWIND row.interests AS name
+    MERGE (i:InterestNode {name: name})
+    ON CREATE SET i.description = '', i.created_at = 0.0
+    MERGE (u)-[:INTERESTED_IN]->(i)
+}
+"""
+
+SEED_COUNTERS_QUERY = """
+MATCH (u:UserNode)
+SET u.following_count = COUNT { (u)-[:FOLLOWS]->(:UserNode) },
+    u.followers_count = COUNT { (u)<-[:FOLLOWS]-(:UserNode) },
+    u.friends_count = COUNT { (u)-[:FRIEND_OF]->(:UserNode)-[:FRIEND_OF]->(u) },
+    u.posts_count = COUNT { (u)-[:POSTED]->(:PostNode) },
+    u.interests_count = COUNT { (u)-[:INTERESTED_IN]->(:InterestNode) }
+"""
+
+WRITE_CLAUSES = re.compile(r'\b(CREATE|MERGE|SET|DELETE|REMOVE)\b')
+PARAMETER = re.compile(r'\$(\w+)')
+
+
+def collect_queries(skipped=None):
+    """
+    Retorna {'Clase.metodo': consulta} con cada cadena asignada a `query`
+    en los métodos de las clases de servicio
+    Las consultas que no se pueden leer sin ejecutar el código (f-strings)
+    no se miden: sus nombres se agregan a `skipped` si se pasa una lista
+    """
+    queries = {}
+    for module in SERVICE_MODULES:
+        with open(module.__file__) as f:
+            queries.update(_module_queries(ast.parse(f.read()), module, skipped))
+    return queries
+
+
+def _resolve(node, module):
+    # CONSTANTE o Clase.ATRIBUTO del módulo
+    if isinstance(node, ast.Name):
+        return getattr(module, node.id, None)
+    if isinstance(node, ast.Attribute):
+        return getattr(_resolve(node.value, module), node.attr, None)
+    return None
+
+
+def _query_texts(value, module):
+    """
+    [(sufijo, consulta)] para `query = \"\"\"...\"\"\"`, `query = CONSTANTE`
+    o `query = CONSULTAS[clave]` (un dict de consultas fijas; se mide cada una)
+    Retorna None si la consulta se arma en tiempo de ejecución
+    """
+    if isinstance(value, ast.Constant) and isinstance(value.value, str):
+        return [('', value.value)]
+    if isinstance(value, ast.Subscript):
+        options = _resolve(value.value, module)
+        if isinstance(options, dict) and options and all(isinstance(q, str) for q in options.values()):
+            return [(f'[{key}]', query) for key, query in options.items()]
+        return None
+    text = _resolve(value, module)
+    return [('', text)] if isinstance(text, str) else None
+
+
+def _module_queries(tree, module, skipped=None):
+    queries = {}
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef) or node.name not in SERVICE_CLASSES:
+            continue
+        for method in node.body:
+            if not isinstance(method, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            name = f'{node.name}.{method.name}'
+            found = []
+            for assign in ast.walk(method):
+                if isinstance(assign, ast.Assign) and any(
+                    isinstance(t, ast.Name) and t.id == 'query' for t in assign.targets
+                ):
+                    texts = _query_texts(assign.value, module)
+                    if texts is None:
+                        if skipped is not None:
+                            skipped.append(name)
+                        continue
+                    found.append(texts)
+            for index, texts in enumerate(found):
+                for suffix, query in texts:
+                    key = f'{name}#{index + 1}' if index else name
+                    queries[f'{key}{suffix}'] = textwrap.dedent(query).strip()
+    return queries
+
+
+def graph_is_empty():
+    results, meta = cypher_query("MATCH (n) WITH n LIMIT 1 RETURN count(n)", access_mode=READ_ACCESS)
+    return not (results and results[0][0])
+
+
+def _seed_neighbours(user_id, offsets):
+    return [(user_id + offset - 1) % SEED_USERS + 1 for offset in offsets]
+
+
+def seed_rows():
+    """
+    Filas del grafo de ejemplo, siempre las mismas
+    El usuario 1 lo sigue todo el mundo; el resto sigue a los 5 siguientes
+    """
+    users, relationships, posts, comments, likes = [], [], [], [], []
+    for user_id in range(1, SEED_USERS + 1):
+        users.append({
+            'user_id': user_id,
+            'username': f'seed{user_id}',
+            'email': f'seed{user_id}@example.com',
+            'first_name': '',
+            'last_name': '',
+            'bio': '',
+            'date_joined': 0.0,
+        })
+        follows = [followed for followed in _seed_neighbours(user_id, range(1, 6)) + [1] if followed != user_id]
+        relationships.append({
+            'user_id': user_id,
+            'follows': list(dict.fromkeys(follows)),
+            'friends': _seed_neighbours(user_id, [1]),
+            'interests': [SEED_TAGS[user_id % len(SEED_TAGS)], SEED_TAGS[(user_id + 2) % len(SEED_TAGS)]],
+        })
+        for index in range(SEED_POSTS_PER_USER):
+            post_id = (user_id - 1) * SEED_POSTS_PER_USER + index + 1
+            tags = [SEED_TAGS[(user_id + index) % len(SEED_TAGS)], SEED_TAGS[(user_id + index + 1) % len(SEED_TAGS)]]
+            posts.append({
+                'post_id': post_id,
+                'user_id': user_id,
+                'content': f'Post {post_id} ' + ' '.join(f'#{tag}' for tag in tags),
+                'created_at': float(post_id),
+                'tags': tags,
+            })
+            comments.append({
+                'comment_id': post_id,
+                'user_id': _seed_neighbours(user_id, [1])[0],
+                'post_id': post_id,
+                'content': f'Comentario {post_id}',
+                'created_at': float(post_id),
+            })
+            likes.extend({'user_id': liker, 'post_id': post_id} for liker in _seed_neighbours(user_id, range(1, 4)))
+    return users, relationships, posts, comments, likes
+
+
+def seed_graph():
+    """
+    Escribe el grafo de ejemplo con los mismos servicios que usa la aplicación
+    Debe llamarse sobre una base de datos vacía (ver graph_is_empty)
+    Retorna {entidad: filas escritas}
+    """
+    users, relationships, posts, comments, likes = seed_rows()
+    written = {
+        'users': Neo4jBulkService.upsert_users(users),
+        'posts': Neo4jBulkService.upsert_posts(posts),
+        'comments': Neo4jBulkService.upsert_comments(comments),
+        'likes': Neo4jBulkService.upsert_likes(likes),
+    }
+    cypher_query(SEED_RELATIONSHIPS_QUERY, {'rows': relationships})
+    cypher_query(SEED_COUNTERS_QUERY)
+    # Posts recientes de cada autor y timelines materializados, como en producción
+    for post in posts:
+        Neo4jTimelineService.fan_out_post(post['post_id'], post['user_id'])
+    for user in users:
+        Neo4jTimelineService.rebuild_timeline(user['user_id'])
+    return written
+
+
+def sample_value(name):
+    """Valor de ejemplo para un parámetro según su nombre"""
+    if name == 'rows':
+        return []
+    if name == 'tags':
+        return ['python']
+    if name.endswith('_ids'):
+        return [1, 2, 3]
+    if name == 'now':
+        return 0.0
+    if name.endswith('_id') or name in ('limit', 'threshold', 'max_length', 'recent_size', 'backfill_count'):
+        return 10 if name == 'limit' else 1
+    return 'python'
+
+
+def sample_params(query):
+    return {name: sample_value(name) for name in PARAMETER.findall(query)}
+
+
+def is_write(query):
+    return bool(WRITE_CLAUSES.search(query))
+
+
+def _profile_plan(query, params):
+    """Ejecuta la consulta con PROFILE y retorna el perfil con db hits y filas reales"""
+    with neo4j_session(READ_ACCESS) as session:
+        summary = session.run(f"PROFILE {query}", params).consume()
+    return summary.profile
+
+
+def _total_db_hits(plan):
+    return plan.get('dbHits', 0) + sum(_total_db_hits(child) for child in plan.get('children', []))
+
+
+def record_plan(query, profile=False):
+    """
+    Resume el plan de una consulta
+    Con profile=True las consultas de lectura se ejecutan con PROFILE;
+    las de escritura siempre usan EXPLAIN para no modificar el grafo
+    """
+    params = sample_params(query)
+    if profile and not is_write(query):
+        plan = _profile_plan(query, params)
+        return {
+            'operators': sorted(set(plan_operators(plan))),
+            'db_hits': _total_db_hits(plan),
+            'rows': plan.get('rows', 0),
+        }
+    plan = explain_plan(query, params)
+    return {
+        'operators': sorted(set(plan_operators(plan))),
+        'estimated_rows': round(plan.get('args', plan.get('arguments', {})).get('EstimatedRows', 0), 2),
+    }
+
+
+def record_all(profile=False, skipped=None):
+    return {name: record_plan(query, profile) for name, query in collect_queries(skipped).items()}
+
+
+def compare(baseline, current, tolerance=1.5):
+    """
+    Compara dos registros de planes
+    Retorna (regresiones, avisos) como listas de mensajes
+    """
+    regressions = []
+    notes = []
+    for name, plan in current.items():
+        previous = baseline.get(name)
+        if previous is None:
+            notes.append(f'{name}: consulta nueva, sin línea base')
+            continue
+
+        new_operators = [
+            op for op in WATCHED_OPERATORS
+            if op in plan['operators'] and op not in previous['operators']
+        ]
+        if new_operators:
+            regressions.append(f'{name}: nuevos operadores {", ".join(new_operators)}')
+
+        if 'db_hits' in plan and 'db_hits' in previous:
+            limit = max(previous['db_hits'] * tolerance, previous['db_hits'] + 10)
+            if plan['db_hits'] > limit:
+                regressions.append(f'{name}: db hits {previous["db_hits"]} -> {plan["db_hits"]}')
+
+    for name in baseline:
+        if name not in current:
+            notes.append(f'{name}: ya no existe')
+    return regressions, notes
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, plans):
+    with open(path, 'w') as f:
+        json.dump(plans, f, indent=2, sort_keys=True, ensure_ascii=False)
+        f.write('\n')
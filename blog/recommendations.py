@@ -0,0 +1,284 @@
+"""
+Recomendaciones de seguimiento y amistad precalculadas
+
+En lugar de resolver en cada petición un patrón de dos saltos en Neo4j, el
+comando compute_recommendations exporta las relaciones FOLLOWS, FRIEND_OF e
+INTERESTED_IN a matrices de adyacencia CSR (arreglos de NumPy) y calcula en
+lote, para cada usuario:
+
+- A quién seguir: usuarios con intereses en común que aún no sigue,
+  ordenados por Adamic-Adar (un interés compartido por pocos pesa más que
+  uno que comparten todos).
+- Amigos sugeridos: amigos de amigos que aún no son amigos, ordenados por
+  amigos en común y después por Jaccard.
+
+Los usuarios se reparten por rangos de user_id entre procesos
+(ProcessPoolExecutor) y dentro de cada rango se procesan por bloques con
+operaciones vectorizadas. Los resultados se guardan en UserRecommendations,
+una fila por usuario, así que leerlos es una sola búsqueda por clave primaria.
+
+NumPy solo hace falta para calcular; leer los resultados no la necesita.
+"""
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .models import UserRecommendations
+
+TOP_N = 50
+# Los intermediarios (intereses o amigos) con más vecinos se omiten: no
+# distinguen a nadie y multiplican el número de pares
+MAX_DEGREE = 10000
+# Usuarios por bloque vectorizado; acota la memoria de los pares de cada bloque
+BLOCK_SIZE = 512
+
+
+class CSRMatrix:
+    """Adyacencia comprimida por filas: los vecinos de la fila i están en indices[indptr[i]:indptr[i + 1]]"""
+
+    def __init__(self, indptr, indices):
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def from_lists(cls, rows):
+        lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        indices = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64, count=int(indptr[-1]))
+        return cls(indptr, indices)
+
+    @property
+    def rows(self):
+        return len(self.indptr) - 1
+
+    def degree(self):
+        return np.diff(self.indptr)
+
+    def transpose(self, columns):
+        owners = np.repeat(np.arange(self.rows, dtype=np.int64), self.degree())
+        order = np.argsort(self.indices, kind='stable')
+        indptr = np.zeros(columns + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=columns), out=indptr[1:])
+        return CSRMatrix(indptr, owners[order])
+
+    def gather(self, rows):
+        """
+        Vecinos de varias filas a la vez, sin bucles de Python
+        Retorna (posición en `rows` de la fila de origen, vecino)
+        """
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        owner = np.repeat(np.arange(len(rows), dtype=np.int64), lengths)
+        # Posición de cada vecino dentro de `indices`: inicio de su fila + desplazamiento dentro de ella
+        offsets = np.arange(int(lengths.sum()), dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return owner, self.indices[np.repeat(starts, lengths) + offsets]
+
+
+class SocialGraph:
+    """Usuarios (por índice, en orden de user_id) y sus relaciones en CSR"""
+
+    def __init__(self, user_ids, following, friends, interests, interest_count):
+        self.user_ids = user_ids
+        self.following = following
+        self.friends = friends
+        self.interests = interests
+        self.interest_members = interests.transpose(interest_count)
+
+    @classmethod
+    def from_adjacency(cls, rows):
+        """rows: [(user_id, [seguidos], [amigos], [intereses])] en orden de user_id"""
+        rows = list(rows)
+        index = {row[0]: position for position, row in enumerate(rows)}
+        interest_index = {}
+        following, friends, interests = [], [], []
+        for user_id, followed_ids, friend_ids, interest_names in rows:
+            following.append([index[other] for other in followed_ids if other in index])
+            friends.append([index[other] for other in friend_ids if other in index])
+            interests.append([interest_index.setdefault(name, len(interest_index)) for name in interest_names])
+        return cls(
+            np.array([row[0] for row in rows], dtype=np.int64),
+            CSRMatrix.from_lists(following),
+            CSRMatrix.from_lists(friends),
+            CSRMatrix.from_lists(interests),
+            len(interest_index),
+        )
+
+
+def _two_hop(first, second, block, max_degree):
+    """
+    Pares a dos saltos: block -first-> intermediario -second-> candidato
+    Retorna (posición en `block`, intermediario, candidato)
+    """
+    owner, middle = first.gather(block)
+    keep = second.degree()[middle] <= max_degree
+    owner, middle = owner[keep], middle[keep]
+    middle_owner, candidate = second.gather(middle)
+    return owner[middle_owner], middle[middle_owner], candidate
+
+
+def _aggregate(block, owner, candidate, excluded, weights=None):
+    """
+    Agrupa los pares (usuario, candidato) quitando al propio usuario y a los
+    de `excluded` (sus seguidos o amigos)
+    Retorna (dueño, candidato, número de caminos, suma de pesos)
+    """
+    n = np.int64(1 << 32)
+    keep = candidate != block[owner]
+    keys = owner[keep] * n + candidate[keep]
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(unique_keys))
+    scores = np.bincount(inverse, weights=weights[keep], minlength=len(unique_keys)) if weights is not None else counts
+    excluded_owner, excluded_target = excluded.gather(block)
+    fresh = ~np.isin(unique_keys, excluded_owner * n + excluded_target)
+    unique_keys, counts, scores = unique_keys[fresh], counts[fresh], scores[fresh]
+    return unique_keys // n, unique_keys % n, counts, scores
+
+
+def _top_per_owner(owner, candidate, primary, secondary, top_n):
+    """Índices de los top_n pares de cada dueño, de mayor a menor (primary, secondary)"""
+    # lexsort ordena por la última clave primero
+    order = np.lexsort((candidate, -secondary, -primary, owner))
+    sorted_owner = owner[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_owner, sorted_owner, side='left')
+    return order[rank < top_n]
+
+
+def compute_block(graph, block, top_n=TOP_N, max_degree=MAX_DEGREE):
+    """Recomendaciones de un bloque de índices de usuario: {user_id: {'follow': [...], 'friends': [...]}}"""
+    results = {int(graph.user_ids[position]): {'follow': [], 'friends': []} for position in block}
+
+    # A quién seguir: intereses en común, ponderados por Adamic-Adar
+    interest_degree = graph.interest_members.degree()
+    adamic_adar = 1.0 / np.log(np.maximum(interest_degree, 2))
+    owner, interest, candidate = _two_hop(graph.interests, graph.interest_members, block, max_degree)
+    owner, candidate, common, score = _aggregate(
+        block, owner, candidate, graph.following, weights=adamic_adar[interest]
+    )
+    for i in _top_per_owner(owner, candidate, score, common, top_n):
+        results[int(graph.user_ids[block[owner[i]]])]['follow'].append(
+            [int(graph.user_ids[candidate[i]]), int(common[i]), round(float(score[i]), 4)]
+        )
+
+    # Amigos sugeridos: amigos en común y Jaccard de las listas de amigos
+    friend_degree = graph.friends.degree()
+    owner, _, candidate = _two_hop(graph.friends, graph.friends, block, max_degree)
+    owner, candidate, common, _ = _aggregate(block, owner, candidate, graph.friends)
+    union = friend_degree[block[owner]] + friend_degree[candidate] - common
+    jaccard = common / np.maximum(union, 1)
+    for i in _top_per_owner(owner, candidate, common, jaccard, top_n):
+        results[int(graph.user_ids[block[owner[i]]])]['friends'].append(
+            [int(graph.user_ids[candidate[i]]), int(common[i]), round(float(jaccard[i]), 4)]
+        )
+    return results
+
+
+def compute_range(graph, start, stop, top_n=TOP_N, max_degree=MAX_DEGREE, block_size=BLOCK_SIZE):
+    """Recomendaciones de los usuarios con índice en [start, stop), por bloques"""
+    results = {}
+    for block_start in range(start, stop, block_size):
+        block = np.arange(block_start, min(block_start + block_size, stop), dtype=np.int64)
+        results.update(compute_block(graph, block, top_n, max_degree))
+    return results
+
+
+_worker_graph = None
+
+
+def _init_worker(graph):
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _compute_partition(args):
+    return compute_range(_worker_graph, *args)
+
+
+def compute_all(graph, workers=None, partitions=None, top_n=TOP_N, max_degree=MAX_DEGREE, block_size=BLOCK_SIZE):
+    """
+    Calcula las recomendaciones de todos los usuarios repartiendo rangos
+    contiguos de user_id entre `workers` procesos
+    Retorna un iterador con el resultado de cada rango a medida que termina
+    """
+    workers = workers or os.cpu_count() or 1
+    partitions = partitions or workers * 4
+    bounds = np.linspace(0, len(graph.user_ids), partitions + 1).astype(np.int64)
+    ranges = [
+        (int(start), int(stop), top_n, max_degree, block_size)
+        for start, stop in zip(bounds[:-1], bounds[1:])
+        if stop > start
+    ]
+    if workers == 1:
+        for args in ranges:
+            yield compute_range(graph, *args)
+        return
+    # El grafo se envía una sola vez a cada proceso, no con cada rango
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(graph,)) as pool:
+        yield from pool.map(_compute_partition, ranges)
+
+
+def save_results(results, computed_at):
+    """Guarda (o reemplaza) las recomendaciones de un rango; omite los usuarios que no existen en Django"""
+    existing = set(User.objects.filter(pk__in=results.keys()).values_list('pk', flat=True))
+    UserRecommendations.objects.bulk_create(
+        [
+            UserRecommendations(
+                user_id=user_id, follow=result['follow'], friends=result['friends'], computed_at=computed_at
+            )
+            for user_id, result in results.items()
+            if user_id in existing
+        ],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['follow', 'friends', 'computed_at'],
+        batch_size=500,
+    )
+    return len(existing)
+
+
+# Lectura
+
+def follow_suggestions(user_id, limit=10):
+    """
+    Sugerencias precalculadas para seguir: [{user_id, common_interests, score}]
+    Retorna None si el usuario aún no tiene (por ejemplo, se registró después del último cálculo)
+    """
+    row = UserRecommendations.objects.filter(pk=user_id).values_list('follow', flat=True).first()
+    if row is None:
+        return None
+    return [
+        {'user_id': candidate, 'common_interests': common, 'score': score}
+        for candidate, common, score in row[:limit]
+    ]
+
+
+def friend_suggestions(user_id, limit=10):
+    """Amigos sugeridos precalculados: [{user_id, common_friends, jaccard}], o None si no hay"""
+    row = UserRecommendations.objects.filter(pk=user_id).values_list('friends', flat=True).first()
+    if row is None:
+        return None
+    return [
+        {'user_id': candidate, 'common_friends': common, 'jaccard': jaccard}
+        for candidate, common, jaccard in row[:limit]
+    ]
+
+
+def discard(user_id, candidate_id, kind):
+    """Quita de las sugerencias ('follow' o 'friends') a alguien que el usuario ya siguió o agregó"""
+    with transaction.atomic():
+        row = UserRecommendations.objects.select_for_update().filter(pk=user_id).first()
+        if row is None:
+            return
+        suggestions = getattr(row, kind)
+        remaining = [entry for entry in suggestions if entry[0] != candidate_id]
+        if len(remaining) != len(suggestions):
+            setattr(row, kind, remaining)
+            row.save(update_fields=[kind])
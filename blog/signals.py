@@ -0,0 +1,27 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Comment, Post, SyncTombstone
+
+
+def _tombstone(entity, object_id):
+    SyncTombstone.objects.create(entity=entity, object_id=object_id)
+
+
+@receiver(post_delete, sender=User)
+def record_user_deletion(sender, instance, **kwargs):
+    """Registra el borrado para la sincronización incremental (migrate_to_neo4j --since)"""
+    _tombstone('users', instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def record_post_deletion(sender, instance, **kwargs):
+    """Registra el borrado, también los que llegan en cascada desde el usuario"""
+    _tombstone('posts', instance.pk)
+
+
+@receiver(post_delete, sender=Comment)
+def record_comment_deletion(sender, instance, **kwargs):
+    """Registra el borrado, también los que llegan en cascada desde el post"""
+    _tombstone('comments', instance.pk)
@@ -0,0 +1,253 @@
+"""
+Estructuras de conteo aproximado (sketches)
+
+- CountMinSketch: frecuencia aproximada de cada elemento. Nunca subestima;
+  con probabilidad 1 - delta sobreestima como mucho epsilon * N (N = total
+  de eventos), con width = ceil(e / epsilon) y depth = ceil(ln(1 / delta)).
+- HeavyHitters: Count-Min Sketch más un heap con los k elementos de mayor
+  frecuencia estimada.
+- HyperLogLog: número aproximado de elementos distintos, con error
+  estándar 1.04 / sqrt(2^p). Mientras tiene pocos registros ocupados los
+  guarda en un diccionario (representación dispersa).
+
+Todas usan hashes estables (blake2b), así que los sketches de procesos
+distintos se pueden combinar con merge(), y se serializan con to_dict() a
+estructuras que admite JSON.
+"""
+import base64
+import hashlib
+import heapq
+import math
+from array import array
+
+MASK_64 = (1 << 64) - 1
+
+
+def _hash128(item):
+    digest = hashlib.blake2b(str(item).encode(), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big')
+
+
+def _hash64(item):
+    return int.from_bytes(hashlib.blake2b(str(item).encode(), digest_size=8).digest(), 'big')
+
+
+def _encode(data):
+    return base64.b64encode(bytes(data)).decode('ascii')
+
+
+def _decode(text):
+    return base64.b64decode(text.encode('ascii'))
+
+
+class CountMinSketch:
+    """Frecuencias aproximadas con memoria fija de width * depth contadores"""
+
+    def __init__(self, width=2719, depth=5):
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self.rows = [array('q', bytes(8 * width)) for _ in range(depth)]
+
+    @classmethod
+    def from_error(cls, epsilon, delta):
+        """Sketch que sobreestima como mucho epsilon * N con probabilidad 1 - delta"""
+        return cls(math.ceil(math.e / epsilon), math.ceil(math.log(1 / delta)))
+
+    @property
+    def epsilon(self):
+        return math.e / self.width
+
+    @property
+    def error(self):
+        """Sobreestimación máxima (con probabilidad 1 - delta) de cualquier estimación"""
+        return self.epsilon * self.total
+
+    def _indexes(self, item):
+        # Doble hash de Kirsch-Mitzenmacher: depth índices con un solo blake2b
+        first, second = _hash128(item)
+        return [(first + row * second) % self.width for row in range(self.depth)]
+
+    def add(self, item, count=1):
+        """Suma `count` a `item` y retorna su nueva estimación"""
+        self.total += count
+        estimate = None
+        for row, index in zip(self.rows, self._indexes(item)):
+            row[index] += count
+            estimate = row[index] if estimate is None else min(estimate, row[index])
+        return estimate
+
+    def estimate(self, item):
+        return min(row[index] for row, index in zip(self.rows, self._indexes(item)))
+
+    def merge(self, other):
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Solo se pueden combinar sketches con las mismas dimensiones")
+        for row, other_row in zip(self.rows, other.rows):
+            for index, value in enumerate(other_row):
+                if value:
+                    row[index] += value
+        self.total += other.total
+        return self
+
+    def to_dict(self):
+        return {
+            'width': self.width,
+            'depth': self.depth,
+            'total': self.total,
+            'rows': [_encode(row.tobytes()) for row in self.rows],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['width'], data['depth'])
+        sketch.total = data['total']
+        for row, encoded in zip(sketch.rows, data['rows']):
+            row[:] = array('q', _decode(encoded))
+        return sketch
+
+
+class HeavyHitters:
+    """Los k elementos más frecuentes según un Count-Min Sketch"""
+
+    def __init__(self, k=50, sketch=None):
+        self.k = k
+        self.sketch = sketch or CountMinSketch()
+        self.candidates = {}  # {elemento: estimación}
+        # Min-heap de (estimación, elemento); las entradas desactualizadas se descartan al leer
+        self._heap = []
+
+    def _push(self, item, estimate):
+        self.candidates[item] = estimate
+        heapq.heappush(self._heap, (estimate, item))
+        if len(self._heap) > 4 * self.k:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        self._heap = [(estimate, item) for item, estimate in self.candidates.items()]
+        heapq.heapify(self._heap)
+
+    def _smallest(self):
+        while self._heap and self.candidates.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0]
+
+    def add(self, item, count=1):
+        estimate = self.sketch.add(item, count)
+        if item in self.candidates or len(self.candidates) < self.k:
+            self._push(item, estimate)
+            return
+        smallest, smallest_item = self._smallest()
+        if estimate > smallest:
+            heapq.heappop(self._heap)
+            del self.candidates[smallest_item]
+            self._push(item, estimate)
+
+    def estimate(self, item):
+        return self.sketch.estimate(item)
+
+    def top(self, limit=None):
+        """[(elemento, estimación)] de mayor a menor"""
+        ranked = sorted(self.candidates.items(), key=lambda entry: (-entry[1], entry[0]))
+        return ranked[:limit] if limit else ranked
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+        items = set(self.candidates) | set(other.candidates)
+        estimates = {item: self.sketch.estimate(item) for item in items}
+        self.candidates = dict(heapq.nlargest(self.k, estimates.items(), key=lambda entry: entry[1]))
+        self._rebuild_heap()
+        return self
+
+    def to_dict(self):
+        return {'k': self.k, 'sketch': self.sketch.to_dict(), 'candidates': list(self.candidates.items())}
+
+    @classmethod
+    def from_dict(cls, data):
+        heavy_hitters = cls(data['k'], CountMinSketch.from_dict(data['sketch']))
+        heavy_hitters.candidates = {item: estimate for item, estimate in data['candidates']}
+        heavy_hitters._rebuild_heap()
+        return heavy_hitters
+
+
+class HyperLogLog:
+    """Cardinalidad aproximada con 2^p registros de 6 bits (uno por byte)"""
+
+    def __init__(self, p=14):
+        if not 4 <= p <= 18:
+            raise ValueError("p debe estar entre 4 y 18")
+        self.p = p
+        self.m = 1 << p
+        self.sparse = {}  # {registro: rango} mientras hay pocos registros ocupados
+        self.dense = None  # bytearray de m registros
+
+    @property
+    def standard_error(self):
+        return 1.04 / math.sqrt(self.m)
+
+    def _set(self, index, rank):
+        if self.dense is not None:
+            if rank > self.dense[index]:
+                self.dense[index] = rank
+            return
+        if rank > self.sparse.get(index, 0):
+            self.sparse[index] = rank
+            # Un diccionario ocupa mucho más por entrada: se pasa a denso bastante antes de m
+            if len(self.sparse) > self.m // 16:
+                self._densify()
+
+    def _densify(self):
+        self.dense = bytearray(self.m)
+        for index, rank in self.sparse.items():
+            self.dense[index] = rank
+        self.sparse = {}
+
+    def add(self, item):
+        value = _hash64(item)
+        index = value >> (64 - self.p)
+        remaining = value & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - remaining.bit_length() + 1
+        self._set(index, rank)
+
+    def _registers(self):
+        if self.dense is not None:
+            return self.dense
+        return self.sparse.values()
+
+    def count(self):
+        registers = self._registers()
+        occupied = len(self.sparse) if self.dense is None else sum(1 for rank in registers if rank)
+        zeros = self.m - occupied
+        harmonic = zeros + sum(2.0 ** -rank for rank in registers if rank)
+        alpha = 0.7213 / (1 + 1.079 / self.m) if self.p >= 7 else {4: 0.673, 5: 0.697, 6: 0.709}[self.p]
+        estimate = alpha * self.m * self.m / harmonic
+        if estimate <= 2.5 * self.m and zeros:
+            # Corrección para cardinalidades pequeñas (linear counting)
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        if self.p != other.p:
+            raise ValueError("Solo se pueden combinar HyperLogLog con la misma precisión")
+        if other.dense is not None:
+            if self.dense is None:
+                self._densify()
+            self.dense = bytearray(max(a, b) for a, b in zip(self.dense, other.dense))
+        else:
+            for index, rank in other.sparse.items():
+                self._set(index, rank)
+        return self
+
+    def to_dict(self):
+        if self.dense is not None:
+            return {'p': self.p, 'dense': _encode(self.dense)}
+        return {'p': self.p, 'sparse': [[index, rank] for index, rank in self.sparse.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        hll = cls(data['p'])
+        if 'dense' in data:
+            hll.dense = bytearray(_decode(data['dense']))
+        else:
+            hll.sparse = {index: rank for index, rank in data['sparse']}
+        return hll
@@ -1,8 +1,14 @@
 """
 Vistas para funcionalidades de red social con Neo4j
 """
+import asyncio
+from functools import wraps
+from operator import itemgetter
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.contrib.auth.views import redirect_to_login
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
 from django.contrib import messages
@@ -10,6 +16,22 @@ from .neo4j_services import (
     Neo4jUserService, Neo4jPostService, Neo4jInterestService, 
     Neo4jAnalyticsService
 )
+from .neo4j_async_services import (
+    AsyncNeo4jUserService, AsyncNeo4jInterestService, AsyncNeo4jAnalyticsService
+)
+from .hydration import hydrate_users, users_by_id
+from . import analytics_cache, trending
+
+
+def async_login_required(view):
+    """login_required para vistas asíncronas (el de Django 4.2 solo admite vistas síncronas)"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
 
 
 @login_required
@@ -19,16 +41,10 @@ def friends_list(request):
     friends = user_service.get_friends(request.user.id)
     
     # Convertir nodos de Neo4j a usuarios de Django para mostrar en la plantilla
-    friends_data = []
-    for friend_node in friends:
-        try:
-            django_user = User.objects.get(id=friend_node.user_id)
-            friends_data.append({
-                'user': django_user,
-                'neo4j_node': friend_node
-            })
-        except User.DoesNotExist:
-            continue
+    friends_data = [
+        {'user': user, 'neo4j_node': friend_node}
+        for friend_node, user in hydrate_users(friends)
+    ]
     
     context = {
         'friends': friends_data,
@@ -108,16 +124,10 @@ def followers_list(request, username=None):
     user_service = Neo4jUserService()
     followers = user_service.get_followers(user.id)
     
-    followers_data = []
-    for follower_node in followers:
-        try:
-            django_user = User.objects.get(id=follower_node.user_id)
-            followers_data.append({
-                'user': django_user,
-                'neo4j_node': follower_node
-            })
-        except User.DoesNotExist:
-            continue
+    followers_data = [
+        {'user': user, 'neo4j_node': follower_node}
+        for follower_node, user in hydrate_users(followers)
+    ]
     
     context = {
         'followers': followers_data,
@@ -138,16 +148,10 @@ def following_list(request, username=None):
     user_service = Neo4jUserService()
     following = user_service.get_following(user.id)
     
-    following_data = []
-    for followed_node in following:
-        try:
-            django_user = User.objects.get(id=followed_node.user_id)
-            following_data.append({
-                'user': django_user,
-                'neo4j_node': followed_node
-            })
-        except User.DoesNotExist:
-            continue
+    following_data = [
+        {'user': user, 'neo4j_node': followed_node}
+        for followed_node, user in hydrate_users(following)
+    ]
     
     context = {
         'following': following_data,
@@ -183,11 +187,11 @@ def interests_list(request):
         return redirect('interests-list')
     
     # Obtener intereses trending para sugerencias
-    trending = Neo4jAnalyticsService.get_trending_interests(limit=15)
+    trending_interests = Neo4jAnalyticsService.get_trending_interests(limit=15)
     
     context = {
         'user_interests': user_interests,
-        'trending_interests': trending,
+        'trending_interests': trending_interests,
         'title': 'Mis Intereses'
     }
     return render(request, 'blog/interests_list.html', context)
@@ -197,23 +201,13 @@ def interests_list(request):
 def posts_by_interest(request, interest_name):
     """Vista para mostrar posts de un interés específico"""
     interest_service = Neo4jInterestService()
-    posts = interest_service.get_posts_by_interest(interest_name, limit=50)
+    posts = interest_service.get_posts_by_interest_with_authors(interest_name, limit=50)
     
     # Convertir posts de Neo4j a datos con información del autor
-    posts_data = []
-    for post_node in posts:
-        # Obtener autor del post
-        author_rel = post_node.author.all()
-        if author_rel:
-            author_node = author_rel[0]
-            try:
-                django_user = User.objects.get(id=author_node.user_id)
-                posts_data.append({
-                    'post': post_node,
-                    'author': django_user
-                })
-            except User.DoesNotExist:
-                continue
+    posts_data = [
+        {'post': item['post'], 'author': author}
+        for item, author in hydrate_users(posts, key=itemgetter('author_id'))
+    ]
     
     context = {
         'posts': posts_data,
@@ -223,48 +217,42 @@ def posts_by_interest(request, interest_name):
     return render(request, 'blog/posts_by_interest.html', context)
 
 
-@login_required
-def network_analytics(request):
+@async_login_required
+async def network_analytics(request):
     """Vista de análisis de red"""
-    analytics = Neo4jAnalyticsService()
-    
-    # Obtener estadísticas del usuario
-    user_stats = analytics.get_user_network_stats(request.user.id)
-    
-    # Obtener sugerencias (solo usuarios para seguir, no amigos)
-    suggested_to_follow = analytics.suggest_users_to_follow(request.user.id, limit=10)
-    
-    # Convertir a datos para template
-    suggested_to_follow_data = []
-    for suggestion in suggested_to_follow:
-        try:
-            user_node = suggestion['user']
-            django_user = User.objects.get(id=user_node.user_id)
-            suggested_to_follow_data.append({
-                'user': django_user,
-                'common_interests': suggestion['common_interests'],
-                'neo4j_node': user_node
-            })
-        except User.DoesNotExist:
-            continue
-    
-    # Obtener influencers (ahora devuelve diccionarios)
-    influencers = analytics.get_influencers(limit=10)
-    influencers_data = []
-    for influencer in influencers:
-        try:
-            user_node = influencer['user']
-            django_user = User.objects.get(id=user_node.user_id)
-            influencers_data.append({
-                'user': django_user,
-                'followers': influencer['followers'],
-                'neo4j_node': user_node
-            })
-        except User.DoesNotExist:
-            continue
-    
-    # Intereses trending (ahora devuelve diccionarios)
-    trending_interests = analytics.get_trending_interests(limit=10)
+    analytics = AsyncNeo4jAnalyticsService
+    
+    # Las cuatro consultas son independientes: corren a la vez
+    # (estadísticas, sugerencias para seguir, influencers y trending)
+    user_stats, suggested_to_follow, influencers, trending_interests = await asyncio.gather(
+        analytics.get_user_network_stats(request.user.id),
+        analytics.suggest_users_to_follow(request.user.id, limit=10),
+        analytics.get_influencers(limit=10),
+        analytics.get_trending_interests(limit=10),
+    )
+    
+    # Convertir a datos para template (una sola consulta para ambas listas)
+    users = await sync_to_async(users_by_id)(
+        [suggestion['user_id'] for suggestion in suggested_to_follow] +
+        [influencer['user'].user_id for influencer in influencers]
+    )
+    suggested_to_follow_data = [
+        {
+            'user': users[suggestion['user_id']],
+            'common_interests': suggestion['common_interests']
+        }
+        for suggestion in suggested_to_follow
+        if suggestion['user_id'] in users
+    ]
+    influencers_data = [
+        {
+            'user': users[influencer['user'].user_id],
+            'followers': influencer['followers'],
+            'neo4j_node': influencer['user']
+        }
+        for influencer in influencers
+        if influencer['user'].user_id in users
+    ]
     
     context = {
         'user_stats': user_stats,
@@ -273,47 +261,34 @@ def network_analytics(request):
         'trending_interests': trending_interests,
         'title': 'Análisis de Red'
     }
-    return render(request, 'blog/network_analytics.html', context)
+    return await sync_to_async(render)(request, 'blog/network_analytics.html', context)
 
 
-@login_required
-def user_profile_network(request, username):
+@async_login_required
+async def user_profile_network(request, username):
     """Vista de perfil de usuario con posts y estadísticas de red"""
     from .models import Post
-    from django.core.paginator import Paginator
+    from .pagination import paginate_by_cursor
     
-    user = get_object_or_404(User, username=username)
-    analytics = Neo4jAnalyticsService()
-    user_service = Neo4jUserService()
-    
-    # Obtener estadísticas del usuario
-    user_stats = analytics.get_user_network_stats(user.id)
-    
-    # Verificar si el usuario actual sigue al perfil
-    is_following = False
-    
-    if request.user.id != user.id:
-        # Verificar si sigue
-        following = user_service.get_following(request.user.id)
-        is_following = any(f.user_id == user.id for f in following)
-    
-    # Obtener intereses del usuario
-    interest_service = Neo4jInterestService()
-    user_interests = interest_service.get_user_interests(user.id)
+    user = await sync_to_async(get_object_or_404)(User, username=username)
     
-    # Obtener posts del usuario
-    posts_list = Post.objects.filter(username=user).order_by('-post_date')
-    paginator = Paginator(posts_list, 10)  # 10 posts por página
-    page_number = request.GET.get('page')
-    posts = paginator.get_page(page_number)
+    # Obtener posts del usuario (SQLite) mientras Neo4j resuelve estadísticas e intereses
+    posts_list = Post.objects.filter(username=user).select_related('username').prefetch_related('post_tags__type_id')
+    user_stats, user_interests, posts = await asyncio.gather(
+        AsyncNeo4jAnalyticsService.get_user_network_stats(user.id),
+        AsyncNeo4jInterestService.get_user_interests(user.id),
+        sync_to_async(paginate_by_cursor)(posts_list, request.GET.get('cursor'), 10),  # 10 posts por página
+    )
     
-    # Obtener lista de usuarios que el usuario actual está siguiendo (para botones de seguir)
+    # Verificar, en una sola consulta, si el usuario actual sigue al perfil
+    # y a los autores de la página (para botones de seguir)
     try:
-        following_users = user_service.get_following(request.user.id)
-        following_user_ids = {u.user_id for u in following_users}
+        author_ids = {post.username_id for post in posts} | {user.id}
+        following_user_ids = await AsyncNeo4jUserService.get_followed_ids(request.user.id, author_ids)
     except Exception as e:
         print(f"Error obteniendo usuarios seguidos: {e}")
         following_user_ids = set()
+    is_following = request.user.id != user.id and user.id in following_user_ids
     
     context = {
         'profile_user': user,
@@ -321,10 +296,11 @@ def user_profile_network(request, username):
         'is_following': is_following,
         'user_interests': user_interests,
         'posts': posts,
+        'liked_post_ids': await sync_to_async(Post.ids_liked_by)(request.user, posts),
         'following_user_ids': following_user_ids,
         'title': f'Perfil de {user.username}'
     }
-    return render(request, 'blog/user_profile_network.html', context)
+    return await sync_to_async(render)(request, 'blog/user_profile_network.html', context)
 
 
 # ============================================
@@ -334,62 +310,63 @@ def user_profile_network(request, username):
 @login_required
 def api_friend_suggestions(request):
     """API para obtener sugerencias de usuarios para seguir (basado en intereses comunes)"""
-    analytics = Neo4jAnalyticsService()
-    # Cambiar de suggest_friends a suggest_users_to_follow
-    suggestions = analytics.suggest_users_to_follow(request.user.id)
-    
-    # Convertir a formato JSON
-    suggestions_data = []
-    for suggestion in suggestions[:5]:  # Top 5 sugerencias
-        try:
-            django_user = User.objects.get(id=suggestion['user'].user_id)
-            suggestions_data.append({
-                'user_id': django_user.id,
-                'username': django_user.username,
+    def build():
+        # Cambiar de suggest_friends a suggest_users_to_follow
+        suggestions = Neo4jAnalyticsService.suggest_users_to_follow(request.user.id)
+        
+        # Convertir a formato JSON
+        top_suggestions = suggestions[:5]  # Top 5 sugerencias
+        return [
+            {
+                'user_id': user.id,
+                'username': user.username,
                 'common_interests': suggestion['common_interests']  # Cambiado de common_friends
-            })
-        except User.DoesNotExist:
-            continue
+            }
+            for suggestion, user in hydrate_users(top_suggestions, key=itemgetter('user_id'))
+        ]
     
+    # El widget se pide en cada página: se guarda ya serializado, por usuario
+    suggestions_data = analytics_cache.get_or_compute(
+        'suggestions-widget', build, user_id=request.user.id, ttl=analytics_cache.ttl_for('suggestions')
+    )
     return JsonResponse({'suggestions': suggestions_data})
 
 
 
 @login_required
 def api_trending_topics(request):
-    """API para obtener trending topics"""
-    analytics = Neo4jAnalyticsService()
-    trending = analytics.get_trending_interests()
+    """API para obtener trending topics (?window=1h|24h|7d, por defecto 24h)"""
+    window = request.GET.get('window', trending.DEFAULT_WINDOW)
+    if window not in trending.WINDOWS:
+        return JsonResponse({'error': f'Ventana no válida: {window}'}, status=400)
     
     trending_data = [
         {
-            'name': topic['interest'].name,
+            'name': topic['name'],
             'count': topic['count']
         }
-        for topic in trending[:10]  # Top 10 trending
+        for topic in Neo4jAnalyticsService.get_trending_interests(limit=10, window=window)  # Top 10 trending
     ]
-    
-    return JsonResponse({'trending': trending_data})
+    return JsonResponse({'trending': trending_data, 'window': window})
 
 
 @login_required
 def api_influencers(request):
     """API para obtener usuarios influencers"""
-    analytics = Neo4jAnalyticsService()
-    influencers = analytics.get_influencers()
-    
-    influencers_data = []
-    for influencer in influencers[:5]:  # Top 5 influencers
-        try:
-            django_user = User.objects.get(id=influencer['user'].user_id)
-            influencers_data.append({
-                'user_id': django_user.id,
-                'username': django_user.username,
+    def build():
+        top_influencers = Neo4jAnalyticsService.get_influencers()[:5]  # Top 5 influencers
+        return [
+            {
+                'user_id': user.id,
+                'username': user.username,
                 'followers': influencer['followers']
-            })
-        except User.DoesNotExist:
-            continue
+            }
+            for influencer, user in hydrate_users(top_influencers, key=lambda influencer: influencer['user'].user_id)
+        ]
     
+    influencers_data = analytics_cache.get_or_compute(
+        'influencers-widget', build, ttl=analytics_cache.ttl_for('influencers')
+    )
     return JsonResponse({'influencers': influencers_data})
 
 
@@ -502,9 +479,16 @@ def network_graph_data(request, username):
             'font': {'size': 16, 'color': '#ffffff', 'face': 'Arial'}
         }
         
+        # Resolver todos los usuarios de Django en una sola consulta
+        users = users_by_id(
+            [node.user_id for node in followers] + [node.user_id for node in following]
+        )
+        
         # Agregar seguidores
         for follower_data in followers:
-            follower_user = User.objects.get(id=follower_data.user_id)
+            follower_user = users.get(follower_data.user_id)
+            if follower_user is None:
+                continue
             if follower_user.id not in nodes:
                 nodes[follower_user.id] = {
                     'id': follower_user.id,
@@ -524,7 +508,9 @@ def network_graph_data(request, username):
         
         # Agregar seguidos
         for following_data in following:
-            followed_user = User.objects.get(id=following_data.user_id)
+            followed_user = users.get(following_data.user_id)
+            if followed_user is None:
+                continue
             if followed_user.id not in nodes:
                 nodes[followed_user.id] = {
                     'id': followed_user.id,
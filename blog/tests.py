@@ -1,8 +1,39 @@
+import ast
+import asyncio
+import contextlib
+import glob
+import json
+import os
+import tempfile
+import threading
+import textwrap
+import time
+from operator import itemgetter
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
+from neo4j import READ_ACCESS, WRITE_ACCESS
 
-from .models import Post, PostTag, Type
+from .hydration import hydrate_users
+from .middleware import Neo4jSessionMiddleware
+from .management.commands.migrate_to_neo4j import Command as MigrateCommand
+from .models import OutboxEntry, OutboxLease, Post, PostTag, SyncTombstone, Type
+from . import analytics_cache, engagement, neo4j_connection, neo4j_request_cache, outbox, recommendations
+from .neo4j_services import Neo4jBulkService, Neo4jPostService, Neo4jTimelineService, Neo4jUserService
+from .neo4j_schema import plan_operators
+from .sketches import CountMinSketch, HeavyHitters, HyperLogLog
+from . import query_plans
+from .query_plans import collect_queries, compare, sample_params
+from .trending import TrendingEngine
+from .views import PAGINATION_COUNT, _process_hashtags
 
 
 class PostListViewTests(TestCase):
@@ -48,3 +79,800 @@ class PostListViewTests(TestCase):
 		self.assertEqual(len(posts), 1)
 		self.assertEqual(posts[0], self.post_dog)
 		self.assertEqual(response.context['active_type'], 'perros')
+
+
+class CursorPaginationTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		user_model = get_user_model()
+		cls.user = user_model.objects.create_user(username='bob', password='password123')
+		same_date = timezone.now()
+		cls.posts = [
+			Post.objects.create(post_content=f'Post {i}', username=cls.user, post_date=same_date)
+			for i in range(PAGINATION_COUNT + 5)
+		]
+
+	def setUp(self):
+		self.client.force_login(self.user)
+
+	def test_next_and_previous_cursors_walk_the_feed(self):
+		first = self.client.get(reverse('blog-home'))
+		first_page = list(first.context['posts'])
+		self.assertEqual(len(first_page), PAGINATION_COUNT)
+		self.assertFalse(first.context['page_obj'].has_previous())
+
+		second = self.client.get(reverse('blog-home'), {'cursor': first.context['page_obj'].next_cursor})
+		second_page = list(second.context['posts'])
+		self.assertEqual(len(second_page), 5)
+		self.assertFalse(second.context['page_obj'].has_next())
+		self.assertFalse(set(first_page) & set(second_page))
+
+		back = self.client.get(reverse('blog-home'), {'cursor': second.context['page_obj'].previous_cursor})
+		self.assertEqual(list(back.context['posts']), first_page)
+
+	def test_invalid_cursor_falls_back_to_first_page(self):
+		response = self.client.get(reverse('blog-home'), {'cursor': 'no-es-un-cursor'})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(response.context['posts']), PAGINATION_COUNT)
+
+
+class PostCounterTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		user_model = get_user_model()
+		cls.user = user_model.objects.create_user(username='carol', password='password123')
+		cls.post = Post.objects.create(post_content='Contador', username=cls.user)
+
+	def setUp(self):
+		self.client.force_login(self.user)
+
+	def test_like_toggle_updates_like_count(self):
+		url = reverse('like-post', kwargs={'pk': self.post.pk})
+		response = self.client.post(url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+		self.assertEqual(response.json(), {'liked': True, 'likes': 1})
+
+		response = self.client.post(url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+		self.assertEqual(response.json(), {'liked': False, 'likes': 0})
+		self.post.refresh_from_db()
+		self.assertEqual(self.post.like_count, 0)
+
+	def test_like_toggle_adds_or_removes_only_the_users_row(self):
+		others = [get_user_model().objects.create_user(username=f'fan{i}', password='password123') for i in range(3)]
+		self.post.likes.add(*others)
+		Post.recount_counters()
+		likes = Post.likes.through.objects.filter(post_id=self.post.pk)
+		url = reverse('like-post', kwargs={'pk': self.post.pk})
+
+		for expected, liked in ((4, True), (3, False)):
+			self.client.post(url)
+			self.post.refresh_from_db()
+			self.assertEqual(likes.count(), expected)
+			self.assertEqual(self.post.like_count, expected)
+			self.assertEqual(likes.filter(user_id=self.user.pk).exists(), liked)
+		self.assertEqual(set(likes.values_list('user_id', flat=True)), {user.pk for user in others})
+
+	def test_like_toggle_marks_post_for_incremental_sync(self):
+		before = timezone.now()
+		self.client.post(reverse('like-post', kwargs={'pk': self.post.pk}))
+
+		changed = Post.objects.filter(likes_updated_at__gte=before)
+		self.assertEqual(list(changed), [self.post])
+
+	def test_comment_create_and_delete_update_comment_count(self):
+		self.client.post(reverse('post-detail', kwargs={'pk': self.post.pk}), {'comment_content': 'Hola'})
+		self.post.refresh_from_db()
+		self.assertEqual(self.post.comment_count, 1)
+
+		comment = self.post.comments.get()
+		self.client.post(reverse('comment-delete', kwargs={'pk': comment.pk}))
+		self.post.refresh_from_db()
+		self.assertEqual(self.post.comment_count, 0)
+		self.assertFalse(self.post.comments.exists())
+
+	def test_home_query_count_does_not_depend_on_page_size(self):
+		for i in range(5):
+			post = Post.objects.create(post_content=f'Extra {i}', username=self.user)
+			post.likes.add(self.user)
+		Post.recount_counters()
+
+		with self.assertNumQueries(5):
+			response = self.client.get(reverse('blog-home'))
+		self.assertEqual(len(response.context['liked_post_ids']), 5)
+
+
+class ProcessHashtagsTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		user_model = get_user_model()
+		cls.user = user_model.objects.create_user(username='dave', password='password123')
+
+	def test_edit_only_changes_modified_tags(self):
+		post = Post.objects.create(post_content='#Gatos y #perros', username=self.user)
+		_process_hashtags(post)
+		kept = PostTag.objects.get(post_id=post, type_id__type_name='gatos')
+
+		post.post_content = 'Solo #gatos y #aves #AVES'
+		post.save()
+		with self.assertNumQueries(5):
+			_process_hashtags(post)
+
+		names = set(post.post_tags.values_list('type_id__type_name', flat=True))
+		self.assertEqual(names, {'gatos', 'aves'})
+		self.assertTrue(PostTag.objects.filter(pk=kept.pk).exists())
+
+
+class HydrateUsersTests(TestCase):
+	def test_preserves_order_and_drops_missing_ids(self):
+		user_model = get_user_model()
+		first = user_model.objects.create_user(username='erin', password='password123')
+		second = user_model.objects.create_user(username='frank', password='password123')
+
+		nodes = [SimpleNamespace(user_id=user_id) for user_id in (second.id, 999999, first.id)]
+
+		with self.assertNumQueries(1):
+			pairs = hydrate_users(nodes)
+		self.assertEqual(pairs, [(nodes[0], second), (nodes[2], first)])
+
+	def test_key_reads_user_id_from_dicts(self):
+		user = get_user_model().objects.create_user(username='gina', password='password123')
+		items = [{'author_id': user.id}, {'author_id': 999999}]
+
+		self.assertEqual(hydrate_users(items, key=itemgetter('author_id')), [(items[0], user)])
+
+
+class OutboxTests(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		user_model = get_user_model()
+		cls.user = user_model.objects.create_user(username='grace', password='password123')
+
+	def setUp(self):
+		self.client.force_login(self.user)
+		OutboxEntry.objects.all().delete()
+
+	def test_post_create_enqueues_neo4j_changes_in_order(self):
+		self.client.post(reverse('post-create'), {'post_content': 'Hola #outbox'})
+		post = Post.objects.get()
+
+		entries = list(OutboxEntry.objects.values_list('operation', 'payload'))
+		self.assertEqual([operation for operation, _ in entries], ['create_post'])
+		self.assertEqual(entries[0][1], {
+			'post_id': post.post_id,
+			'user_id': self.user.id,
+			'content': 'Hola #outbox',
+		})
+
+	def test_comment_delete_enqueues_neo4j_delete(self):
+		post = Post.objects.create(post_content='Con comentario', username=self.user)
+		self.client.post(reverse('post-detail', kwargs={'pk': post.pk}), {'comment_content': 'Hola'})
+		comment = post.comments.get()
+		self.client.post(reverse('comment-delete', kwargs={'pk': comment.pk}))
+
+		operations = list(OutboxEntry.objects.values_list('operation', flat=True))
+		self.assertEqual(operations, ['create_comment', 'delete_comment'])
+
+	def test_failed_fan_out_keeps_entry_pending(self):
+		outbox.enqueue('create_post', post_id=1, user_id=self.user.id, content='Hola')
+
+		with mock.patch.object(outbox, 'neo4j_session', contextlib.nullcontext), \
+				mock.patch.object(outbox, '_neo4j_available', return_value=True), \
+				mock.patch.object(outbox.Neo4jPostService, 'create_post', return_value=object()), \
+				mock.patch.object(outbox.Neo4jTimelineService, 'fan_out_post', return_value=None):
+			applied, error = outbox.drain()
+
+		entry = OutboxEntry.objects.get()
+		self.assertEqual(applied, 0)
+		self.assertIn('distribuir', error)
+		self.assertEqual((entry.status, entry.attempts), (OutboxEntry.PENDING, 1))
+
+	def test_like_from_a_user_missing_in_neo4j_syncs_the_user_first(self):
+		outbox.enqueue('like_post', user_id=self.user.id, post_id=1)
+
+		with mock.patch.object(outbox, 'neo4j_session', contextlib.nullcontext), \
+				mock.patch.object(outbox.Neo4jPostService, 'like_post', side_effect=[False, True]) as like, \
+				mock.patch.object(outbox.Neo4jUserService, 'create_or_update_user', return_value=object()) as upsert:
+			applied, error = outbox.drain()
+
+		self.assertEqual((applied, error), (1, None))
+		self.assertEqual(like.call_count, 2)
+		self.assertEqual(upsert.call_args.args[:2], (self.user.id, 'grace'))
+		self.assertFalse(OutboxEntry.objects.exists())
+
+	def test_only_one_drainer_at_a_time(self):
+		outbox.enqueue('unlike_post', user_id=self.user.id, post_id=1)
+		self.assertTrue(outbox._acquire_lease('otro'))
+
+		with self.assertRaises(outbox.OutboxBusy):
+			outbox.drain()
+		self.assertEqual(OutboxEntry.objects.count(), 1)
+
+		# Un candado vencido (drainer caído) se puede tomar
+		OutboxLease.objects.update(expires_at=timezone.now())
+		with mock.patch.object(outbox, 'neo4j_session', contextlib.nullcontext), \
+				mock.patch.object(outbox.Neo4jPostService, 'unlike_post'):
+			self.assertEqual(outbox.drain(), (1, None))
+		self.assertEqual(OutboxLease.objects.get().owner, '')
+
+
+class FollowedIdsTests(TestCase):
+	def setUp(self):
+		edges = {(1, 2), (1, 4), (3, 1)}
+
+		def run(query, params, **kwargs):
+			return [[target] for target in params['target_ids'] if (params['user_id'], target) in edges], []
+
+		patcher = mock.patch('blog.neo4j_services.cypher_query', side_effect=run)
+		self.query = patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def test_returns_only_existing_follow_edges(self):
+		self.assertEqual(Neo4jUserService.get_followed_ids(1, [2, 3, 4, 2]), {2, 4})
+		self.assertEqual(sorted(self.query.call_args.args[1]['target_ids']), [2, 3, 4])
+		self.assertTrue(Neo4jUserService.is_following(1, 2))
+		self.assertFalse(Neo4jUserService.is_following(1, 3))
+
+	def test_empty_page_does_not_query(self):
+		self.assertEqual(Neo4jUserService.get_followed_ids(1, []), set())
+		self.query.assert_not_called()
+
+
+class Neo4jPostTagTests(TestCase):
+	def test_create_and_update_write_every_tag_in_one_query(self):
+		with mock.patch('blog.neo4j_services.cypher_query', return_value=([], [])) as query:
+			Neo4jPostService.create_post(1, 2, '#Python #django #python #neo4j')
+			self.assertEqual(query.call_count, 1)
+			self.assertEqual(query.call_args.args[1]['tags'], ['python', 'django', 'neo4j'])
+
+			query.reset_mock()
+			Neo4jPostService.update_post(1, 'Solo #django y #go')
+			self.assertEqual(query.call_count, 1)
+			self.assertEqual(query.call_args.args[1]['tags'], ['django', 'go'])
+
+
+@override_settings(FEED_FANOUT_FOLLOWER_THRESHOLD=10, FEED_FANOUT_RELEASE_THRESHOLD=8)
+class TimelineFanoutTests(TestCase):
+	def follow(self, method, followers_count, pull_based):
+		"""Ejecuta follow/unfollow con el grafo simulado y retorna los cambios de modo"""
+		with mock.patch('blog.neo4j_services.cypher_query', return_value=([[followers_count, pull_based]], [])), \
+				mock.patch.object(Neo4jTimelineService, 'switch_to_pull') as to_pull, \
+				mock.patch.object(Neo4jTimelineService, 'switch_to_push') as to_push, \
+				mock.patch.object(Neo4jTimelineService, 'backfill'), \
+				mock.patch.object(Neo4jTimelineService, 'prune'):
+			self.assertTrue(method(1, 2))
+		return to_pull.call_args_list, to_push.call_args_list
+
+	def test_push_author_below_threshold_keeps_fanning_out(self):
+		self.assertEqual(self.follow(Neo4jUserService.follow_user, 9, False), ([], []))
+
+	def test_author_switches_to_pull_when_crossing_the_threshold(self):
+		self.assertEqual(self.follow(Neo4jUserService.follow_user, 10, False), ([mock.call(2)], []))
+		# Ya en pull, más seguidores no repiten la migración
+		self.assertEqual(self.follow(Neo4jUserService.follow_user, 11, True), ([], []))
+
+	def test_pull_author_only_returns_to_push_below_the_release_threshold(self):
+		self.assertEqual(self.follow(Neo4jUserService.unfollow_user, 9, True), ([], []))
+		self.assertEqual(self.follow(Neo4jUserService.unfollow_user, 7, True), ([], [mock.call(2)]))
+
+	def test_feed_reads_the_stored_mode_instead_of_counting_followers(self):
+		with mock.patch('blog.neo4j_services.cypher_query', return_value=([], [])) as query:
+			Neo4jTimelineService.read_timeline(1)
+			Neo4jTimelineService.fan_out_post(5, 1)
+		for call in query.call_args_list:
+			self.assertIn('pull_based', call.args[0])
+			self.assertNotIn('COUNT {', call.args[0])
+
+
+class BulkMigrationResumeTests(TransactionTestCase):
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.checkpoint = os.path.join(directory.name, 'checkpoint.json')
+		self.watermark = os.path.join(directory.name, 'watermark.json')
+		user = get_user_model().objects.create_user(username='judy', password='password123')
+		self.posts = [Post.objects.create(post_content=f'Post {i}', username=user) for i in range(5)]
+		self.written = []
+
+	def migrate(self, fail_after=None, resume=False):
+		def upsert_posts(rows):
+			if fail_after is not None and len(self.written) >= fail_after:
+				raise RuntimeError('Neo4j no disponible')
+			self.written.extend(row['post_id'] for row in rows)
+			return len(rows)
+
+		args = ['--bulk', '--chunk-size', '2', '--workers', '1',
+				'--checkpoint-file', self.checkpoint, '--watermark-file', self.watermark]
+		with mock.patch('blog.management.commands.migrate_to_neo4j.init_neo4j_connection', return_value=True), \
+				mock.patch.object(Neo4jBulkService, 'upsert_users', side_effect=len), \
+				mock.patch.object(Neo4jBulkService, 'upsert_posts', side_effect=upsert_posts), \
+				mock.patch.object(Neo4jBulkService, 'upsert_comments', side_effect=len), \
+				mock.patch.object(Neo4jBulkService, 'upsert_likes', side_effect=len):
+			call_command('migrate_to_neo4j', *args, *(['--resume'] if resume else []), stdout=mock.Mock())
+
+	def test_resume_continues_after_the_last_checkpointed_chunk(self):
+		post_ids = [post.post_id for post in self.posts]
+		with self.assertRaises(RuntimeError):
+			self.migrate(fail_after=2)
+		with open(self.checkpoint) as f:
+			self.assertEqual(json.load(f)['posts'], post_ids[1])
+
+		self.migrate(resume=True)
+		# Cada post se escribe una sola vez y el checkpoint se borra al terminar
+		self.assertEqual(self.written, post_ids)
+		self.assertFalse(os.path.exists(self.checkpoint))
+		with open(self.watermark) as f:
+			self.assertEqual(json.load(f)['posts'], post_ids[-1])
+
+
+class DeltaSyncTests(TestCase):
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.watermark = os.path.join(directory.name, 'watermark.json')
+		self.user = get_user_model().objects.create_user(username='kim', password='password123')
+
+	def test_since_replays_tombstones_and_fans_out_new_posts(self):
+		old = Post.objects.create(post_content='Antiguo', username=self.user)
+		old_id, since = old.pk, timezone.now()
+		old.delete()
+		new = Post.objects.create(post_content='Nuevo', username=self.user)
+		self.assertEqual(list(SyncTombstone.objects.values_list('entity', 'object_id')), [('posts', old_id)])
+
+		with mock.patch('blog.management.commands.migrate_to_neo4j.init_neo4j_connection', return_value=True), \
+				mock.patch.multiple(Neo4jBulkService, upsert_users=mock.DEFAULT, upsert_posts=mock.DEFAULT,
+									upsert_comments=mock.DEFAULT, upsert_likes=mock.DEFAULT,
+									delete_users=mock.DEFAULT, delete_posts=mock.DEFAULT,
+									delete_comments=mock.DEFAULT, get_id_page=mock.DEFAULT) as bulk, \
+				mock.patch.object(Neo4jTimelineService, 'fan_out_post', return_value=1) as fan_out:
+			for name in ('upsert_users', 'upsert_posts', 'upsert_comments', 'upsert_likes'):
+				bulk[name].side_effect = len
+			call_command('migrate_to_neo4j', '--since', since.isoformat(),
+						 '--watermark-file', self.watermark, stdout=mock.Mock())
+
+		bulk['delete_posts'].assert_called_once_with([old_id])
+		bulk['delete_users'].assert_not_called()
+		# Sin --scan-deletions no se recorren los ids del grafo
+		bulk['get_id_page'].assert_not_called()
+		fan_out.assert_called_once_with(new.pk, self.user.id)
+
+
+class ClearNeo4jTests(TestCase):
+	def clear(self, run):
+		with mock.patch('blog.management.commands.migrate_to_neo4j.cypher_query', side_effect=run) as query:
+			MigrateCommand(stdout=mock.Mock()).clear_neo4j(batch_size=2)
+		return query
+
+	def test_deletes_each_type_and_label_in_batches(self):
+		remaining = {'FOLLOWS': 3, 'UserNode': 2, 'sin etiqueta': 0}
+
+		def run(query, params=None):
+			if query == 'CALL db.relationshipTypes()':
+				return [['FOLLOWS']], []
+			if query == 'CALL db.labels()':
+				return [['UserNode']], []
+			self.assertEqual(params, {'batch_size': 2})
+			name = 'FOLLOWS' if 'FOLLOWS' in query else 'UserNode' if 'UserNode' in query else 'sin etiqueta'
+			deleted = min(remaining[name], params['batch_size'])
+			remaining[name] -= deleted
+			return [[deleted]], []
+
+		query = self.clear(run)
+		self.assertEqual(remaining, {'FOLLOWS': 0, 'UserNode': 0, 'sin etiqueta': 0})
+		# 2 lecturas de esquema + (2 lotes + 1 vacío) relaciones + (1 lote + 1 vacío) nodos + 1 sin etiqueta
+		self.assertEqual(query.call_count, 8)
+
+	def test_failed_batch_stops_the_command(self):
+		def run(query, params=None):
+			if query.startswith('CALL'):
+				return [['FOLLOWS']], []
+			raise RuntimeError('Neo4j no disponible')
+
+		with self.assertRaisesMessage(CommandError, 'Neo4j no disponible'):
+			self.clear(run)
+
+
+class PlanOperatorsTests(TestCase):
+	def test_collects_operators_from_nested_plan(self):
+		plan = {
+			'operatorType': 'ProduceResults@neo4j',
+			'children': [{
+				'operatorType': 'Top@neo4j',
+				'children': [{'operatorType': 'NodeByLabelScan@neo4j', 'children': []}],
+			}],
+		}
+		self.assertEqual(plan_operators(plan), ['ProduceResults', 'Top', 'NodeByLabelScan'])
+
+	def test_empty_plan(self):
+		self.assertEqual(plan_operators(None), [])
+
+
+class SchemaStartupTests(TestCase):
+	def test_ready_ensures_schema_only_when_enabled(self):
+		config = apps.get_app_config('blog')
+		with mock.patch.object(neo4j_connection, 'init_neo4j_connection') as init:
+			with override_settings(NEO4J_ENSURE_SCHEMA=False):
+				config.ready()
+			init.assert_not_called()
+			with override_settings(NEO4J_ENSURE_SCHEMA=True):
+				config.ready()
+			init.assert_called_once_with()
+
+
+class SessionReuseTests(TestCase):
+	def test_one_session_per_access_mode_during_a_request(self):
+		driver = mock.Mock()
+		driver.session.side_effect = lambda default_access_mode, **kwargs: mock.Mock(mode=default_access_mode)
+		used = []
+
+		def view(request):
+			for mode in (WRITE_ACCESS, READ_ACCESS, WRITE_ACCESS, READ_ACCESS):
+				with neo4j_connection.neo4j_session(mode) as session:
+					used.append(session)
+			return 'respuesta'
+
+		with mock.patch.object(neo4j_connection, 'get_neo4j_driver', return_value=driver), \
+				mock.patch.object(neo4j_connection, 'get_neo4j_read_driver', return_value=driver):
+			self.assertEqual(Neo4jSessionMiddleware(view)(None), 'respuesta')
+			self.assertEqual(Neo4jSessionMiddleware(view)(None), 'respuesta')
+
+		self.assertEqual([session.mode for session in used[:2]], [WRITE_ACCESS, READ_ACCESS])
+		self.assertEqual(used[:2], used[2:4])
+		# Cada petición abre (y cierra) sus propias dos sesiones
+		self.assertEqual(driver.session.call_count, 4)
+		self.assertFalse(set(map(id, used[:4])) & set(map(id, used[4:])))
+		for session in used:
+			session.close.assert_called_once_with()
+
+
+class CloseConnectionTests(TestCase):
+	def test_close_releases_the_read_driver_too(self):
+		driver, read_driver = mock.Mock(), mock.Mock()
+		with mock.patch.multiple(neo4j_connection, _driver=driver, _read_driver=read_driver,
+								 _driver_pid=os.getpid(), _async_runner=None, _configured=True), \
+				mock.patch.object(neo4j_connection.db, 'close_connection'):
+			neo4j_connection.close_neo4j_connection()
+			driver.close.assert_called_once_with()
+			read_driver.close.assert_called_once_with()
+			self.assertIsNone(neo4j_connection._read_driver)
+			self.assertIsNone(neo4j_connection._driver_pid)
+			# La siguiente lectura con réplica no reutiliza el driver cerrado
+			with override_settings(NEO4J_READ_URI='bolt://replica:7687'), \
+					mock.patch.object(neo4j_connection, '_build_driver', side_effect=lambda uri: mock.Mock(uri=uri)):
+				self.assertEqual(neo4j_connection.get_neo4j_read_driver().uri, 'bolt://replica:7687')
+
+
+class BookmarkTests(TestCase):
+	def test_read_sessions_share_the_write_bookmarks(self):
+		with neo4j_connection.neo4j_session(READ_ACCESS) as session:
+			self.assertIs(session._config.bookmark_manager, neo4j_connection._bookmark_manager)
+
+		manager = neo4j_connection._bookmark_manager
+		with mock.patch.object(manager, 'get_bookmarks', return_value={'bookmark:1'}):
+			bookmarks = async_to_sync(neo4j_connection._async_bookmark_manager.get_bookmarks)()
+		self.assertEqual(bookmarks, {'bookmark:1'})
+
+
+class QueryPlanTests(TestCase):
+	def test_collects_service_queries(self):
+		queries = collect_queries()
+		self.assertIn('Neo4jAnalyticsService.get_influencers', queries)
+		# Las consultas compartidas se resuelven igual en la versión síncrona y la asíncrona
+		self.assertEqual(
+			queries['AsyncNeo4jAnalyticsService.get_influencers'],
+			queries['Neo4jAnalyticsService.get_influencers'],
+		)
+		self.assertIn('Neo4jPostService.get_all_posts', queries)
+		self.assertTrue(queries['Neo4jPostService.get_all_posts'].startswith('MATCH'))
+
+	def test_every_service_query_is_static(self):
+		skipped = []
+		queries = collect_queries(skipped)
+		self.assertEqual(skipped, [])
+		self.assertIn('Neo4jBulkService.get_id_page[comments]', queries)
+
+	def test_dict_queries_are_measured_and_f_strings_reported(self):
+		source = textwrap.dedent('''
+			class Neo4jBulkService:
+				def page(entity):
+					query = QUERIES[entity]
+
+				def dynamic(label):
+					query = f"MATCH (n:{label}) RETURN n"
+		''')
+		module = SimpleNamespace(QUERIES={'users': 'MATCH (u:UserNode) RETURN u'})
+		skipped = []
+		queries = query_plans._module_queries(ast.parse(source), module, skipped)
+		self.assertEqual(queries, {'Neo4jBulkService.page[users]': 'MATCH (u:UserNode) RETURN u'})
+		self.assertEqual(skipped, ['Neo4jBulkService.dynamic'])
+
+	def test_seed_graph_contains_the_sample_parameters(self):
+		users, relationships, posts, comments, likes = query_plans.seed_rows()
+		self.assertEqual(query_plans.seed_rows()[2], posts)
+		user_ids = {user['user_id'] for user in users}
+		self.assertTrue({1, 2, 3} <= user_ids)
+		self.assertIn('python', {tag for post in posts for tag in post['tags']})
+		self.assertTrue({post['user_id'] for post in posts} <= user_ids)
+		self.assertTrue({like['user_id'] for like in likes} <= user_ids)
+
+	def test_sample_params_cover_every_parameter(self):
+		params = sample_params('MATCH (u:UserNode {user_id: $user_id}) WHERE u.user_id IN $target_ids RETURN u LIMIT $limit')
+		self.assertEqual(params, {'user_id': 1, 'target_ids': [1, 2, 3], 'limit': 10})
+
+	def test_compare_flags_new_scan_and_db_hit_growth(self):
+		baseline = {
+			'a': {'operators': ['NodeIndexSeek'], 'db_hits': 100, 'rows': 1},
+			'b': {'operators': ['Expand(All)'], 'db_hits': 100, 'rows': 1},
+		}
+		current = {
+			'a': {'operators': ['NodeByLabelScan'], 'db_hits': 100, 'rows': 1},
+			'b': {'operators': ['Expand(All)'], 'db_hits': 400, 'rows': 1},
+			'c': {'operators': ['Eager'], 'db_hits': 1, 'rows': 1},
+		}
+		regressions, notes = compare(baseline, current)
+		self.assertEqual(len(regressions), 2)
+		self.assertIn('NodeByLabelScan', regressions[0])
+		self.assertEqual(notes, ['c: consulta nueva, sin línea base'])
+
+
+class AsyncSocialViewTests(TestCase):
+	def test_async_views_redirect_anonymous_users_to_login(self):
+		user_model = get_user_model()
+		user_model.objects.create_user(username='heidi', password='password123')
+		for url in (reverse('network-analytics'), reverse('user-profile-network', kwargs={'username': 'heidi'})):
+			response = self.client.get(url)
+			self.assertRedirects(response, f"{reverse('login')}?next={url}", fetch_redirect_response=False)
+
+
+class AsyncDriverLoopTests(TestCase):
+	def test_queries_from_different_loops_share_the_driver_loop(self):
+		loops = []
+
+		async def run_query(query, params, access_mode):
+			loops.append(asyncio.get_running_loop())
+			return [[1]], ['n']
+
+		with mock.patch.object(neo4j_connection, '_run_async_query', run_query):
+			# Bajo WSGI cada vista asíncrona corre en un loop nuevo
+			for _ in range(2):
+				result = asyncio.run(neo4j_connection.async_cypher_query('RETURN 1'))
+				self.assertEqual(result, ([[1]], ['n']))
+
+		self.assertEqual(loops, [neo4j_connection._async_loop()['loop']] * 2)
+
+
+class RequestCacheTests(TestCase):
+	def test_identity_map_loads_once_per_request(self):
+		loads = []
+		with neo4j_request_cache.request_cache():
+			first = neo4j_request_cache.identity('UserNode', 1, lambda: loads.append(1) or object())
+			second = neo4j_request_cache.identity('UserNode', 1, lambda: loads.append(1) or object())
+		self.assertIs(first, second)
+		self.assertEqual(len(loads), 1)
+
+	def test_writes_invalidate_and_nothing_is_kept_outside_a_request(self):
+		key = neo4j_request_cache.query_key('MATCH (u) RETURN u', {'ids': [1, 2]})
+		with neo4j_request_cache.request_cache():
+			neo4j_request_cache.set_cached(key, 'resultado')
+			self.assertEqual(neo4j_request_cache.get_cached(key), (True, 'resultado'))
+			neo4j_request_cache.invalidate()
+			self.assertEqual(neo4j_request_cache.get_cached(key), (False, None))
+		neo4j_request_cache.set_cached(key, 'resultado')
+		self.assertEqual(neo4j_request_cache.get_cached(key), (False, None))
+
+
+class AnalyticsCacheTests(TestCase):
+	def setUp(self):
+		analytics_cache._cache().clear()
+
+	def test_deploy_check_warns_about_process_local_backend(self):
+		self.assertEqual([w.id for w in analytics_cache.check_shared_backend()], ['blog.W001'])
+
+		shared = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379/1'}
+		with override_settings(CACHES={'default': shared, 'analytics': shared}):
+			self.assertEqual(analytics_cache.check_shared_backend(), [])
+
+	def test_concurrent_misses_compute_once(self):
+		calls = []
+
+		def compute():
+			calls.append(1)
+			time.sleep(0.2)
+			return ['python']
+
+		results = []
+		threads = [
+			threading.Thread(target=lambda: results.append(analytics_cache.get_or_compute('influencers', compute, 10)))
+			for _ in range(5)
+		]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.assertEqual(len(calls), 1)
+		self.assertEqual(results, [['python']] * 5)
+
+	def test_invalidate_user_only_drops_that_users_results(self):
+		analytics_cache.get_or_compute('suggestions', lambda: 'alice', 10, user_id=1)
+		analytics_cache.get_or_compute('suggestions', lambda: 'bob', 10, user_id=2)
+		analytics_cache.invalidate_user(1)
+		self.assertEqual(analytics_cache.get_or_compute('suggestions', lambda: 'nuevo', 10, user_id=1), 'nuevo')
+		self.assertEqual(analytics_cache.get_or_compute('suggestions', lambda: 'nuevo', 10, user_id=2), 'bob')
+
+
+class TrendingEngineTests(TestCase):
+	def setUp(self):
+		self.now = 1_000_000.0
+		self.engine = TrendingEngine(clock=lambda: self.now)
+
+	def test_recent_tags_outrank_older_ones_with_the_same_count(self):
+		self.engine.record(['antiguo'] * 3, self.now - 20 * 3600)
+		self.engine.record(['nuevo'] * 3, self.now - 60)
+		top = self.engine.top('24h')
+		self.assertEqual([item['name'] for item in top], ['nuevo', 'antiguo'])
+		self.assertEqual([item['count'] for item in top], [3, 3])
+
+	def test_tags_leave_each_window_when_they_expire(self):
+		self.engine.record(['python'], self.now)
+		self.now += 2 * 3600
+		self.assertEqual(self.engine.top('1h'), [])
+		self.assertEqual(self.engine.top('24h')[0]['name'], 'python')
+
+	def test_poll_consumes_new_post_tags(self):
+		user = get_user_model().objects.create_user(username='ivan', password='password123')
+		self.now = timezone.now().timestamp()
+		self.engine.warm_up()
+		post = Post.objects.create(post_content='Hola #django #python', username=user)
+		_process_hashtags(post)
+		self.engine.poll(force=True)
+		self.assertEqual({item['name'] for item in self.engine.top('1h')}, {'django', 'python'})
+
+	def test_first_poll_warms_up_in_the_background(self):
+		started = threading.Event()
+		release = threading.Event()
+
+		def slow_warm_up():
+			started.set()
+			release.wait(5)
+
+		with mock.patch.object(self.engine, 'warm_up', side_effect=slow_warm_up) as warm_up:
+			# La petición no espera la carga inicial
+			self.assertEqual(self.engine.poll(force=True), 0)
+			self.assertTrue(started.wait(5))
+			self.assertEqual(self.engine.top('24h'), [])
+			self.engine.poll(force=True)
+			release.set()
+		self.assertEqual(warm_up.call_count, 1)
+
+
+class SketchTests(TestCase):
+	def test_count_min_never_underestimates(self):
+		sketch = CountMinSketch.from_error(0.01, 0.01)
+		for i in range(1000):
+			sketch.add(f'tag{i % 50}')
+		for i in range(50):
+			self.assertGreaterEqual(sketch.estimate(f'tag{i}'), 20)
+			self.assertLessEqual(sketch.estimate(f'tag{i}'), 20 + sketch.error)
+
+	def test_heavy_hitters_keep_the_most_frequent(self):
+		heavy_hitters = HeavyHitters(k=3)
+		for tag, count in [('python', 50), ('django', 30), ('neo4j', 20), ('go', 5), ('rust', 2)]:
+			for _ in range(count):
+				heavy_hitters.add(tag)
+		self.assertEqual([tag for tag, _ in heavy_hitters.top()], ['python', 'django', 'neo4j'])
+
+	def test_hyperloglog_merge_and_serialization(self):
+		first, second = HyperLogLog(12), HyperLogLog(12)
+		for i in range(3000):
+			first.add(i)
+		for i in range(2000, 6000):
+			second.add(i)
+		merged = HyperLogLog.from_dict(first.to_dict()).merge(HyperLogLog.from_dict(second.to_dict()))
+		self.assertAlmostEqual(merged.count(), 6000, delta=6000 * 4 * merged.standard_error)
+
+
+class EngagementTests(TestCase):
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		settings_override = override_settings(SKETCH_DIR=directory.name)
+		settings_override.enable()
+		self.addCleanup(settings_override.disable)
+		engagement.reset_shards()
+
+	def test_shards_from_several_processes_are_merged(self):
+		today = timezone.localdate()
+		other_process = engagement.EngagementSketches()
+		other_process.record_like(2, 10, today)
+		other_process.record_post(2, ['python'], today)
+		engagement.save_shard(other_process, 'otro')
+
+		engagement.record_like(1, 10)
+		engagement.record_post(1, ['python', 'django'])
+		engagement.flush()
+
+		sketches = engagement.load_shards()
+		self.assertEqual(sketches.likers[10].count(), 2)
+		self.assertEqual(sketches.tags.estimate('python'), 2)
+		self.assertEqual(engagement.active_users(today)['count'], 2)
+
+	def test_flush_writes_deltas_and_compaction_keeps_the_totals(self):
+		for user_id in range(3):
+			engagement.record_post(user_id, ['python'])
+			engagement.flush()
+		self.assertEqual(len(glob.glob(f'{settings.SKETCH_DIR}/engagement-*.json')), 3)
+
+		self.assertEqual(engagement.compact(), 3)
+		self.assertEqual(len(glob.glob(f'{settings.SKETCH_DIR}/engagement-*.json')), 1)
+		sketches = engagement.load_shards()
+		self.assertEqual(sketches.tags.estimate('python'), 3)
+		self.assertEqual(sketches.active_users[timezone.localdate().isoformat()].count(), 3)
+
+	def test_merged_sketches_parse_only_new_shards(self):
+		first = engagement.EngagementSketches()
+		first.record_post(1, ['python'], timezone.localdate())
+		engagement.save_shard(first, 'uno')
+		with mock.patch.object(engagement, 'MERGE_INTERVAL', 0), \
+				mock.patch('blog.engagement.json.load', side_effect=json.load) as load:
+			engagement.merged_sketches()
+			self.assertEqual(load.call_count, 1)
+
+			engagement.save_shard(first, 'dos')
+			self.assertEqual(engagement.tag_count('python')['count'], 2)
+			self.assertEqual(load.call_count, 2)
+
+			# Sin archivos nuevos no se parsea ni se recombina nada
+			merged = engagement.merged_sketches()
+			self.assertIs(engagement.merged_sketches(), merged)
+			self.assertEqual(load.call_count, 2)
+
+	def test_post_edit_records_added_tags(self):
+		user = get_user_model().objects.create_user(username='hedy', password='password123')
+		post = Post.objects.create(post_content='Hola #python', username=user)
+		_process_hashtags(post)
+		self.client.force_login(user)
+
+		with mock.patch('blog.views.engagement.record_post') as record_post, \
+				mock.patch('blog.views.trending.engine.poll'), \
+				self.captureOnCommitCallbacks(execute=True):
+			self.client.post(reverse('post-update', kwargs={'pk': post.pk}), {'post_content': 'Hola #python #neo4j'})
+
+		record_post.assert_called_once_with(user.id, {'neo4j'})
+
+	def test_likers_keep_only_the_most_recently_liked_posts(self):
+		sketches = engagement.EngagementSketches()
+		with mock.patch.object(engagement, 'MAX_LIKER_POSTS', 2):
+			for post_id in (1, 2, 1, 3):
+				sketches.record_liker(7, post_id)
+		self.assertEqual(list(sketches.likers), [1, 3])
+
+
+class RecommendationTests(TestCase):
+	@skipUnless(recommendations.np is not None, 'requiere NumPy')
+	def test_compute_ranks_candidates_by_shared_neighbours(self):
+		graph = recommendations.SocialGraph.from_adjacency([
+			(1, [2], [2, 3], ['python', 'neo4j']),
+			(2, [], [1, 4], ['python', 'neo4j']),
+			(3, [], [1, 4], ['python']),
+			(4, [], [2, 3], ['go']),
+		])
+		results = {}
+		for partition in recommendations.compute_all(graph, workers=1, partitions=2):
+			results.update(partition)
+		# 2 ya está seguido: solo queda 3, con un interés en común
+		self.assertEqual([entry[:2] for entry in results[1]['follow']], [[3, 1]])
+		self.assertEqual(results[4]['friends'], [[1, 2, 1.0]])
+
+	def test_saved_suggestions_are_read_and_discarded(self):
+		user_model = get_user_model()
+		alice, bob, carol = (user_model.objects.create_user(username=name, password='password123') for name in ('ana', 'beto', 'caro'))
+		recommendations.save_results(
+			{alice.id: {'follow': [[bob.id, 2, 1.5], [carol.id, 1, 0.7]], 'friends': []}, 999: {'follow': [], 'friends': []}},
+			timezone.now()
+		)
+		self.assertEqual(
+			recommendations.follow_suggestions(alice.id, limit=1),
+			[{'user_id': bob.id, 'common_interests': 2, 'score': 1.5}]
+		)
+		self.assertIsNone(recommendations.follow_suggestions(bob.id))
+
+		recommendations.discard(alice.id, bob.id, 'follow')
+		self.assertEqual([s['user_id'] for s in recommendations.follow_suggestions(alice.id)], [carol.id])
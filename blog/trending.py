@@ -0,0 +1,235 @@
+"""
+Motor de tendencias por ventanas de tiempo con decaimiento exponencial
+
+En lugar de contar en Neo4j todas las etiquetas de la historia, cada proceso
+mantiene en memoria, para cada ventana (1h, 24h, 7d), los conteos por
+cubetas de tiempo y un puntaje con decaimiento exponencial por hashtag:
+
+- Cada evento (un hashtag de un post) suma su peso al puntaje del hashtag
+  en cada ventana; cuando su cubeta sale de la ventana se resta. El
+  ranking se mantiene así de forma incremental, sin recontar.
+- El decaimiento usa "forward decay": el peso de un evento es
+  e^((t - landmark) / tau), creciente con el tiempo, así que los puntajes
+  ya guardados nunca hay que actualizarlos; al consultar se multiplican por
+  e^((landmark - ahora) / tau). El landmark se adelanta de vez en cuando
+  para que los exponentes no crezcan sin límite.
+
+Los eventos salen de la tabla PostTag, que escribe _process_hashtags: el
+motor lee las filas nuevas por id (las de cualquier proceso). La carga
+inicial (las filas de los posts de la ventana más larga) corre en un hilo
+en segundo plano que lanza el primer `poll`: ninguna petición la espera, y
+hasta que termina las tendencias salen vacías.
+"""
+import heapq
+import math
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+
+from .models import PostTag
+
+WINDOWS = {
+    '1h': 3600,
+    '24h': 24 * 3600,
+    '7d': 7 * 24 * 3600,
+}
+DEFAULT_WINDOW = '24h'
+
+BUCKETS_PER_WINDOW = 60
+# Un evento en el borde de la ventana pesa e^-DECAY (≈5%) de uno reciente
+DECAY = 3.0
+# Máximo exponente antes de adelantar el landmark
+MAX_EXPONENT = 30.0
+# Filas de PostTag leídas por consulta
+POLL_BATCH = 5000
+
+
+class TimeWindow:
+    """Conteos por cubeta y puntajes con decaimiento de una ventana"""
+
+    def __init__(self, span):
+        self.span = span
+        self.bucket_size = span / BUCKETS_PER_WINDOW
+        self.tau = span / DECAY
+        self.landmark = None
+        self.buckets = {}  # {índice de cubeta: Counter de hashtags}
+        self.scores = {}  # {hashtag: puntaje relativo al landmark}
+        self.counts = Counter()  # eventos de cada hashtag dentro de la ventana
+
+    def _weight(self, bucket):
+        return math.exp((bucket * self.bucket_size - self.landmark) / self.tau)
+
+    def _first_bucket(self, now):
+        return int((now - self.span) // self.bucket_size) + 1
+
+    def add(self, tag, timestamp, now):
+        bucket = int(timestamp // self.bucket_size)
+        if bucket < self._first_bucket(now):
+            return
+        if self.landmark is None:
+            self.landmark = bucket * self.bucket_size
+        self.buckets.setdefault(bucket, Counter())[tag] += 1
+        self.counts[tag] += 1
+        self.scores[tag] = self.scores.get(tag, 0.0) + self._weight(bucket)
+
+    def advance(self, now):
+        """Saca de la ventana las cubetas vencidas y, si hace falta, adelanta el landmark"""
+        first = self._first_bucket(now)
+        for bucket in sorted(b for b in self.buckets if b < first):
+            weight = self._weight(bucket)
+            for tag, count in self.buckets.pop(bucket).items():
+                self.counts[tag] -= count
+                if self.counts[tag] <= 0:
+                    del self.counts[tag]
+                    self.scores.pop(tag, None)
+                else:
+                    self.scores[tag] -= count * weight
+
+        if self.landmark is not None and (now - self.landmark) / self.tau > MAX_EXPONENT:
+            factor = math.exp((self.landmark - now) / self.tau)
+            self.scores = {tag: score * factor for tag, score in self.scores.items()}
+            self.landmark = now
+
+    def top(self, limit, now):
+        if not self.scores:
+            return []
+        scale = math.exp((self.landmark - now) / self.tau)
+        best = heapq.nlargest(limit, self.scores.items(), key=lambda item: item[1])
+        return [
+            {'name': tag, 'count': self.counts[tag], 'score': round(score * scale, 4)}
+            for tag, score in best
+        ]
+
+
+class TrendingEngine:
+    """Tendencias de hashtags para todas las ventanas de WINDOWS"""
+
+    def __init__(self, windows=None, clock=time.time):
+        self.clock = clock
+        self.windows = {name: TimeWindow(span) for name, span in (windows or WINDOWS).items()}
+        self.last_tag_id = None
+        self.last_poll = 0.0
+        self._lock = threading.Lock()
+        self._warming = False
+
+    def record(self, tags, timestamp):
+        """Registra los hashtags de un post publicado en `timestamp` (epoch)"""
+        now = self.clock()
+        with self._lock:
+            for window in self.windows.values():
+                for tag in tags:
+                    window.add(tag, timestamp, now)
+
+    def top(self, window=DEFAULT_WINDOW, limit=10):
+        """Retorna [{name, count, score}] de los hashtags más en tendencia en la ventana"""
+        if window not in self.windows:
+            raise ValueError(f"Ventana desconocida: {window}")
+        now = self.clock()
+        with self._lock:
+            time_window = self.windows[window]
+            time_window.advance(now)
+            return time_window.top(limit, now)
+
+    def poll(self, force=False):
+        """
+        Consume las filas nuevas de PostTag
+        Sin `force`, lee como mucho una vez cada TRENDING_POLL_INTERVAL segundos
+        y no espera si otro hilo ya está leyendo
+        Si el motor aún no tiene la carga inicial, la lanza en segundo plano y
+        retorna sin leer nada
+        """
+        if self.last_tag_id is None:
+            self.start_warm_up()
+            return 0
+        interval = getattr(settings, 'TRENDING_POLL_INTERVAL', 5)
+        if not force and self.clock() - self.last_poll < interval:
+            return 0
+        if not self._lock.acquire(blocking=force):
+            return 0
+        try:
+            self.last_poll = self.clock()
+            return self._consume_new()
+        finally:
+            self._lock.release()
+
+    def start_warm_up(self):
+        """Lanza warm_up en un hilo daemon (una sola vez a la vez)"""
+        with self._lock:
+            if self._warming or self.last_tag_id is not None:
+                return
+            self._warming = True
+        threading.Thread(target=self._warm_up_in_background, name='trending-warm-up', daemon=True).start()
+
+    def _warm_up_in_background(self):
+        try:
+            self.warm_up()
+        except Exception as e:
+            print(f"Error cargando las tendencias: {e}")
+        finally:
+            self._warming = False
+            # El hilo abrió su propia conexión a la base de datos
+            connection.close()
+
+    def _apply(self, rows, now):
+        for tag_id, tag, post_date in rows:
+            for window in self.windows.values():
+                window.add(tag, post_date.timestamp(), now)
+            self.last_tag_id = max(self.last_tag_id or 0, tag_id)
+
+    def warm_up(self):
+        """
+        Carga las etiquetas de los posts de la ventana más larga
+        Es lenta (días de filas de PostTag): arma ventanas nuevas sin tomar
+        el candado y solo lo toma para reemplazarlas, así que top() sigue
+        respondiendo mientras tanto
+        Retorna el número de filas cargadas
+        """
+        now = self.clock()
+        last_tag_id = PostTag.objects.aggregate(last=Max('pk'))['last'] or 0
+        windows = {name: TimeWindow(window.span) for name, window in self.windows.items()}
+        longest = max(window.span for window in windows.values())
+        since = datetime.fromtimestamp(now - longest, tz=timezone.utc)
+        rows = (
+            PostTag.objects
+            .filter(post_id__post_date__gte=since, pk__lte=last_tag_id)
+            .values_list('pk', 'type_id__type_name', 'post_id__post_date')
+            .iterator(chunk_size=POLL_BATCH)
+        )
+        total = 0
+        for tag_id, tag, post_date in rows:
+            for window in windows.values():
+                window.add(tag, post_date.timestamp(), now)
+            total += 1
+        with self._lock:
+            self.windows = windows
+            self.last_tag_id = last_tag_id
+            self.last_poll = self.clock()
+        return total
+
+    def _consume_new(self):
+        total = 0
+        while True:
+            rows = list(
+                PostTag.objects
+                .filter(pk__gt=self.last_tag_id)
+                .order_by('pk')
+                .values_list('pk', 'type_id__type_name', 'post_id__post_date')[:POLL_BATCH]
+            )
+            self._apply(rows, self.clock())
+            total += len(rows)
+            if len(rows) < POLL_BATCH:
+                return total
+
+
+engine = TrendingEngine()
+
+
+def get_trending(window=DEFAULT_WINDOW, limit=10):
+    """Top de hashtags de la ventana, con las filas nuevas de PostTag ya consumidas"""
+    engine.poll()
+    return engine.top(window, limit)
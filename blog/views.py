@@ -1,11 +1,12 @@
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.models import Group, User
-from django.db import models
-from django.db.models import Prefetch
+from django.db import models, transaction
+from django.db.models import F
 from django.http import JsonResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy, reverse
+from django.utils import timezone
 from django.views.generic import CreateView, DeleteView, DetailView, ListView, UpdateView
 from django.views.decorators.http import require_POST
 from rest_framework import permissions, status, viewsets
@@ -15,8 +16,11 @@ from urllib.parse import urlencode
 
 from .forms import NewCommentForm, PostForm
 from .models import Comment, Post, Type, PostTag
+from .pagination import CursorPaginationMixin
 from .serializers import GroupSerializer, PostSerializer, UserSerializer
-from .neo4j_services import Neo4jPostService, Neo4jInterestService, Neo4jUserService
+from .neo4j_services import Neo4jUserService
+from .outbox import enqueue
+from . import engagement, trending
 
 PAGINATION_COUNT = 10
 
@@ -25,20 +29,37 @@ def _process_hashtags(post):
     """
     Extrae hashtags del contenido del post, los crea si no existen
     y los asocia con el post.
+    Solo se tocan las etiquetas que cambiaron y el número de consultas
+    no depende de cuántos hashtags tenga el post.
+    Retorna los nombres de las etiquetas agregadas.
     """
-    # Primero, eliminamos las etiquetas antiguas para evitar duplicados en la edición
-    post.post_tags.all().delete()
-    
     # Buscamos todas las palabras que comiencen con #
-    hashtags = re.findall(r"#(\w+)", post.post_content)
-    for tag_name in hashtags:
-        # Creamos o obtenemos el 'Type' (hashtag)
-        tag, _ = Type.objects.get_or_create(type_name=tag_name.lower())
-        # Creamos la relación entre el post y el tag
-        PostTag.objects.get_or_create(post_id=post, type_id=tag)
+    tag_names = {tag_name.lower() for tag_name in re.findall(r"#(\w+)", post.post_content)}
+
+    # Etiquetas que el post ya tiene: {type_name: type_id}
+    current = dict(post.post_tags.values_list('type_id__type_name', 'type_id'))
+
+    # Eliminamos en una sola consulta las etiquetas que ya no aparecen
+    removed = [type_id for type_name, type_id in current.items() if type_name not in tag_names]
+    if removed:
+        post.post_tags.filter(type_id__in=removed).delete()
+
+    added = tag_names - current.keys()
+    if added:
+        # Creamos los 'Type' (hashtags) que falten y los resolvemos con un solo IN
+        Type.objects.bulk_create([Type(type_name=name) for name in added], ignore_conflicts=True)
+        tags = Type.objects.filter(type_name__in=added)
+        PostTag.objects.bulk_create(
+            [PostTag(post_id=post, type_id=tag) for tag in tags],
+            ignore_conflicts=True
+        )
+        # El motor de tendencias de este proceso consume las etiquetas nuevas
+        # en cuanto se confirma la transacción (los demás procesos, al leer)
+        transaction.on_commit(lambda: trending.engine.poll(force=True))
+    return added
 
 
-class PostListView(LoginRequiredMixin, ListView):
+class PostListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     model = Post
     template_name = 'blog/home.html'
     context_object_name = 'posts'
@@ -48,10 +69,7 @@ class PostListView(LoginRequiredMixin, ListView):
         queryset = (
             Post.objects
             .select_related('username')
-            .prefetch_related(
-                Prefetch('comments', queryset=Comment.objects.select_related('username')),
-                'post_tags__type_id'
-            )
+            .prefetch_related('post_tags__type_id')
         )
         
         raw_type = (self.request.GET.get('type') or '').strip()
@@ -100,7 +118,7 @@ class PostListView(LoginRequiredMixin, ListView):
         if params:
             self.current_querystring = urlencode(params)
 
-        return queryset.order_by('-post_date').distinct()
+        return queryset.order_by('-post_date', '-post_id').distinct()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -108,13 +126,14 @@ class PostListView(LoginRequiredMixin, ListView):
         context['active_type'] = getattr(self, 'active_type', '')
         context['current_querystring'] = getattr(self, 'current_querystring', '')
         context['comment_form'] = NewCommentForm()
+        # Posts de la página actual que el usuario ya marcó con like
+        context['liked_post_ids'] = Post.ids_liked_by(self.request.user, context['posts'])
         
-        # Obtener lista de usuarios que el usuario actual está siguiendo
+        # Autores de la página actual que el usuario está siguiendo
         try:
             user_service = Neo4jUserService()
-            following_users = user_service.get_following(self.request.user.id)
-            # Crear un set de user_ids para búsqueda rápida
-            context['following_user_ids'] = {user.user_id for user in following_users}
+            author_ids = {post.username_id for post in context['posts']}
+            context['following_user_ids'] = user_service.get_followed_ids(self.request.user.id, author_ids)
         except Exception as e:
             print(f"Error obteniendo usuarios seguidos: {e}")
             context['following_user_ids'] = set()
@@ -125,21 +144,36 @@ class PostListView(LoginRequiredMixin, ListView):
 @login_required
 @require_POST
 def like_post(request, pk):
-    post = get_object_or_404(Post, pk=pk)
-    if request.user in post.likes.all():
-        post.likes.remove(request.user)
-        liked = False
-    else:
-        post.likes.add(request.user)
-        liked = True
+    post = get_object_or_404(Post.objects.only('post_id'), pk=pk)
+    likes = Post.likes.through
+    with transaction.atomic():
+        # Borrado condicional sobre la tabla intermedia: si no había like, no borra nada
+        deleted, _ = likes.objects.filter(post_id=post.pk, user_id=request.user.pk).delete()
+        if deleted:
+            Post.objects.filter(pk=post.pk, like_count__gt=0).update(
+                like_count=F('like_count') - 1, likes_updated_at=timezone.now()
+            )
+            liked = False
+        else:
+            _, created = likes.objects.get_or_create(post_id=post.pk, user_id=request.user.pk)
+            if created:
+                Post.objects.filter(pk=post.pk).update(
+                    like_count=F('like_count') + 1, likes_updated_at=timezone.now()
+                )
+            liked = True
+        like_count = Post.objects.values_list('like_count', flat=True).get(pk=post.pk)
+        # La relación LIKES de Neo4j se aplica desde el outbox
+        enqueue('like_post' if liked else 'unlike_post', user_id=request.user.id, post_id=post.pk)
+        if liked:
+            transaction.on_commit(lambda: engagement.record_like(request.user.id, post.pk))
 
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        return JsonResponse({'liked': liked, 'likes': post.number_of_likes})
+        return JsonResponse({'liked': liked, 'likes': like_count})
 
     return HttpResponseRedirect(request.META.get('HTTP_REFERER', reverse('blog-home')))
 
 
-class UserPostListView(LoginRequiredMixin, ListView):
+class UserPostListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     model = Post
     template_name = 'blog/user_posts.html'
     context_object_name = 'posts'
@@ -147,7 +181,7 @@ class UserPostListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         self.profile_user = get_object_or_404(User, username=self.kwargs['username'])
-        return Post.objects.filter(username=self.profile_user).order_by('-post_date')
+        return Post.objects.filter(username=self.profile_user).order_by('-post_date', '-post_id')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -163,6 +197,7 @@ class PostDetailView(LoginRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['comments'] = self.object.comments.select_related('username')
+        context['user_has_liked'] = self.object.post_id in Post.ids_liked_by(self.request.user, [self.object])
         context['form'] = kwargs.get('form', NewCommentForm())
         return context
 
@@ -173,20 +208,17 @@ class PostDetailView(LoginRequiredMixin, DetailView):
             comment = form.save(commit=False)
             comment.username = request.user
             comment.post_id = self.object
-            comment.save()
-            
-            # Sincronizar con Neo4j
-            try:
-                from .neo4j_services import Neo4jCommentService
-                neo4j_comment_service = Neo4jCommentService()
-                neo4j_comment_service.create_comment(
-                    comment_id=comment.id,
+            with transaction.atomic():
+                comment.save()
+                Post.objects.filter(pk=self.object.pk).update(comment_count=F('comment_count') + 1)
+                enqueue(
+                    'create_comment',
+                    comment_id=comment.pk,
                     user_id=request.user.id,
-                    post_id=self.object.id,
+                    post_id=self.object.pk,
                     content=comment.comment_content
                 )
-            except Exception as e:
-                print(f"Error sincronizando comentario con Neo4j: {e}")
+                transaction.on_commit(lambda: engagement.record_comment(request.user.id))
             
             return redirect('post-detail', pk=self.object.pk)
         context = self.get_context_data(form=form)
@@ -201,37 +233,21 @@ class PostCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.username = self.request.user
-        # Guardamos el objeto para obtener un ID antes de procesar los hashtags
-        self.object = form.save()
-        _process_hashtags(self.object)
-        
-        # Sincronizar con Neo4j
-        try:
-            print(f"🔄 Iniciando sincronización con Neo4j para post {self.object.post_id}")
-            neo4j_post_service = Neo4jPostService()
-            neo4j_user_service = Neo4jUserService()
+        with transaction.atomic():
+            # Guardamos el objeto para obtener un ID antes de procesar los hashtags
+            self.object = form.save()
+            added_tags = _process_hashtags(self.object)
+            transaction.on_commit(lambda: engagement.record_post(self.request.user.id, added_tags))
             
-            # Asegurar que el usuario existe en Neo4j
-            user = self.request.user
-            neo4j_user_service.create_or_update_user(
-                user.id, user.username, user.email,
-                user.first_name, user.last_name, user.profile.bio if hasattr(user, 'profile') else ''
-            )
-            print(f"✅ Usuario {user.username} verificado en Neo4j")
-            
-            # Crear el post en Neo4j
-            neo4j_post_service.create_post(
+            # Registrar la sincronización con Neo4j (post y fan-out a los
+            # timelines) en la misma transacción; la aplica drain_neo4j_outbox.
+            # Si el autor no existe aún en Neo4j, el outbox lo sincroniza al aplicarla
+            enqueue(
+                'create_post',
                 post_id=self.object.post_id,
-                user_id=user.id,
+                user_id=self.request.user.id,
                 content=self.object.post_content
             )
-            print(f"✅ Post {self.object.post_id} sincronizado con Neo4j: {self.object.post_content[:50]}...")
-            
-        except Exception as e:
-            print(f"❌ Error sincronizando post {self.object.post_id} con Neo4j: {e}")
-            import traceback
-            traceback.print_exc()
-            # No fallamos la creación del post si Neo4j falla
         
         return HttpResponseRedirect(self.get_success_url())
 
@@ -248,26 +264,15 @@ class PostUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     success_url = reverse_lazy('blog-home')
 
     def form_valid(self, form):
-        # El objeto se guarda automáticamente en UpdateView
-        self.object = form.save()
-        _process_hashtags(self.object)
-        
-        # Sincronizar con Neo4j
-        try:
-            print(f"🔄 Actualizando post {self.object.post_id} en Neo4j")
-            neo4j_post_service = Neo4jPostService()
-            
-            # Actualizar el post en Neo4j
-            neo4j_post_service.update_post(
-                post_id=self.object.post_id,
-                content=self.object.post_content
-            )
-            print(f"✅ Post {self.object.post_id} actualizado en Neo4j")
+        with transaction.atomic():
+            self.object = form.save()
+            added_tags = _process_hashtags(self.object)
+            if added_tags:
+                # Las etiquetas que agrega la edición cuentan igual que al crear el post
+                transaction.on_commit(lambda: engagement.record_post(self.request.user.id, added_tags))
             
-        except Exception as e:
-            print(f"❌ Error sincronizando actualización con Neo4j: {e}")
-            import traceback
-            traceback.print_exc()
+            # Registrar la actualización para Neo4j en la misma transacción
+            enqueue('update_post', post_id=self.object.post_id, content=self.object.post_content)
         
         return HttpResponseRedirect(self.get_success_url())
 
@@ -286,20 +291,12 @@ class PostDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     template_name = 'blog/post_delete.html'
     success_url = reverse_lazy('blog-home')
     
-    def delete(self, request, *args, **kwargs):
-        # Obtener el objeto antes de eliminarlo
-        self.object = self.get_object()
-        post_id = self.object.id
-        
-        # Eliminar de Neo4j primero
-        try:
-            neo4j_post_service = Neo4jPostService()
-            neo4j_post_service.delete_post(post_id)
-        except Exception as e:
-            print(f"Error eliminando post de Neo4j: {e}")
-        
-        # Llamar al método delete de la clase padre para eliminar de Django
-        return super().delete(request, *args, **kwargs)
+    def form_valid(self, form):
+        # DeleteView elimina el objeto en form_valid; registramos el borrado
+        # para Neo4j en la misma transacción
+        with transaction.atomic():
+            enqueue('delete_post', post_id=self.object.pk)
+            return super().form_valid(form)
 
     def test_func(self):
         post = self.get_object()
@@ -323,21 +320,18 @@ class CommentDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     model = Comment
     template_name = 'blog/comment_confirm_delete.html'
     
-    def delete(self, request, *args, **kwargs):
-        # Obtener el objeto antes de eliminarlo
-        self.object = self.get_object()
-        comment_id = self.object.id
-        
-        # Eliminar de Neo4j primero
-        try:
-            from .neo4j_services import Neo4jCommentService
-            neo4j_comment_service = Neo4jCommentService()
-            neo4j_comment_service.delete_comment(comment_id)
-        except Exception as e:
-            print(f"Error eliminando comentario de Neo4j: {e}")
+    def form_valid(self, form):
+        # DeleteView elimina el objeto en form_valid (get_object ya se llamó en post)
+        comment_id = self.object.pk
+        post_pk = self.object.post_id.pk
         
-        # Llamar al método delete de la clase padre
-        return super().delete(request, *args, **kwargs)
+        # Eliminar el comentario, descontar el contador del post y registrar
+        # el borrado para Neo4j en la misma transacción
+        with transaction.atomic():
+            response = super().form_valid(form)
+            enqueue('delete_comment', comment_id=comment_id)
+            Post.objects.filter(pk=post_pk, comment_count__gt=0).update(comment_count=F('comment_count') - 1)
+        return response
 
     def get_success_url(self):
         return reverse('post-detail', kwargs={'pk': self.object.post_id.pk})
@@ -11,8 +11,11 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_project.settings')
 django.setup()
 
 from django.contrib.auth.models import User
+from django.db import transaction
+from blog import engagement, trending
 from blog.models import Post, Comment
 from blog.neo4j_services import Neo4jUserService, Neo4jPostService, Neo4jCommentService
+from blog.views import _process_hashtags
 
 # Datos de usuarios
 USERS_DATA = [
@@ -162,11 +165,17 @@ def create_posts(users):
         posts_content = POSTS_DATA[username]
         
         for content in posts_content:
-            # Crear en Django
-            post = Post.objects.create(
-                username=user,
-                post_content=content
-            )
+            # Crear en Django con sus hashtags (PostTag), igual que PostCreateView:
+            # de ahí salen las tendencias y los sketches de estadísticas
+            with transaction.atomic():
+                post = Post.objects.create(
+                    username=user,
+                    post_content=content
+                )
+                added_tags = _process_hashtags(post)
+                transaction.on_commit(
+                    lambda user_id=user.id, tags=added_tags: engagement.record_post(user_id, tags)
+                )
             print(f"✅ Post [{post.post_id}] {username}: {content[:50]}...")
             
             # Sincronizar con Neo4j
@@ -263,14 +272,15 @@ def show_statistics():
     print(f"📝 Posts: {Post.objects.count()}")
     print(f"💬 Comentarios: {Comment.objects.count()}")
     
-    # Trending hashtags
+    # Trending hashtags (en la web la carga inicial corre en segundo plano; aquí se espera)
     from blog.neo4j_services import Neo4jAnalyticsService
+    trending.engine.warm_up()
     analytics = Neo4jAnalyticsService()
-    trending = analytics.get_trending_interests(limit=10)
+    trending_interests = analytics.get_trending_interests(limit=10)
     
     print(f"\n🔥 Top 10 Trending Hashtags:")
-    for item in trending:
-        print(f"   #{item['interest'].name}: {item['count']} posts")
+    for item in trending_interests:
+        print(f"   #{item['name']}: {item['count']} posts")
     
     print("\n🔐 CREDENCIALES DE USUARIOS:")
     print("=" * 50)
@@ -305,8 +315,13 @@ def main():
     # Crear likes
     create_likes(users, posts)
     
+    # Sincronizar contadores desnormalizados de likes y comentarios
+    Post.recount_counters()
+    
     # Mostrar estadísticas
     show_statistics()
+    # Guardar en SKETCH_DIR los sketches de este proceso antes de salir
+    engagement.flush()
     
     print("\n✅ ¡DATOS DE DEMOSTRACIÓN CREADOS EXITOSAMENTE!")
     print("\n🚀 Inicia el servidor con: python manage.py runserver")
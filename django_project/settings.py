@@ -56,6 +56,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'blog.middleware.Neo4jSessionMiddleware',
 ]
 
 ROOT_URLCONF = 'django_project.urls'
@@ -89,6 +90,40 @@ DATABASES = {
     }
 }
 
+# Caché de los resultados de análisis (influencers, sugerencias)
+# Por defecto en memoria del proceso; para compartirla entre procesos basta
+# con apuntar ANALYTICS_CACHE_BACKEND a FileBasedCache (LOCATION = directorio),
+# Redis o Memcached
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Con varios procesos debe ser una caché compartida (Redis o Memcached), p. ej.
+    # ANALYTICS_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+    # ANALYTICS_CACHE_LOCATION=redis://127.0.0.1:6379/1
+    # Con LocMemCache cada proceso tiene la suya: lo que invalidan los comandos
+    # (migrate_to_neo4j, compute_recommendations) no llega a los workers web
+    'analytics': {
+        'BACKEND': os.getenv('ANALYTICS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('ANALYTICS_CACHE_LOCATION', 'analytics'),
+    },
+}
+if CACHES['analytics']['BACKEND'].endswith('LocMemCache'):
+    CACHES['analytics']['OPTIONS'] = {'MAX_ENTRIES': 10000}
+ANALYTICS_CACHE_ALIAS = 'analytics'
+# Sketches de estadísticas aproximadas: cada proceso escribe lo nuevo en
+# SKETCH_DIR cada SKETCH_FLUSH_INTERVAL segundos (y al terminar); al leer se
+# combinan todos los archivos y, si son muchos, se compactan en uno
+SKETCH_DIR = os.getenv('SKETCH_DIR', os.path.join(BASE_DIR, 'sketches'))
+SKETCH_FLUSH_INTERVAL = int(os.getenv('SKETCH_FLUSH_INTERVAL', '10'))
+# Cada cuántos segundos el motor de tendencias lee los hashtags nuevos de otros procesos
+TRENDING_POLL_INTERVAL = int(os.getenv('TRENDING_POLL_INTERVAL', '5'))
+# TTL en segundos de cada tipo de resultado
+ANALYTICS_CACHE_TTLS = {
+    'influencers': int(os.getenv('ANALYTICS_INFLUENCERS_TTL', '300')),
+    'suggestions': int(os.getenv('ANALYTICS_SUGGESTIONS_TTL', '600')),
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10
@@ -147,8 +182,33 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 NEO4J_URI = os.getenv('NEO4J_URI', 'bolt://localhost:7687')
 NEO4J_USER = os.getenv('NEO4J_USER', 'neo4j')
 NEO4J_PASSWORD = os.getenv('NEO4J_PASSWORD', 'password')
-
-# Inicializar conexión a Neo4j al inicio
-def init_neo4j():
-    from blog.neo4j_connection import init_neo4j_connection
-    init_neo4j_connection()
+# Conecta al arrancar e instala y verifica los índices de Neo4j (ver blog/neo4j_schema.py)
+NEO4J_ENSURE_SCHEMA = os.getenv('NEO4J_ENSURE_SCHEMA', 'False') == 'True'
+# Segundos máximos para abrir una conexión; la conexión se abre en la primera consulta
+NEO4J_CONNECT_TIMEOUT = float(os.getenv('NEO4J_CONNECT_TIMEOUT', 5))
+# Cada cuántos segundos se comprueba Neo4j en segundo plano (0 = desactivado)
+NEO4J_HEALTH_PROBE_INTERVAL = float(os.getenv('NEO4J_HEALTH_PROBE_INTERVAL', 0))
+# Pool de conexiones del driver compartido (uno por proceso)
+NEO4J_MAX_POOL_SIZE = int(os.getenv('NEO4J_MAX_POOL_SIZE', 50))
+# Segundos antes de reemplazar una conexión del pool
+NEO4J_MAX_CONNECTION_LIFETIME = int(os.getenv('NEO4J_MAX_CONNECTION_LIFETIME', 3600))
+# Segundos máximos esperando una conexión libre del pool
+NEO4J_CONNECTION_ACQUISITION_TIMEOUT = float(os.getenv('NEO4J_CONNECTION_ACQUISITION_TIMEOUT', 10))
+NEO4J_KEEP_ALIVE = os.getenv('NEO4J_KEEP_ALIVE', 'True') == 'True'
+# Réplica de solo lectura para las consultas de lectura (vacío = usar NEO4J_URI)
+# Con un clúster basta con NEO4J_URI=neo4j://...: el driver envía las lecturas a los followers
+NEO4J_READ_URI = os.getenv('NEO4J_READ_URI', '')
+
+# Timelines materializados (fan-out on write)
+# Número máximo de post_ids que se guardan en el timeline de cada usuario
+FEED_TIMELINE_MAX_LENGTH = int(os.getenv('FEED_TIMELINE_MAX_LENGTH', 800))
+# Posts recientes del autor que se copian al timeline de un nuevo seguidor
+FEED_BACKFILL_COUNT = int(os.getenv('FEED_BACKFILL_COUNT', 50))
+# Usuarios con al menos esta cantidad de seguidores no hacen fan-out:
+# sus posts se mezclan en el feed al momento de leerlo
+FEED_FANOUT_FOLLOWER_THRESHOLD = int(os.getenv('FEED_FANOUT_FOLLOWER_THRESHOLD', 1000))
+# Un autor en modo pull vuelve a hacer fan-out al bajar de esta cantidad de seguidores
+# (menor que el umbral anterior, para que no cambie de modo con cada follow/unfollow)
+FEED_FANOUT_RELEASE_THRESHOLD = int(os.getenv('FEED_FANOUT_RELEASE_THRESHOLD', 900))
+# Tamaño de la caché de posts recientes que se guarda en cada autor
+FEED_RECENT_POSTS_SIZE = int(os.getenv('FEED_RECENT_POSTS_SIZE', 20))
@@ -2,6 +2,7 @@ from django.contrib import messages
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.db import transaction
 from django.shortcuts import redirect, render
 
 from .forms import UserRegisterForm, UserUpdateForm, ProfileUpdateForm
@@ -11,7 +12,9 @@ def register(request):
     if request.method == 'POST':
         form = UserRegisterForm(request.POST)
         if form.is_valid():
-            form.save()
+            # El usuario y su entrada en el outbox de Neo4j se guardan juntos
+            with transaction.atomic():
+                form.save()
             return redirect('login')
     else:
         form = UserRegisterForm()
@@ -34,8 +37,9 @@ def account_edit(request):
         p_form = ProfileUpdateForm(request.POST, request.FILES, instance=request.user.profile)
         
         if u_form.is_valid() and p_form.is_valid():
-            u_form.save()
-            p_form.save()
+            with transaction.atomic():
+                u_form.save()
+                p_form.save()
             messages.success(request, '✅ Tu perfil se actualizó correctamente.')
             return redirect('account-edit')
     else: